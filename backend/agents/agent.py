@@ -1,39 +1,27 @@
-import chromadb
-import boto3
 import json
 import os
+import sys
 from dotenv import load_dotenv
 
 # Get project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
 
 load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 
-# ChromaDB client
-chroma_client = chromadb.PersistentClient(path=os.path.join(PROJECT_ROOT, "chroma_db"))
-collection = chroma_client.get_collection(name="supabase_knowledge_base")
-
-# AWS Bedrock clients
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=os.getenv('AWS_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
+from backend.utils.embeddings import get_embedding
+from backend.utils.clients import get_bedrock, get_collection
+from backend.utils.chunking import merge_adjacent_chunks
+from backend.utils.retrieval import search_many
 
 
 def search_knowledge_base(query, n_results=3):
     """Search for relevant documents"""
-    # Generate query embedding
-    body = json.dumps({"inputText": query})
-    response = bedrock.invoke_model(
-        modelId='amazon.titan-embed-text-v1',
-        body=body
-    )
-    query_embedding = json.loads(response['body'].read())['embedding']
+    # Generate query embedding (cached for repeated questions)
+    query_embedding = get_embedding(query)
 
     # Search ChromaDB
-    results = collection.query(
+    results = get_collection().query(
         query_embeddings=[query_embedding],
         n_results=n_results
     )
@@ -41,25 +29,33 @@ def search_knowledge_base(query, n_results=3):
     return results
 
 
-def ask_agent(user_question):
-    """Main agent function"""
+def ask_agent(user_question, search_results=None):
+    """Main agent function
+
+    Args:
+        user_question: The question to answer
+        search_results: Results already fetched for the question (search_many), or None to search now
+    """
 
     print(f"\n{'='*80}")
     print(f"Question: {user_question}")
     print(f"{'='*80}\n")
 
     # Step 1: Search knowledge base
-    print("Searching knowledge base...")
-    search_results = search_knowledge_base(user_question, n_results=3)
+    if search_results is None:
+        print("Searching knowledge base...")
+        search_results = search_knowledge_base(user_question, n_results=3)
 
-    # Step 2: Build context from search results
+    # Step 2: Build context from the matching chunks
+    documents, metadatas = merge_adjacent_chunks(search_results['documents'][0], search_results['metadatas'][0])
     context = ""
-    for i, (doc, metadata) in enumerate(zip(search_results['documents'][0], search_results['metadatas'][0]), 1):
-        context += f"\n--- Document {i} ({metadata['source']}: {metadata['filename']}) ---\n"
-        context += doc[:1000]  # First 1000 chars of each doc
+    for i, (doc, metadata) in enumerate(zip(documents, metadatas), 1):
+        section = f" > {metadata['heading']}" if metadata.get('heading') else ""
+        context += f"\n--- Document {i} ({metadata['source']}: {metadata['filename']}{section}) ---\n"
+        context += doc
         context += "\n"
 
-    print(f"Found {len(search_results['documents'][0])} relevant documents\n")
+    print(f"Found {len(documents)} relevant passages\n")
 
     # Step 3: Ask Claude to generate answer using context
     print("Generating answer with Claude...\n")
@@ -95,7 +91,7 @@ Please answer the question based on the context above."""
         "system": system_prompt
     })
 
-    response = bedrock.invoke_model(
+    response = get_bedrock().invoke_model(
         modelId=os.getenv('BEDROCK_MODEL_ID'),
         body=body
     )
@@ -123,6 +119,9 @@ if __name__ == "__main__":
         "How do I create a new table in my database?",
     ]
 
-    for question in test_questions:
-        ask_agent(question)
+    # Retrieve context for every question in one batch
+    all_results = search_many(test_questions, n_results=3)
+
+    for question, search_results in zip(test_questions, all_results):
+        ask_agent(question, search_results)
         print("\n" + "="*80 + "\n")
@@ -0,0 +1,372 @@
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from dotenv import load_dotenv
+from backend.utils.kb_version import get_kb_version
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Check the shared evictions at most this often (seconds)
+EVICTION_CHECK_INTERVAL = 1.0
+
+
+class SharedEvictions:
+    """Thumbs-down evictions shared by the worker processes on one host
+
+    A SQLite file in WAL mode records which conversations were answered from
+    a cached answer (in whichever worker served them) and, when one of those
+    gets a thumbs down, an eviction row that every worker polls for. Feedback
+    on a conversation no cache entry answered writes nothing. Links and
+    evictions are purged once older than `retention` seconds (the cache TTL,
+    after which no entry that used them is left) or when the knowledge base
+    version changes, so the file stays small.
+
+    Args:
+        path: SQLite database file
+        retention: Seconds links and evictions are kept
+    """
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path, retention=3600):
+        self.path = path
+        self.retention = retention
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._last_seq = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connection(self):
+        # Reconnect after fork: a SQLite connection must not cross processes
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute("PRAGMA synchronous=NORMAL;")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS links (
+                    conversation_id TEXT PRIMARY KEY,
+                    kb_version TEXT NOT NULL,
+                    linked_at REAL NOT NULL
+                );
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS evictions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    kb_version TEXT NOT NULL,
+                    evicted_at REAL NOT NULL
+                );
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_links_linked_at ON links(linked_at);")
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    def link(self, conversation_id, kb_version):
+        """Record that `conversation_id` was answered from (or stored in) a cache entry"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO links (conversation_id, kb_version, linked_at) VALUES (?, ?, ?);",
+                (str(conversation_id), kb_version, now)
+            )
+            if now - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = now
+                cutoff = now - self.retention
+                db.execute("DELETE FROM links WHERE linked_at < ? OR kb_version != ?;", (cutoff, kb_version))
+                db.execute("DELETE FROM evictions WHERE evicted_at < ? OR kb_version != ?;", (cutoff, kb_version))
+            db.commit()
+
+    def evict(self, conversation_id, kb_version):
+        """Publish an eviction if `conversation_id` is linked to a cache entry; True if it was"""
+        with self._lock:
+            db = self._connection()
+            inserted = db.execute(
+                """INSERT INTO evictions (conversation_id, kb_version, evicted_at)
+                   SELECT conversation_id, kb_version, ? FROM links
+                   WHERE conversation_id = ? AND kb_version = ?;""",
+                (time.time(), str(conversation_id), kb_version)
+            ).rowcount
+            db.execute("DELETE FROM links WHERE conversation_id = ?;", (str(conversation_id),))
+            db.commit()
+        return inserted > 0
+
+    def poll(self):
+        """Conversation ids evicted since the last call (none on the first call)"""
+        with self._lock:
+            db = self._connection()
+            if self._last_seq is None:
+                # Evictions published before this worker started can't concern its entries
+                self._last_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM evictions;").fetchone()[0]
+                return []
+            rows = db.execute(
+                "SELECT seq, conversation_id FROM evictions WHERE seq > ? ORDER BY seq;", (self._last_seq,)
+            ).fetchall()
+        if rows:
+            self._last_seq = rows[-1][0]
+        return [conversation_id for _, conversation_id in rows]
+
+
+class AnswerCache:
+    """Semantic cache of generated answers keyed on the question embedding
+
+    A new question reuses a cached answer when its cosine distance to a
+    cached question is within `max_distance`. The whole cache is dropped when
+    the knowledge base version changes, and an entry is evicted as soon as
+    any conversation it answered gets a thumbs down.
+
+    Feedback may reach a different worker than the one holding the answer,
+    so with `evictions_path` the conversations an entry answered and their
+    evictions are also recorded in SharedEvictions, which every worker polls
+    (like the kb_version stamp) and applies to its own entries.
+
+    Args:
+        max_distance: Largest cosine distance (1 - similarity) that counts as a match
+        maxsize: Maximum cached answers; the least recently used is evicted
+        ttl: Seconds an answer may be served, or None for no expiry
+        evictions_path: SQLite file for shared evictions, or None to evict in this process only
+    """
+
+    def __init__(self, max_distance=0.05, maxsize=500, ttl=3600, evictions_path=None):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions_path = evictions_path
+        self.shared = SharedEvictions(evictions_path, retention=ttl or 86400) if evictions_path else None
+        self._evictions_checked_at = time.monotonic()
+        if self.shared is not None:
+            try:
+                self.shared.poll()  # start from the latest eviction
+            except sqlite3.Error as e:
+                print(f"Error reading answer cache evictions: {e}")
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # entry id -> entry dict
+        self._by_conversation = {}     # conversation id -> entry id
+        self._matrix = None            # unit-norm embeddings, row order == _ids
+        self._ids = []
+        self._next_id = 1
+        self._kb_version = get_kb_version()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, embedding):
+        """Return the cached entry closest to `embedding`, or None"""
+        vector = self._unit(embedding)
+        with self._lock:
+            self._check_kb_version()
+            self._apply_shared_evictions()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._ids = list(self._entries)
+                self._matrix = np.vstack([self._entries[i]['embedding'] for i in self._ids])
+
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            distance = 1.0 - float(similarities[best])
+            if distance > self.max_distance:
+                self.misses += 1
+                return None
+
+            entry = self._entries[self._ids[best]]
+            self._entries.move_to_end(entry['id'])
+            entry['hits'] += 1
+            entry['last_hit_at'] = time.time()
+            self.hits += 1
+            return entry
+
+    def store(self, question, embedding, answer, conversation_id):
+        """Cache an answer that was generated for `question`"""
+        with self._lock:
+            self._check_kb_version()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'id': entry_id,
+                'question': question,
+                'embedding': self._unit(embedding),
+                'answer': answer,
+                'hits': 0,
+                'created_at': time.time(),
+                'last_hit_at': None,
+                'conversation_ids': [str(conversation_id)]
+            }
+            self._by_conversation[str(conversation_id)] = entry_id
+            while len(self._entries) > self.maxsize:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+            self._matrix = None
+            kb_version = self._kb_version
+        self._share_link(conversation_id, kb_version)
+        return entry_id
+
+    def link(self, entry, conversation_id):
+        """Remember that `conversation_id` was answered from `entry`"""
+        with self._lock:
+            if entry['id'] not in self._entries:
+                return
+            entry['conversation_ids'].append(str(conversation_id))
+            self._by_conversation[str(conversation_id)] = entry['id']
+            kb_version = self._kb_version
+        self._share_link(conversation_id, kb_version)
+
+    def evict_conversation(self, conversation_id):
+        """Drop the cached answer behind `conversation_id` in every worker
+
+        Returns True if this process held the answer.
+        """
+        if self.shared is not None:
+            try:
+                self.shared.evict(conversation_id, get_kb_version())
+            except sqlite3.Error as e:
+                print(f"Error sharing answer cache eviction: {e}")
+        with self._lock:
+            return self._evict_local(conversation_id)
+
+    def _share_link(self, conversation_id, kb_version):
+        if self.shared is None:
+            return
+        try:
+            self.shared.link(conversation_id, kb_version)
+        except sqlite3.Error as e:
+            print(f"Error sharing answer cache link: {e}")
+
+    def _evict_local(self, conversation_id):
+        """Remove the entry that answered `conversation_id` (lock held)"""
+        entry_id = self._by_conversation.get(str(conversation_id))
+        if entry_id is None or entry_id not in self._entries:
+            return False
+        self._remove(entry_id)
+        self.invalidations += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_conversation.clear()
+            self._matrix = None
+
+    def entries(self, limit=10):
+        """Cached questions with their hit counts, most hit first"""
+        with self._lock:
+            ranked = sorted(self._entries.values(), key=lambda e: e['hits'], reverse=True)
+            return [
+                {
+                    'question': e['question'][:100] + '...' if len(e['question']) > 100 else e['question'],
+                    'hits': e['hits'],
+                    'conversations': len(e['conversation_ids']),
+                    'created_at': time.strftime('%Y-%m-%d %H:%M', time.localtime(e['created_at']))
+                }
+                for e in ranked[:limit]
+            ]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations,
+                'kb_version': self._kb_version
+            }
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for conversation_id in entry['conversation_ids']:
+            if self._by_conversation.get(conversation_id) == entry_id:
+                del self._by_conversation[conversation_id]
+        self._matrix = None
+
+    def _check_kb_version(self):
+        version = get_kb_version()
+        if version != self._kb_version:
+            self._entries.clear()
+            self._by_conversation.clear()
+            self._matrix = None
+            self._kb_version = version
+
+    def _apply_shared_evictions(self):
+        """Evict conversations flagged in other workers since the last check (lock held)"""
+        if self.shared is None or time.monotonic() - self._evictions_checked_at < EVICTION_CHECK_INTERVAL:
+            return
+        self._evictions_checked_at = time.monotonic()
+        try:
+            evicted = self.shared.poll()
+        except sqlite3.Error as e:
+            print(f"Error reading answer cache evictions: {e}")
+            return
+        for conversation_id in evicted:
+            self._evict_local(conversation_id)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        expired = [i for i, e in self._entries.items() if e['created_at'] < cutoff]
+        for entry_id in expired:
+            self._remove(entry_id)
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def answer_cache_enabled():
+    return os.getenv('ANSWER_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+
+def get_answer_cache():
+    """Process-wide answer cache configured from ANSWER_CACHE_* env vars"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    max_distance=float(os.getenv('ANSWER_CACHE_MAX_DISTANCE', '0.05')),
+                    maxsize=int(os.getenv('ANSWER_CACHE_SIZE', '500')),
+                    ttl=float(os.getenv('ANSWER_CACHE_TTL', '3600')) or None,
+                    evictions_path=os.getenv(
+                        'ANSWER_CACHE_EVICTIONS_PATH', os.path.join(PROJECT_ROOT, 'cache', 'answer_evictions.sqlite3')
+                    ) or None
+                )
+    return _cache
+
+
+def get_answer_cache_entries(limit=10):
+    """Per-entry hit counts for the dashboard"""
+    return _cache.entries(limit=limit) if _cache is not None else []
+
+
+def evict_answer_for_conversation(conversation_id):
+    """Called on negative feedback so a bad answer is never served again, by any worker"""
+    if not answer_cache_enabled():
+        return False
+    return get_answer_cache().evict_conversation(conversation_id)
+
+
+def get_answer_cache_stats():
+    """Answer cache counters, or None if the cache is unused"""
+    return _cache.stats() if _cache is not None else None
@@ -1,461 +1,341 @@
-import chromadb
-import boto3
 import json
 import os
 import uuid
 import time
 from dotenv import load_dotenv
-from backend.database.database import save_conversation
+from backend.database.database import queue_conversation
+from backend.utils.embeddings import get_embedding, embedding_degraded
+from backend.utils.clients import get_bedrock, get_collection
+from backend.utils.embedding_providers import collection_name
+from backend.utils.retrieval_cache import get_retrieval_cache, retrieval_cache_enabled
+from backend.utils.lexical import get_lexical_index, reciprocal_rank_fusion
+from backend.utils.chunking import merge_adjacent_chunks
+from backend.utils.metrics import TurnTimer, observe_turn
+from backend.utils.prompt_budget import (
+    PROMPT_HISTORY_SHARE,
+    PromptBudget,
+    count_tokens,
+    count_message_tokens,
+    MESSAGE_OVERHEAD,
+    fit_messages,
+    truncate_to_tokens
+)
+from backend.utils.prompt_cache import (
+    PROMPT_CACHE_PASSAGES,
+    prompt_cache_enabled,
+    passage_order_key,
+    system_blocks,
+    system_text
+)
+from backend.agents.answer_cache import get_answer_cache, answer_cache_enabled
+from backend.agents.sessions import get_session_store
+from backend.utils.intent import (
+    KEYWORDS,
+    scan_message,
+    get_conversation_context,
+    classify_intent
+)
 
 # Get project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 
-# ChromaDB client
-chroma_client = chromadb.PersistentClient(path=os.path.join(PROJECT_ROOT, "chroma_db"))
-collection = chroma_client.get_collection(name="supabase_knowledge_base")
+# Session-isolated conversation histories (bounded and expiring, see sessions.py)
+active_sessions = get_session_store()
 
-# AWS Bedrock client
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=os.getenv('AWS_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
+# Hybrid retrieval: candidates taken from each of vector and BM25 search before fusing
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '10'))
+RRF_K = int(os.getenv('RRF_K', '60'))
 
-# Session-isolated conversation histories
-active_sessions = {}
+# Messages sent to Claude at most: prior turns plus the current prompt
+MAX_HISTORY_MESSAGES = 6
+# Tokens kept of each previous question quoted in the prompt
+PREVIOUS_QUESTION_TOKENS = 50
+# Passages retrieved per question (PROMPT_CACHE_PASSAGES with prompt caching on)
+REFERENCE_PASSAGES = 3
 
+SYSTEM_PROMPT = """You are a helpful Supabase customer support agent.
 
-def search_knowledge_base(query, n_results=3):
-    """Search for relevant documents"""
-    body = json.dumps({"inputText": query})
-    response = bedrock.invoke_model(
-        modelId='amazon.titan-embed-text-v1',
-        body=body
-    )
-    query_embedding = json.loads(response['body'].read())['embedding']
+Rules:
+1. Answer questions directly and naturally - do NOT start with phrases like "According to the documentation" or "Based on the given data"
+2. Be conversational and friendly, as if you're an expert who knows Supabase well
+3. If you don't know something, say so honestly
+4. Keep answers concise (2-3 paragraphs max)
+5. Include code examples when helpful
+6. Remember previous messages in the conversation
+7. Never mention that you're reading from documentation - just provide the answer directly"""
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results
-    )
+REFERENCE_HEADER = "Reference info (use this to answer but don't mention it):\n"
 
-    return results
-
-
-def check_conversation_has_supabase_context(history):
-    """Check if recent conversation history contains Supabase-related content"""
-    supabase_keywords = [
-        'supabase', 'database', 'postgres', 'sql', 'table', 'column',
-        'auth', 'authentication', 'login', 'signup', 'user', 'password',
-        'storage', 'bucket', 'upload', 'download', 'file',
-        'api', 'rest', 'client', 'sdk', 'javascript', 'react', 'next',
-        'realtime', 'subscription', 'websocket', 'broadcast',
-        'rls', 'row level security', 'policy', 'permission',
-        'query', 'insert', 'update', 'delete', 'select',
-        'oauth', 'google', 'facebook', 'github', 'social login',
-        'error', 'cors', 'jwt', 'token', 'session', 'deploy', 'hosting'
-    ]
-
-    # Check last 6 messages for Supabase context
-    recent = history[-6:] if len(history) > 6 else history
-    for msg in recent:
-        content = msg.get('content', '').lower()
-        if any(keyword in content for keyword in supabase_keywords):
-            return True
-    return False
-
-
-def classify_intent(message, history=None):
-    """Classify user intent using priority-based pattern matching
-
-    Priority system (highest wins):
-    1. Has Supabase keywords → 'question'
-    2. Has entertainment/general knowledge → 'off_topic'
-    3. Has greeting (short message, no prior context) → 'greeting'
-    4. Has thanks/praise → 'thanks' or 'praise'
-    5. Default based on context
+VAGUE_EXACT = frozenset(['help', 'error', 'not working', "it's not working", 'broken', 'issue', 'problem'])
 
-    Args:
-        message: The user's message
-        history: Optional conversation history for context awareness
+# (keywords, topic) in priority order; the first match labels a past user message
+RECENT_TOPICS = [
+    (('oauth', 'google auth'), 'Google OAuth setup'),
+    (('facebook',), 'Facebook authentication'),
+    (('github',), 'GitHub authentication'),
+    (('table', 'create table'), 'database tables'),
+    (('storage', 'upload', 'file'), 'file storage'),
+    (('realtime',), 'realtime subscriptions'),
+    (('rls', 'row level'), 'Row Level Security'),
+    (('edge function',), 'Edge Functions'),
+]
+
+
+def search_knowledge_base(query, n_results=3, query_embedding=None, lexical_only=False):
+    """Search for relevant documents
+
+    When a lexical index has been built, vector and BM25 results are fused
+    by reciprocal rank. Pass `query_embedding` when the caller already
+    embedded the query; `lexical_only` skips the embedding and Chroma.
+    Vector results are served from the retrieval cache until the knowledge
+    base is re-ingested.
     """
-    message_lower = message.lower().strip()
-    history = history or []
-    words = message_lower.split()
+    lexical_index = get_lexical_index()
+    if lexical_only:
+        return lexical_index.search(query, n_results)
 
-    # Check if conversation already has Supabase context
-    has_prior_context = check_conversation_has_supabase_context(history)
-
-    # === Early exits for invalid input ===
-    if not message or len(message.strip()) < 2:
-        return 'unclear'
-
-    if not any(c.isalpha() for c in message):
-        return 'unclear'
-
-    # === Detect ALL pattern types (don't return yet) ===
-
-    # Supabase/tech keywords
-    supabase_keywords = [
-        'supabase', 'database', 'postgres', 'sql', 'table', 'column',
-        'auth', 'authentication', 'login', 'signup', 'password',
-        'storage', 'bucket', 'upload', 'download',
-        'api', 'rest', 'client', 'sdk', 'javascript', 'react', 'next',
-        'realtime', 'subscription', 'websocket', 'broadcast',
-        'rls', 'row level security', 'policy', 'permission',
-        'query', 'insert', 'update', 'delete', 'select',
-        'oauth', 'social login',
-        'error', '502', '500', '401', '403', '404', 'cors',
-        'jwt', 'token', 'session', 'deploy', 'hosting'
-    ]
-    has_supabase = any(keyword in message_lower for keyword in supabase_keywords)
-
-    # Entertainment/Personal
-    entertainment = [
-        'joke', 'funny', 'laugh', 'story', 'sing', 'song',
-        'movie', 'music', 'game', 'play', 'favorite color',
-        'hobby', 'dream', 'feel', 'emotion', 'tell me about yourself',
-        'tell me about urself', 'about yourself', 'about you',
-        'who are you', 'what are you', 'are you human', 'are you robot',
-        'how old are you', 'where are you from', 'who created you',
-        'who made you', 'who built you'
-    ]
-    has_entertainment = any(keyword in message_lower for keyword in entertainment)
-
-    # Personal questions that should ALWAYS be off_topic (checked before Supabase keywords)
-    personal_questions = [
-        'tell me about yourself', 'tell me about urself', 'about yourself',
-        'who are you', 'what are you', 'who made you', 'who built you',
-        'who created you', 'are you human', 'are you robot', 'are you ai',
-        'how old are you', 'where are you from'
-    ]
-    is_personal_question = any(pattern in message_lower for pattern in personal_questions)
-
-    # General Knowledge
-    general_knowledge = [
-        'weather', 'time', 'date', 'president', 'news', 'celebrity',
-        'cook', 'recipe', 'capital', 'mountain', 'ocean', 'country',
-        'sport', 'team', 'win', 'lose', 'score',
-        'stock', 'invest', 'bitcoin', 'crypto', 'exchange rate',
-        'lose weight', 'diet', 'exercise', 'health', 'doctor',
-        'meaning of life', 'philosophy', 'religion', 'politics'
-    ]
-    has_general_knowledge = any(keyword in message_lower for keyword in general_knowledge)
-
-    # Non-Supabase tech
-    non_supabase_tech = [
-        'mongodb', 'mysql', 'firebase', 'aws', 'azure', 'docker',
-        'kubernetes', 'redis', 'graphql', 'prisma', 'django'
-    ]
-    has_other_tech = any(tech in message_lower for tech in non_supabase_tech)
-
-    # Greetings
-    greetings = [
-        'hi', 'hello', 'hey', 'greetings', 'good morning',
-        'good afternoon', 'good evening', 'howdy', 'yo', 'sup'
-    ]
-    has_greeting = (
-        (len(words) > 0 and words[0] in greetings) or
-        message_lower in greetings
-    )
+    if query_embedding is None:
+        query_embedding = get_embedding(query)
 
-    # Thanks/Goodbye
-    thanks_patterns = [
-        'thank', 'thx', 'appreciate', "that's it", "thats it",
-        'perfect', 'got it', 'understood', 'bye', 'goodbye',
-        'see you', 'later', 'have a good', 'take care'
-    ]
-    has_thanks = any(pattern in message_lower for pattern in thanks_patterns)
-
-    # Praise/Compliments
-    praise_keywords = [
-        'amazing', 'awesome', 'great job', 'helpful', 'impressive',
-        'smart', 'clever', 'brilliant', 'inspiration', 'best',
-        'perfect answer', 'exactly what', 'you rock'
-    ]
-    has_praise = any(keyword in message_lower for keyword in praise_keywords)
-
-    # Follow-up patterns
-    followup_patterns = [
-        'yes', 'no', 'ok', 'okay', 'sure', 'right', 'correct',
-        'what about', 'how about', 'and', 'also', 'but', 'however',
-        'can you', 'could you', 'would you', 'please', 'show me',
-        'explain', 'tell me', 'what if', 'why', 'when', 'where',
-        'how do i', 'how can i', 'what is', 'is it', 'does it',
-        'another', 'more', 'else', 'instead', 'different', 'other'
-    ]
-    has_followup = any(pattern in message_lower for pattern in followup_patterns)
-
-    # === Apply priority rules ===
-
-    # Priority 0: Personal questions ALWAYS off_topic (before Supabase check)
-    if is_personal_question:
-        return 'off_topic'
-
-    # Priority 1: Supabase keywords ALWAYS win
-    if has_supabase:
-        return 'question'
-
-    # Priority 2: Off-topic (entertainment, general knowledge, other tech)
-    if has_entertainment or has_general_knowledge:
-        return 'off_topic'
-
-    if has_other_tech and not has_prior_context:
-        return 'off_topic'
-
-    # Priority 3: Greeting (only if short and no prior context)
-    if has_greeting and len(words) < 5 and not has_prior_context:
-        return 'greeting'
-
-    # Priority 4: Thanks/Praise (only if not asking a question)
-    if has_thanks and '?' not in message and 'how' not in message_lower:
-        return 'thanks'
-
-    if has_praise and '?' not in message:
-        return 'praise'
-
-    # Priority 5: Context-based defaults
-
-    # Follow-up in ongoing conversation
-    if has_prior_context and (has_followup or '?' in message):
-        return 'question'
-
-    # Has prior context, treat as continuation
-    if has_prior_context:
-        return 'question'
-
-    # Vague messages without context
-    vague_only = message_lower in [
-        'help', 'error', 'problem', 'issue', 'broken', 'not working',
-        'stuck', 'confused', 'urgent', 'please help'
-    ]
-    if vague_only:
-        return 'unclear'
-
-    # Question mark but no relevant context
-    if '?' in message:
-        return 'off_topic'
-
-    # Very short messages without context
-    if len(words) < 4:
-        return 'unclear'
-
-    # Default: unclear
-    return 'unclear'
+    vector_results = max(n_results, HYBRID_CANDIDATES) if lexical_index is not None else n_results
+    if retrieval_cache_enabled():
+        results = get_retrieval_cache().query(get_collection(), query_embedding, vector_results, collection_name())
+    else:
+        results = get_collection().query(query_embeddings=[query_embedding], n_results=vector_results)
+    if lexical_index is None:
+        return results
 
+    return reciprocal_rank_fusion(
+        [results, lexical_index.search(query, max(n_results, HYBRID_CANDIDATES))], n_results, k=RRF_K
+    )
 
-def chat(user_message, session_id=None):
-    """Chat with the agent
 
-    Args:
-        user_message: The user's message
-        session_id: UUID string for the session (generated if not provided)
+def _finish_turn(session_id, current_history, user_message, answer, intent, timer, first_token_time=None):
+    """Record the exchange in session history, queue it for logging and build the reply
 
-    Returns:
-        dict with 'answer' and 'conversation_id' keys
+    The conversation row is written by the background writer, so a slow or
+    unavailable database never delays the answer. `first_token_time` is set
+    for streamed answers and logged as time_to_first_token_ms.
     """
-    start_time = time.time()
+    if timer.estimated_input_tokens is not None:
+        timer.estimated_output_tokens = count_tokens(answer)
+    with timer.stage('persist'):
+        current_history.append({"role": "user", "content": user_message})
+        current_history.append({"role": "assistant", "content": answer})
+        active_sessions.save(session_id, current_history)
+    response_time_ms = timer.elapsed_ms()
+    time_to_first_token_ms = timer.elapsed_ms(first_token_time) if first_token_time else None
+
+    # The row can't include the time taken to queue itself; the metrics do
+    stage_timings = timer.stage_timings_ms()
+    with timer.stage('persist'):
+        conversation_id = queue_conversation(
+            session_id, user_message, answer, intent, response_time_ms,
+            time_to_first_token=time_to_first_token_ms,
+            stage_timings=stage_timings,
+            input_tokens=timer.input_tokens,
+            output_tokens=timer.output_tokens,
+            estimated_input_tokens=timer.estimated_input_tokens,
+            estimated_output_tokens=timer.estimated_output_tokens,
+            cache_read_tokens=timer.cache_read_tokens,
+            cache_write_tokens=timer.cache_write_tokens
+        )
+    observe_turn(timer, intent)
+    return {"answer": answer, "conversation_id": conversation_id}
 
-    # Generate session_id if not provided
-    if session_id is None:
-        session_id = str(uuid.uuid4())
 
-    # Get session-specific history
-    current_history = active_sessions.get(session_id, [])
+def _route_turn(user_message, session_id, timer):
+    """Classify the message and answer it without retrieval where possible
+
+    Handles canned answers and hallucination guards. Returns (result, None)
+    when the turn is already answered, or (None, turn) for questions that
+    need the knowledge base.
+    """
+    with timer.stage('classify'):
+        # Get session-specific history
+        current_history = active_sessions.get(session_id)
 
-    # Classify intent with conversation context
-    intent = classify_intent(user_message, current_history)
+        # Classify intent with conversation context
+        intent = classify_intent(user_message, current_history)
 
     # Handle non-question intents
     if intent == 'greeting':
         answer = "Hello! I'm your Supabase support agent. How can I help you today?"
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, intent, timer), None
 
     elif intent == 'thanks':
         answer = "You're welcome! Feel free to ask if you have any other questions about Supabase."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, intent, timer), None
 
     elif intent == 'praise':
         answer = "Thank you for the kind words! I'm here to help with any Supabase questions you have. What would you like to know?"
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, intent, timer), None
 
     elif intent == 'unclear':
         answer = "I'm not sure I understand. Could you please ask a more specific question about Supabase? For example, you can ask about authentication, database, storage, API, or troubleshooting."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, intent, timer), None
 
     elif intent == 'off_topic':
         answer = "I'm a Supabase support agent and can only help with questions about Supabase (database, authentication, storage, API, realtime, etc.). Do you have any questions about Supabase?"
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, intent, timer), None
 
     # Hallucination prevention - detect questions we can't answer reliably
-    message_lower = user_message.lower()
+    with timer.stage('classify'):
+        message_lower = user_message.lower()
+        hits = scan_message(user_message)
+        keyword_context = get_conversation_context(current_history)
 
     # Check for pricing questions
-    pricing_keywords = ['cost', 'price', 'pricing', 'how much', 'expensive', 'pay', 'subscription', 'plan']
-    if any(keyword in message_lower for keyword in pricing_keywords):
+    if hits.has('pricing'):
         answer = "I don't have pricing information. Please check https://supabase.com/pricing for current plans and costs."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, 'pricing', response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, 'pricing', timer), None
 
     # Check for unsupported deployment platforms (without 'supabase' context)
-    unsupported_platforms = ['azure', 'heroku', 'digital ocean', 'digitalocean', 'render']
     has_unsupported = None
-    for platform in unsupported_platforms:
-        if platform in message_lower and 'supabase' not in message_lower:
-            has_unsupported = platform
-            break
+    if 'supabase' not in message_lower:
+        for platform in KEYWORDS['unsupported_platform']:
+            if platform in hits.keywords:
+                has_unsupported = platform
+                break
     if has_unsupported:
         answer = f"I don't have deployment information for {has_unsupported}. My knowledge covers Supabase-specific deployment and configuration."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, 'unsupported', response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, 'unsupported', timer), None
 
     # Check for roadmap/future feature questions
-    roadmap_keywords = ['when will', 'roadmap', 'future', 'upcoming', 'release', 'next version']
-    if any(keyword in message_lower for keyword in roadmap_keywords):
+    if hits.has('roadmap'):
         answer = "I don't have roadmap information. Please check the official Supabase GitHub (https://github.com/supabase/supabase) or blog (https://supabase.com/blog) for announcements."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, 'roadmap', response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, 'roadmap', timer), None
 
     # Vague question detection - ask for clarification
-    vague_exact = ['help', 'error', 'not working', "it's not working", 'broken', 'issue', 'problem']
-    is_vague_exact = message_lower.strip() in vague_exact
+    is_vague_exact = message_lower.strip() in VAGUE_EXACT
 
     # Check for short messages without Supabase keywords
-    supabase_check = ['supabase', 'database', 'auth', 'storage', 'api', 'table', 'query', 'rls', 'realtime']
-    has_supabase_keyword = any(kw in message_lower for kw in supabase_check)
+    has_supabase_keyword = hits.has('supabase_check')
     words = message_lower.split()
     is_short_vague = len(words) < 3 and not has_supabase_keyword
 
     # Check for strong prior context (last 2 messages)
-    recent_context = current_history[-2:] if len(current_history) >= 2 else current_history
-    has_strong_context = any(
-        any(kw in msg.get('content', '').lower() for kw in supabase_check)
-        for msg in recent_context
-    )
+    has_strong_context = keyword_context.any_recent('supabase_check', 2)
 
     if (is_vague_exact or is_short_vague) and not has_strong_context:
         answer = "I'd be happy to help! Can you tell me more specifically what you're trying to do or what error you're seeing? For example, are you having issues with authentication, database, storage, or something else?"
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, 'vague', response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+        return _finish_turn(session_id, current_history, user_message, answer, 'vague', timer), None
 
-    # For real questions, search knowledge base
-    try:
-        search_results = search_knowledge_base(user_message, n_results=2)
-    except Exception as e:
-        error_type = type(e).__name__
-        if "InvalidSignatureException" in str(e) or "credentials" in str(e).lower():
-            answer = "I'm having trouble connecting to my knowledge base (AWS credentials issue). Please check the server configuration."
-        elif "ResourceNotFoundException" in str(e):
-            answer = "The embedding model is not available. Please verify AWS Bedrock model access."
-        elif "ThrottlingException" in str(e):
-            answer = "I'm receiving too many requests right now. Please wait a moment and try again."
-        else:
-            answer = f"I couldn't search my knowledge base: {error_type}. Please try again later."
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
+    # Fresh questions (user hasn't asked about Supabase yet) can reuse an answer to a near-identical question
+    prior_user_hits = keyword_context.recent(role='user')[-6:]
+    use_answer_cache = answer_cache_enabled() and not any(
+        h.has('context') for h in prior_user_hits
+    )
 
-    # Build context
-    context = ""
-    if search_results['documents'] and search_results['documents'][0]:
-        for doc, metadata in zip(search_results['documents'][0], search_results['metadatas'][0]):
-            context += f"\n[{metadata['source']}]: {doc[:800]}\n"
+    return None, {
+        'session_id': session_id,
+        'history': current_history,
+        'user_message': user_message,
+        'intent': intent,
+        'timer': timer,
+        'keyword_context': keyword_context,
+        'use_answer_cache': use_answer_cache
+    }
+
+
+def _retrieval_error_message(e):
+    """User-facing message for a failed embedding or knowledge base search"""
+    error_type = type(e).__name__
+    if "InvalidSignatureException" in str(e) or "credentials" in str(e).lower():
+        return "I'm having trouble connecting to my knowledge base (AWS credentials issue). Please check the server configuration."
+    elif "ResourceNotFoundException" in str(e):
+        return "The embedding model is not available. Please verify AWS Bedrock model access."
+    elif "ThrottlingException" in str(e):
+        return "I'm receiving too many requests right now. Please wait a moment and try again."
     else:
-        context = "\nNo relevant documentation found.\n"
+        return f"I couldn't search my knowledge base: {error_type}. Please try again later."
 
-    # Build conversation for Claude
-    system_prompt = """You are a helpful Supabase customer support agent.
 
-Rules:
-1. Answer questions directly and naturally - do NOT start with phrases like "According to the documentation" or "Based on the given data"
-2. Be conversational and friendly, as if you're an expert who knows Supabase well
-3. If you don't know something, say so honestly
-4. Keep answers concise (2-3 paragraphs max)
-5. Include code examples when helpful
-6. Remember previous messages in the conversation
-7. Never mention that you're reading from documentation - just provide the answer directly"""
+def _reference_passages():
+    """Passages to retrieve: more with prompt caching, so the cached prefix reaches the model's minimum"""
+    return PROMPT_CACHE_PASSAGES if prompt_cache_enabled() else REFERENCE_PASSAGES
+
+
+def _retrieve(turn, query_embedding):
+    """Serve a cached answer or search the knowledge base for the routed turn
+
+    Returns (result, None) on an answer cache hit, otherwise (None, search_results).
+    """
+    turn['query_embedding'] = query_embedding
+
+    if turn['use_answer_cache']:
+        with turn['timer'].stage('vector_search'):
+            cached = get_answer_cache().lookup(query_embedding)
+        if cached:
+            result = _finish_turn(
+                turn['session_id'], turn['history'], turn['user_message'], cached['answer'],
+                turn['intent'], turn['timer']
+            )
+            get_answer_cache().link(cached, result['conversation_id'])
+            return result, None
+
+    with turn['timer'].stage('vector_search'):
+        search_results = search_knowledge_base(
+            turn['user_message'], n_results=_reference_passages(), query_embedding=query_embedding
+        )
+    return None, search_results
+
+
+def _retrieve_lexical(turn):
+    """Search the lexical index alone, without an embedding
+
+    The answer cache is keyed by embeddings, so it is skipped for this turn.
+    """
+    turn['use_answer_cache'] = False
+    turn['query_embedding'] = None
+    with turn['timer'].stage('vector_search'):
+        return search_knowledge_base(turn['user_message'], n_results=_reference_passages(), lexical_only=True)
+
+
+def _build_prompt(turn, search_results):
+    """Append the prompt with reference context to the turn's history
+
+    The request is assembled within PROMPT_TOKEN_BUDGET: the system prompt,
+    topic summary and questions always go in, then retrieved passages in
+    rank order (cut at sentence or code-fence boundaries), and prior turns
+    fill what is left. With PROMPT_CACHE=1, and a prefix long enough to
+    cache, the passages move into the system prompt as cacheable blocks
+    (see prompt_cache.py). Returns the
+    turn with everything the Claude call and _complete_turn need.
+    """
+    user_message = turn['user_message']
+    current_history = turn['history']
+    keyword_context = turn['keyword_context']
+    budget = PromptBudget()
+
+    # Build conversation for Claude
+    system_prompt = budget.require('system', SYSTEM_PROMPT)
 
     # Extract recent conversation topics for better context retention
     recent_topics = []
-    for msg in current_history[-8:]:
-        if msg.get('role') == 'user':
-            content = msg.get('content', '').lower()
-            if 'oauth' in content or 'google auth' in content:
-                recent_topics.append('Google OAuth setup')
-            elif 'facebook' in content and 'auth' in content:
-                recent_topics.append('Facebook authentication')
-            elif 'github' in content and 'auth' in content:
-                recent_topics.append('GitHub authentication')
-            elif 'table' in content or 'create table' in content:
-                recent_topics.append('database tables')
-            elif 'storage' in content or 'upload' in content or 'file' in content:
-                recent_topics.append('file storage')
-            elif 'realtime' in content:
-                recent_topics.append('realtime subscriptions')
-            elif 'rls' in content or 'row level' in content:
-                recent_topics.append('Row Level Security')
-            elif 'edge function' in content:
-                recent_topics.append('Edge Functions')
+    for topic_hits in keyword_context.recent(8, role='user'):
+        for keywords, topic in RECENT_TOPICS:
+            if any(k in topic_hits.keywords for k in keywords):
+                # Facebook/GitHub only count as topics when asked about in an auth context
+                if topic in ('Facebook authentication', 'GitHub authentication') and 'auth' not in topic_hits.keywords:
+                    continue
+                recent_topics.append(topic)
+                break
 
     # Build topic context summary
     topic_summary = f"Recent topics discussed: {', '.join(set(recent_topics))}\n\n" if recent_topics else ""
 
     # Extract recent user questions for context awareness
     recent_questions = []
-    for msg in current_history[-6:]:
+    for msg in current_history[-MAX_HISTORY_MESSAGES:]:
         if msg['role'] == 'user':
             # Get the actual question (not the prompt with documentation)
             content = msg['content']
             # Skip if it contains documentation context (from previous turns)
             if 'Relevant documentation:' not in content:
-                recent_questions.append(content[:200])  # Limit length
+                recent_questions.append(truncate_to_tokens(content, PREVIOUS_QUESTION_TOKENS))
 
     # Build conversation context string
     conversation_context = ""
@@ -467,83 +347,272 @@ Rules:
     else:
         conversation_context = f"Current question: {user_message}\n"
 
-    # Add current message with context
-    user_prompt = f"""{topic_summary}{conversation_context}
----
-Reference info (use this to answer but don't mention it):
-{context}"""
+    # The question with its framing always goes in; reference passages and prior turns share the rest
+    prompt_header = f"{topic_summary}{conversation_context}\n---\n{REFERENCE_HEADER}"
+    budget.require('question', prompt_header)
+    budget.charge('question', MESSAGE_OVERHEAD)
+
+    # Hold back part of what is left for prior turns, as much as they need
+    prior_messages = current_history[-(MAX_HISTORY_MESSAGES - 1):]
+    history_reserve = min(count_message_tokens(prior_messages), int(budget.remaining * PROMPT_HISTORY_SHARE))
+
+    # Build context from the best-matching chunks (overlapping chunks of one file are stitched together)
+    passages = []
+    if search_results['documents'] and search_results['documents'][0]:
+        documents, metadatas = merge_adjacent_chunks(search_results['documents'][0], search_results['metadatas'][0])
+        for doc, metadata in zip(documents, metadatas):
+            section = f" > {metadata['heading']}" if metadata.get('heading') else ""
+            label = f"\n[{metadata['source']}{section}]: "
+            doc = truncate_to_tokens(doc, budget.remaining - history_reserve - count_tokens(label))
+            if not doc:
+                break
+            passages.append((metadata, budget.require('passages', f"{label}{doc}\n")))
+    if not passages:
+        passages.append(({}, budget.require('passages', "\nNo relevant documentation found.\n")))
+
+    blocks = None
+    if prompt_cache_enabled():
+        # Rules and passages lead in a fixed order, so questions on the same topic share a cached prefix
+        ordered = sorted(passages, key=lambda passage: passage_order_key(passage[0]))
+        blocks = system_blocks([f"{system_prompt}\n\n---\n{REFERENCE_HEADER}"] + [text for _, text in ordered])
+    if blocks and any('cache_control' in block for block in blocks):
+        system_prompt = blocks
+        user_prompt = f"{topic_summary}{conversation_context}"
+    else:
+        # Too short to cache: keep the passages in rank order with the question
+        user_prompt = prompt_header + ''.join(text for _, text in passages)
+
+    # Prior turns, newest first, in whatever budget is left
+    messages = fit_messages(prior_messages, budget.remaining) + [{"role": "user", "content": user_prompt}]
+    budget.charge('prior_turns', count_message_tokens(messages[:-1]))
 
-    current_history.append({
-        "role": "user",
-        "content": user_prompt
+    current_history.append(messages[-1])
+
+    turn['system_prompt'] = system_prompt
+    turn['messages'] = messages
+    turn['timer'].estimated_input_tokens = count_tokens(system_text(system_prompt)) + count_message_tokens(messages)
+    return turn
+
+
+def _prepare_turn(user_message, session_id, timer):
+    """Everything in a turn up to the Claude call
+
+    Handles canned answers, hallucination guards, the answer cache and
+    retrieval. Returns (result, None) when the turn is already answered, or
+    (None, turn) where `turn` carries the history (ending with the prompt
+    that includes reference context) and what is needed to finish the turn.
+    """
+    result, turn = _route_turn(user_message, session_id, timer)
+    if result is not None:
+        return result, None
+
+    # For real questions, search knowledge base
+    try:
+        if embedding_degraded() and get_lexical_index() is not None:
+            # Don't wait on an embedding service that has been slow or throttled
+            search_results = _retrieve_lexical(turn)
+        else:
+            with timer.stage('embed'):
+                query_embedding = get_embedding(user_message)
+            result, search_results = _retrieve(turn, query_embedding)
+            if result is not None:
+                return result, None
+    except Exception as e:
+        if get_lexical_index() is None:
+            answer = _retrieval_error_message(e)
+            return _finish_turn(session_id, turn['history'], user_message, answer, turn['intent'], timer), None
+        print(f"Vector search failed, answering from lexical search: {e}")
+        search_results = _retrieve_lexical(turn)
+
+    with timer.stage('prompt_build'):
+        return None, _build_prompt(turn, search_results)
+
+
+def _claude_request_body(turn):
+    """JSON body for the Claude call from the prepared turn"""
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 800,
+        "temperature": 0.3,
+        "top_p": 0.9,
+        "system": turn['system_prompt'],
+        "messages": turn['messages']
     })
 
+
+def _claude_error_message(e):
+    """User-facing message for a failed Claude call"""
+    error_type = type(e).__name__
+    if "InvalidSignatureException" in str(e) or "credentials" in str(e).lower():
+        return "I'm having trouble connecting to Claude (AWS credentials issue). Please check the server configuration."
+    elif "AccessDeniedException" in str(e):
+        return "Access denied to Claude model. Please verify Bedrock model access permissions."
+    elif "ResourceNotFoundException" in str(e):
+        return "The Claude model is not available. Please check the BEDROCK_MODEL_ID in your .env file."
+    elif "ThrottlingException" in str(e):
+        return "I'm receiving too many requests right now. Please wait a moment and try again."
+    elif "ModelTimeoutException" in str(e):
+        return "The request timed out. Please try asking a shorter question."
+    elif "ValidationException" in str(e):
+        return f"Invalid request: {str(e)[:100]}. Please try rephrasing your question."
+    else:
+        return f"I encountered an error generating a response ({error_type}). Please try again."
+
+
+def _complete_turn(turn, answer, first_token_time=None):
+    """Commit a generated answer to history, the write queue and the answer cache"""
+    # Drop the prompt with reference context; history keeps the plain question to save tokens
+    turn['history'].pop()
+
+    result = _finish_turn(
+        turn['session_id'], turn['history'], turn['user_message'], answer,
+        turn['intent'], turn['timer'], first_token_time
+    )
+    if turn['use_answer_cache']:
+        get_answer_cache().store(turn['user_message'], turn['query_embedding'], answer, result['conversation_id'])
+    return result
+
+
+def _record_stream_usage(timer, payload):
+    """Token counts from message_start (input) and message_delta (output) stream events"""
+    if payload.get('type') == 'message_start':
+        timer.record_usage(payload.get('message', {}).get('usage'))
+    elif payload.get('type') == 'message_delta':
+        timer.record_usage(payload.get('usage'))
+
+
+def _fail_turn(turn, answer, first_token_time=None):
+    """Record a turn whose Claude call failed, answering with `answer`"""
+    # Remove the failed message from history
+    turn['history'].pop()
+    return _finish_turn(
+        turn['session_id'], turn['history'], turn['user_message'], answer,
+        turn['intent'], turn['timer'], first_token_time
+    )
+
+
+def chat(user_message, session_id=None):
+    """Chat with the agent
+
+    Args:
+        user_message: The user's message
+        session_id: UUID string for the session (generated if not provided)
+
+    Returns:
+        dict with 'answer' and 'conversation_id' keys; conversation_id is the
+        conversation_uuid the row will be stored under
+    """
+    timer = TurnTimer()
+
+    # Generate session_id if not provided
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+
+    result, turn = _prepare_turn(user_message, session_id, timer)
+    if result is not None:
+        return result
+
     # Call Claude
     try:
-        # Prepare messages, ensuring first message is from user
-        messages_to_send = current_history[-6:]
-        if messages_to_send and messages_to_send[0]['role'] == 'assistant':
-            messages_to_send = messages_to_send[1:]  # Remove leading assistant message
-
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 800,
-            "temperature": 0.3,
-            "top_p": 0.9,
-            "system": system_prompt,
-            "messages": messages_to_send
-        })
-
-        response = bedrock.invoke_model(
-            modelId=os.getenv('BEDROCK_MODEL_ID'),
-            body=body
-        )
-
-        response_body = json.loads(response['body'].read())
+        with timer.stage('prompt_build'):
+            body = _claude_request_body(turn)
+        with timer.stage('llm'):
+            response = get_bedrock().invoke_model(
+                modelId=os.getenv('BEDROCK_MODEL_ID'),
+                body=body
+            )
+
+            response_body = json.loads(response['body'].read())
         answer = response_body['content'][0]['text']
+        timer.record_usage(response_body.get('usage'))
 
     except Exception as e:
-        error_type = type(e).__name__
-        # Remove the failed message from history
-        current_history.pop()
-
-        if "InvalidSignatureException" in str(e) or "credentials" in str(e).lower():
-            answer = "I'm having trouble connecting to Claude (AWS credentials issue). Please check the server configuration."
-        elif "AccessDeniedException" in str(e):
-            answer = "Access denied to Claude model. Please verify Bedrock model access permissions."
-        elif "ResourceNotFoundException" in str(e):
-            answer = "The Claude model is not available. Please check the BEDROCK_MODEL_ID in your .env file."
-        elif "ThrottlingException" in str(e):
-            answer = "I'm receiving too many requests right now. Please wait a moment and try again."
-        elif "ModelTimeoutException" in str(e):
-            answer = "The request timed out. Please try asking a shorter question."
-        elif "ValidationException" in str(e):
-            answer = f"Invalid request: {str(e)[:100]}. Please try rephrasing your question."
-        else:
-            answer = f"I encountered an error generating a response ({error_type}). Please try again."
+        return _fail_turn(turn, _claude_error_message(e))
 
-        current_history.append({"role": "user", "content": user_message})
-        current_history.append({"role": "assistant", "content": answer})
-        active_sessions[session_id] = current_history
-        response_time_ms = int((time.time() - start_time) * 1000)
-        conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
-        return {"answer": answer, "conversation_id": conversation_id}
-
-    # Add to history (without the context to save tokens)
-    current_history[-1] = {"role": "user", "content": user_message}
-    current_history.append({
-        "role": "assistant",
-        "content": answer
-    })
+    return _complete_turn(turn, answer)
 
-    # Save session history
-    active_sessions[session_id] = current_history
 
-    # Save to database
-    response_time_ms = int((time.time() - start_time) * 1000)
-    conversation_id = save_conversation(session_id, user_message, answer, intent, response_time_ms)
+def chat_stream(user_message, session_id=None):
+    """Chat with the agent, yielding the answer as Claude generates it
 
-    return {"answer": answer, "conversation_id": conversation_id}
+    Yields dicts with a 'type' key:
+        token: {'text'} - the next piece of the answer
+        error: {'message'} - generation failed after some text was already sent
+        done:  {'answer', 'conversation_id', 'session_id', 'time_to_first_token_ms'}
+
+    Session history and the conversation row are only committed once the
+    stream has finished. If the consumer stops early (client disconnect),
+    the turn is discarded.
+    """
+    timer = TurnTimer()
+
+    # Generate session_id if not provided
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+
+    result, turn = _prepare_turn(user_message, session_id, timer)
+    if result is not None:
+        yield {"type": "token", "text": result['answer']}
+        yield {
+            "type": "done",
+            "answer": result['answer'],
+            "conversation_id": result['conversation_id'],
+            "session_id": session_id,
+            "time_to_first_token_ms": None
+        }
+        return
+
+    parts = []
+    first_token_time = None
+    try:
+        with timer.stage('prompt_build'):
+            body = _claude_request_body(turn)
+        # Includes time the consumer takes to send each token on
+        with timer.stage('llm'):
+            response = get_bedrock().invoke_model_with_response_stream(
+                modelId=os.getenv('BEDROCK_MODEL_ID'),
+                body=body
+            )
+
+            for event in response['body']:
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                payload = json.loads(chunk['bytes'])
+                if payload.get('type') == 'content_block_delta' and payload['delta'].get('type') == 'text_delta':
+                    text = payload['delta']['text']
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                else:
+                    _record_stream_usage(timer, payload)
+
+    except GeneratorExit:
+        # Client went away mid-stream; leave the session as it was
+        turn['history'].pop()
+        raise
+
+    except Exception as e:
+        answer = _claude_error_message(e)
+        if parts:
+            # Keep what the user already saw and flag the interruption
+            yield {"type": "error", "message": answer}
+            answer = ''.join(parts)
+        else:
+            yield {"type": "token", "text": answer}
+        result = _fail_turn(turn, answer, first_token_time)
+
+    else:
+        result = _complete_turn(turn, ''.join(parts), first_token_time)
+
+    yield {
+        "type": "done",
+        "answer": result['answer'],
+        "conversation_id": result['conversation_id'],
+        "session_id": session_id,
+        "time_to_first_token_ms": timer.elapsed_ms(first_token_time) if first_token_time else None
+    }
 
 
 if __name__ == "__main__":
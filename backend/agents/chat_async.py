@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import asyncio
+from backend.utils.embeddings import get_embedding_async, embedding_degraded
+from backend.utils.lexical import get_lexical_index
+from backend.utils.bedrock_async import get_async_bedrock
+from backend.utils.metrics import TurnTimer
+from backend.agents.chat import (
+    _route_turn,
+    _retrieve,
+    _retrieve_lexical,
+    _build_prompt,
+    _finish_turn,
+    _complete_turn,
+    _fail_turn,
+    _claude_request_body,
+    _claude_error_message,
+    _retrieval_error_message,
+    _record_stream_usage
+)
+
+# The Bedrock calls are awaited on the event loop. Local work that may block
+# (session store, answer cache, Chroma query, queueing the conversation row)
+# runs in the default thread pool; each of those steps takes milliseconds.
+
+
+async def _prepare_turn_async(user_message, session_id, timer):
+    """Async counterpart of chat._prepare_turn"""
+    result, turn = await asyncio.to_thread(_route_turn, user_message, session_id, timer)
+    if result is not None:
+        return result, None
+
+    try:
+        if embedding_degraded() and get_lexical_index() is not None:
+            # Don't wait on an embedding service that has been slow or throttled
+            search_results = await asyncio.to_thread(_retrieve_lexical, turn)
+        else:
+            with timer.stage('embed'):
+                query_embedding = await get_embedding_async(user_message, get_async_bedrock())
+            result, search_results = await asyncio.to_thread(_retrieve, turn, query_embedding)
+            if result is not None:
+                return result, None
+    except Exception as e:
+        if get_lexical_index() is None:
+            answer = _retrieval_error_message(e)
+            result = await asyncio.to_thread(
+                _finish_turn, session_id, turn['history'], user_message, answer, turn['intent'], timer
+            )
+            return result, None
+        print(f"Vector search failed, answering from lexical search: {e}")
+        search_results = await asyncio.to_thread(_retrieve_lexical, turn)
+
+    with timer.stage('prompt_build'):
+        return None, _build_prompt(turn, search_results)
+
+
+async def chat_async(user_message, session_id=None):
+    """Chat with the agent without blocking the event loop
+
+    Same contract as chat.chat(): returns a dict with 'answer' and
+    'conversation_id' keys.
+    """
+    timer = TurnTimer()
+
+    # Generate session_id if not provided
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+
+    result, turn = await _prepare_turn_async(user_message, session_id, timer)
+    if result is not None:
+        return result
+
+    try:
+        with timer.stage('prompt_build'):
+            body = _claude_request_body(turn)
+        with timer.stage('llm'):
+            response_body = await get_async_bedrock().invoke_model(
+                modelId=os.getenv('BEDROCK_MODEL_ID'),
+                body=body
+            )
+        answer = response_body['content'][0]['text']
+        timer.record_usage(response_body.get('usage'))
+    except asyncio.CancelledError:
+        turn['history'].pop()
+        raise
+    except Exception as e:
+        return await asyncio.to_thread(_fail_turn, turn, _claude_error_message(e))
+
+    return await asyncio.to_thread(_complete_turn, turn, answer)
+
+
+async def chat_stream_async(user_message, session_id=None):
+    """Async generator with the same events as chat.chat_stream()
+
+    If the consumer stops early (client disconnect), the turn is discarded.
+    """
+    timer = TurnTimer()
+
+    # Generate session_id if not provided
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+
+    result, turn = await _prepare_turn_async(user_message, session_id, timer)
+    if result is not None:
+        yield {"type": "token", "text": result['answer']}
+        yield {
+            "type": "done",
+            "answer": result['answer'],
+            "conversation_id": result['conversation_id'],
+            "session_id": session_id,
+            "time_to_first_token_ms": None
+        }
+        return
+
+    parts = []
+    first_token_time = None
+    try:
+        with timer.stage('prompt_build'):
+            body = _claude_request_body(turn)
+        # Includes time the consumer takes to send each token on
+        with timer.stage('llm'):
+            stream = get_async_bedrock().invoke_model_stream(
+                modelId=os.getenv('BEDROCK_MODEL_ID'),
+                body=body
+            )
+            async for payload in stream:
+                if payload.get('type') == 'content_block_delta' and payload['delta'].get('type') == 'text_delta':
+                    text = payload['delta']['text']
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                else:
+                    _record_stream_usage(timer, payload)
+
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client went away mid-stream; leave the session as it was
+        turn['history'].pop()
+        raise
+
+    except Exception as e:
+        answer = _claude_error_message(e)
+        if parts:
+            # Keep what the user already saw and flag the interruption
+            yield {"type": "error", "message": answer}
+            answer = ''.join(parts)
+        else:
+            yield {"type": "token", "text": answer}
+        result = await asyncio.to_thread(_fail_turn, turn, answer, first_token_time)
+
+    else:
+        result = await asyncio.to_thread(_complete_turn, turn, ''.join(parts), first_token_time)
+
+    yield {
+        "type": "done",
+        "answer": result['answer'],
+        "conversation_id": result['conversation_id'],
+        "session_id": session_id,
+        "time_to_first_token_ms": timer.elapsed_ms(first_token_time) if first_token_time else None
+    }
@@ -0,0 +1,542 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from backend.utils.cache import LRUCache
+from backend.utils.intent import forget_conversation_context
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# chat() reads at most the last 8 messages, and the answer cache check looks at
+# the last 6 user messages (12 messages of alternating turns), so 12 keeps behaviour unchanged
+DEFAULT_MAX_MESSAGES = 12
+
+
+class SessionConflict(Exception):
+    """Raised when another worker saved the session since the version being replaced"""
+
+
+def _message_bytes(message):
+    """Approximate memory held by one history message"""
+    return sys.getsizeof(message) + sum(sys.getsizeof(v) for v in message.values())
+
+
+class MemorySessionStore:
+    """Bounded in-process store of conversation histories
+
+    Sessions are kept in least-recently-used order. A session idle for
+    longer than `idle_ttl` expires, the least recently used session is
+    evicted once there are more than `max_sessions`, and each history is
+    trimmed to its last `max_messages` messages when saved.
+
+    Args:
+        max_sessions: Maximum sessions held; 0 for no cap
+        idle_ttl: Seconds without a turn before a session expires; 0 for no expiry
+        max_messages: Messages of history kept per session; 0 for no cap
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=3600, max_messages=DEFAULT_MAX_MESSAGES):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session id -> (history, last_seen, approx bytes)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.trimmed_messages = 0
+
+    def get(self, session_id):
+        """History list for `session_id` (a new empty list for unknown or expired sessions)"""
+        with self._lock:
+            expired = self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._sessions[session_id] = (entry[0], time.monotonic(), entry[2])
+                self._sessions.move_to_end(session_id)
+        for old_history in expired:
+            forget_conversation_context(old_history)
+        return entry[0] if entry is not None else []
+
+    def save(self, session_id, history):
+        """Store `history` for `session_id`, trimming it in place to the retained window"""
+        if self.max_messages and len(history) > self.max_messages:
+            self.trimmed_messages += len(history) - self.max_messages
+            del history[:-self.max_messages]
+        size = sum(_message_bytes(m) for m in history)
+
+        evicted = []
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old[2]
+                if old[0] is not history:
+                    evicted.append(old[0])
+            self._sessions[session_id] = (history, time.monotonic(), size)
+            self._bytes += size
+
+            evicted.extend(self._expire())
+            while self.max_sessions and len(self._sessions) > self.max_sessions:
+                _, (old_history, _, old_size) = self._sessions.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_history)
+
+        for old_history in evicted:
+            forget_conversation_context(old_history)
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+        if entry is not None:
+            forget_conversation_context(entry[0])
+        return entry is not None
+
+    def clear(self):
+        with self._lock:
+            histories = [entry[0] for entry in self._sessions.values()]
+            self._sessions.clear()
+            self._bytes = 0
+        for history in histories:
+            forget_conversation_context(history)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry is not None and not self._is_expired(entry, time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            expired = self._expire()
+            messages = sum(len(entry[0]) for entry in self._sessions.values())
+            lookups = self.hits + self.misses
+            stats = {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'messages': messages,
+                'approx_bytes': self._bytes,
+                'max_sessions': self.max_sessions,
+                'idle_ttl': self.idle_ttl,
+                'max_messages': self.max_messages,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'trimmed_messages': self.trimmed_messages
+            }
+        for old_history in expired:
+            forget_conversation_context(old_history)
+        return stats
+
+    def _is_expired(self, entry, now):
+        return bool(self.idle_ttl) and now - entry[1] > self.idle_ttl
+
+    def _expire(self):
+        """Drop idle sessions; they sit at the front because order is last use"""
+        expired = []
+        if not self.idle_ttl:
+            return expired
+        now = time.monotonic()
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if not self._is_expired(entry, now):
+                break
+            del self._sessions[session_id]
+            self._bytes -= entry[2]
+            self.expirations += 1
+            expired.append(entry[0])
+        return expired
+
+
+class SQLiteSessionBackend:
+    """Conversation histories in a SQLite file in WAL mode
+
+    Every worker process on the host opens the same file, so a follow-up
+    routed to another worker sees the same history. Each row carries a
+    version that goes up by one per save, letting workers check a cached
+    copy with a primary-key lookup instead of reloading it. A save only
+    replaces the version it was based on, so two workers finishing turns of
+    the same session at once cannot silently overwrite each other.
+
+    Args:
+        path: SQLite database file
+        idle_ttl: Seconds without a turn before a session expires; 0 for no expiry
+    """
+
+    name = 'sqlite'
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path, idle_ttl=3600):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.purged = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connection(self):
+        # Reconnect after fork: a SQLite connection must not cross processes
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute("PRAGMA synchronous=NORMAL;")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    history TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);")
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    def _cutoff(self):
+        return time.time() - self.idle_ttl if self.idle_ttl else 0
+
+    def version(self, session_id):
+        """Current version of a live session, or None if it is unknown or expired"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT version FROM sessions WHERE session_id = ? AND updated_at > ?;",
+                (session_id, self._cutoff())
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_id, max_messages=0):
+        """(history, version) of a live session, or None"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT history, version FROM sessions WHERE session_id = ? AND updated_at > ?;",
+                (session_id, self._cutoff())
+            ).fetchone()
+        if row is None:
+            return None
+        history = json.loads(row[0])
+        if max_messages:
+            history = history[-max_messages:]
+        return history, row[1]
+
+    def store(self, session_id, history, version):
+        """Write `history` over `version` and return the session's new version
+
+        Raises SessionConflict if the stored session is live and no longer
+        at `version` (0 for a session this worker has not seen).
+        """
+        now = time.time()
+        data = json.dumps(history)
+        with self._lock:
+            db = self._connection()
+            try:
+                db.execute("BEGIN IMMEDIATE;")
+                # An expired session is replaced whatever its version; the version still goes up
+                updated = db.execute(
+                    """UPDATE sessions SET history = ?, version = version + 1, updated_at = ?
+                       WHERE session_id = ? AND (version = ? OR updated_at <= ?);""",
+                    (data, now, session_id, version, self._cutoff())
+                ).rowcount
+                if updated:
+                    new_version = db.execute(
+                        "SELECT version FROM sessions WHERE session_id = ?;", (session_id,)
+                    ).fetchone()[0]
+                elif db.execute(
+                    "INSERT OR IGNORE INTO sessions (session_id, history, version, updated_at) VALUES (?, ?, ?, ?);",
+                    (session_id, data, version + 1, now)
+                ).rowcount:
+                    new_version = version + 1
+                else:
+                    raise SessionConflict(f"session {session_id} changed since version {version}")
+                if self.idle_ttl and now - self._last_purge > self.PURGE_INTERVAL:
+                    self._last_purge = now
+                    self.purged += db.execute(
+                        "DELETE FROM sessions WHERE updated_at <= ?;", (self._cutoff(),)
+                    ).rowcount
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return new_version
+
+    def delete(self, session_id):
+        with self._lock:
+            db = self._connection()
+            db.execute("DELETE FROM sessions WHERE session_id = ?;", (session_id,))
+            db.commit()
+
+    def stats(self):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT count(*) FROM sessions WHERE updated_at > ?;", (self._cutoff(),)
+            ).fetchone()
+        return {'path': self.path, 'stored_sessions': row[0], 'purged': self.purged}
+
+
+class PostgresSessionBackend:
+    """Conversation histories read back from the `conversations` table
+
+    Turns are already logged there by queue_conversation(), keyed by the
+    indexed session_id, so saving is a no-op and a session's version is its
+    row count. Rows still in a worker's write-behind queue are not visible
+    to other workers until the next flush (WRITE_FLUSH_INTERVAL).
+
+    Args:
+        idle_ttl: Seconds without a turn before a session expires; 0 for no expiry
+    """
+
+    name = 'postgres'
+
+    def __init__(self, idle_ttl=3600):
+        self.idle_ttl = idle_ttl
+
+    def _query(self, query, params):
+        from backend.database.database import get_connection
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def version(self, session_id):
+        """Number of logged turns for the session"""
+        return self._query(
+            "SELECT count(*) FROM conversations WHERE session_id = %s;", (session_id,)
+        )[0][0]
+
+    def load(self, session_id, max_messages=0):
+        """(history, version) rebuilt from the session's latest turns, or None"""
+        # Idle time is measured on the database clock, which every write path's created_at agrees with
+        rows = self._query("""
+            SELECT user_message, bot_response, created_at <= NOW() - make_interval(secs => %s), count(*) OVER ()
+            FROM conversations
+            WHERE session_id = %s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s;
+            """, (self.idle_ttl, session_id, (max_messages + 1) // 2 if max_messages else None))
+        if not rows:
+            return None
+        if self.idle_ttl and rows[0][2]:
+            return None
+
+        history = []
+        for user_message, bot_response, _, _ in reversed(rows):
+            history.append({"role": "user", "content": user_message})
+            history.append({"role": "assistant", "content": bot_response})
+        if max_messages:
+            history = history[-max_messages:]
+        return history, rows[0][3]
+
+    def store(self, session_id, history, version):
+        # The turn itself is written by queue_conversation()
+        return version + 1
+
+    def delete(self, session_id):
+        # Conversation rows are analytics data; only the worker caches forget the session
+        pass
+
+    def stats(self):
+        return {}
+
+
+class SharedSessionStore:
+    """Session store backed by storage shared between worker processes
+
+    Each worker keeps a small read-through LRU of recently used sessions.
+    A cached history is served after checking the backend's version for the
+    session; it is reloaded only when another worker has saved a newer turn.
+
+    Args:
+        backend: SQLiteSessionBackend or PostgresSessionBackend
+        cache_size: Sessions cached per worker
+        idle_ttl: Seconds a cached session stays valid without a turn
+        max_messages: Messages of history kept per session; 0 for no cap
+    """
+
+    def __init__(self, backend, cache_size=1000, idle_ttl=3600, max_messages=DEFAULT_MAX_MESSAGES):
+        self.backend = backend
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._cache = LRUCache(maxsize=cache_size, ttl=idle_ttl or None)  # session id -> (history, version)
+        self._stats_lock = threading.Lock()
+
+        self.hits = 0
+        self.reloads = 0
+        self.misses = 0
+        self.errors = 0
+        self.conflicts = 0
+        self.trimmed_messages = 0
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, session_id):
+        """History list for `session_id` (a new empty list for unknown or expired sessions)"""
+        entry = self._cache.get(session_id)
+        try:
+            if entry is not None:
+                version = self.backend.version(session_id)
+                # An older version means our own turn has not reached the backend yet
+                if version is not None and version <= entry[1]:
+                    self._count('hits')
+                    return entry[0]
+                forget_conversation_context(entry[0])
+            loaded = self.backend.load(session_id, self.max_messages)
+        except Exception as e:
+            print(f"Error loading session {session_id}: {e}")
+            self._count('errors')
+            return entry[0] if entry is not None else []
+
+        if loaded is None:
+            self._count('misses')
+            self._cache.pop(session_id)
+            return []
+        history, version = loaded
+        self._count('reloads' if entry is not None else 'misses')
+        self._cache.set(session_id, (history, version))
+        return history
+
+    def save(self, session_id, history):
+        """Store `history` for `session_id`, trimming it in place to the retained window"""
+        if self.max_messages and len(history) > self.max_messages:
+            with self._stats_lock:
+                self.trimmed_messages += len(history) - self.max_messages
+            del history[:-self.max_messages]
+
+        entry = self._cache.get(session_id)
+        version = entry[1] if entry is not None else 0
+        try:
+            version = self.backend.store(session_id, history, version)
+        except SessionConflict as e:
+            # Another worker's turn won; reload its history on the next get()
+            print(f"Not saving session {session_id}: {e}")
+            self._count('conflicts')
+            self._cache.pop(session_id)
+            return
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+            self._count('errors')
+        self._cache.set(session_id, (history, version))
+
+    def delete(self, session_id):
+        entry = self._cache.pop(session_id)
+        self.backend.delete(session_id)
+        if entry is not None:
+            forget_conversation_context(entry[0])
+        return entry is not None
+
+    def clear(self):
+        """Drop this worker's cached sessions (the shared backend is left alone)"""
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, session_id):
+        return session_id in self._cache
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.reloads + self.misses
+            stats = {
+                'backend': self.backend.name,
+                'cached_sessions': len(self._cache),
+                'cache_size': self._cache.maxsize,
+                'idle_ttl': self.idle_ttl,
+                'max_messages': self.max_messages,
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'errors': self.errors,
+                'conflicts': self.conflicts,
+                'trimmed_messages': self.trimmed_messages
+            }
+        try:
+            stats.update(self.backend.stats())
+        except Exception as e:
+            stats['backend_error'] = str(e)
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide session store configured from SESSION_* env vars
+
+    SESSION_BACKEND selects where histories live: `memory` (default, one
+    worker process), `sqlite` (a WAL file shared by the workers on one host,
+    SESSION_DB_PATH) or `postgres` (the conversations table, shared by every
+    host).
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv('SESSION_BACKEND', 'memory').lower()
+                idle_ttl = float(os.getenv('SESSION_IDLE_TTL', '3600'))
+                max_messages = int(os.getenv('SESSION_MAX_MESSAGES', str(DEFAULT_MAX_MESSAGES)))
+
+                if backend == 'sqlite':
+                    path = os.getenv('SESSION_DB_PATH') or os.path.join(PROJECT_ROOT, 'cache', 'sessions.sqlite3')
+                    shared = SQLiteSessionBackend(path, idle_ttl=idle_ttl)
+                elif backend in ('postgres', 'postgresql'):
+                    shared = PostgresSessionBackend(idle_ttl=idle_ttl)
+                else:
+                    if backend != 'memory':
+                        print(f"Unknown SESSION_BACKEND '{backend}', using memory")
+                    shared = None
+
+                if shared is None:
+                    _store = MemorySessionStore(
+                        max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', '10000')),
+                        idle_ttl=idle_ttl,
+                        max_messages=max_messages
+                    )
+                else:
+                    _store = SharedSessionStore(
+                        shared,
+                        cache_size=int(os.getenv('SESSION_CACHE_SIZE', '1000')),
+                        idle_ttl=idle_ttl,
+                        max_messages=max_messages
+                    )
+    return _store
+
+
+def get_session_stats():
+    """Session store size and memory counters, or None if the store is unused"""
+    return _store.stats() if _store is not None else None
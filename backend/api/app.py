@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 import uuid
 from dotenv import load_dotenv
 
@@ -12,20 +13,12 @@ load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 # Add project root to path for imports
 sys.path.insert(0, PROJECT_ROOT)
 
-from flask import Flask, request, jsonify, render_template, session, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, session, send_from_directory
 from flask_cors import CORS
-from backend.agents.chat import chat
-from backend.database.database import save_feedback
-from backend.database.analytics import (
-    get_total_queries,
-    get_queries_today,
-    get_queries_by_date,
-    get_top_intents,
-    get_average_response_time,
-    get_feedback_stats,
-    get_most_asked_questions,
-    get_recent_conversations
-)
+from backend.agents.chat import chat, chat_stream
+from backend.api.handlers import submit_feedback, header_stats, dashboard_data, runtime_metrics
+from backend.utils.clients import warm_up, warm_up_enabled
+from backend.utils.metrics import render_metrics
 
 # React build directory
 REACT_BUILD_DIR = os.path.join(PROJECT_ROOT, 'frontend', 'dist')
@@ -40,6 +33,13 @@ CORS(app, supports_credentials=True)
 
 # Secret key for Flask sessions
 app.secret_key = os.getenv('FLASK_SECRET_KEY', os.urandom(24).hex())
+if not os.getenv('FLASK_SECRET_KEY') and os.getenv('SESSION_BACKEND', 'memory').lower() != 'memory':
+    # Each worker would sign cookies with its own random key and lose the session_id
+    print("Warning: set FLASK_SECRET_KEY when running several workers with a shared SESSION_BACKEND")
+
+if warm_up_enabled():
+    # Under `gunicorn --preload` this runs once in the master, before the workers fork
+    warm_up()
 
 
 @app.route('/')
@@ -80,66 +80,77 @@ def chat_endpoint():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/feedback', methods=['POST'])
-def feedback_endpoint():
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """Stream the answer as Server-Sent Events (token, error and done events)"""
     data = request.get_json()
 
-    if not data or 'conversation_id' not in data or 'rating' not in data:
-        return jsonify({'error': 'conversation_id and rating are required'}), 400
+    if not data or 'message' not in data:
+        return jsonify({'error': 'No message provided'}), 400
 
-    conversation_id = data['conversation_id']
-    rating = data['rating']
-    feedback_text = data.get('feedback_text')
+    user_message = data['message']
 
-    # Validate rating
-    if rating not in (1, -1):
-        return jsonify({'error': 'Rating must be 1 (thumbs up) or -1 (thumbs down)'}), 400
+    # Get or create session_id for this user (set before the stream starts so the cookie is sent)
+    if 'session_id' not in session:
+        session['session_id'] = str(uuid.uuid4())
+    session_id = session['session_id']
 
-    try:
-        result = save_feedback(conversation_id, rating, feedback_text)
-        if result:
-            return jsonify({'success': True, 'conversation_id': result})
-        else:
-            return jsonify({'error': 'Conversation not found'}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    def generate():
+        try:
+            for event in chat_stream(user_message, session_id):
+                event_type = event.pop('type')
+                yield f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/feedback', methods=['POST'])
+def feedback_endpoint():
+    payload, status = submit_feedback(request.get_json())
+    return jsonify(payload), status
+
+
+def _cached_json(payload, etag, status=200):
+    """JSON response that answers a matching If-None-Match with 304"""
+    response = jsonify(payload)
+    response.status_code = status
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response = response.make_conditional(request)
+    return response
 
 
 @app.route('/stats')
 def stats_endpoint():
     """Get quick stats for the chat header"""
-    try:
-        response_time = get_average_response_time()
-        return jsonify({
-            'online': True,
-            'queries_today': get_queries_today(),
-            'avg_response_time_ms': response_time['average_ms']
-        })
-    except Exception as e:
-        return jsonify({
-            'online': False,
-            'queries_today': 0,
-            'avg_response_time_ms': 0,
-            'error': str(e)
-        })
+    payload, etag = header_stats()
+    return _cached_json(payload, etag)
 
 
 @app.route('/api/dashboard')
 def dashboard_api():
     """Dashboard analytics API endpoint"""
-    try:
-        data = {
-            'total_queries': get_total_queries(),
-            'queries_by_date': get_queries_by_date(days=7),
-            'top_intents': get_top_intents(limit=5),
-            'response_time': get_average_response_time(),
-            'feedback_stats': get_feedback_stats(),
-            'top_questions': get_most_asked_questions(limit=10),
-            'recent_conversations': get_recent_conversations(limit=20)
-        }
-        return jsonify(data)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    payload, status, etag = dashboard_data()
+    return _cached_json(payload, etag, status)
+
+
+@app.route('/api/metrics')
+def metrics_api():
+    """Runtime metrics for the backend's shared resources"""
+    return jsonify(runtime_metrics())
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-stage chat latency histograms and token counters for Prometheus"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 if __name__ == '__main__':
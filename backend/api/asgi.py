@@ -0,0 +1,206 @@
+"""
+Async (ASGI) serving mode for the chat API
+
+Serves the same routes and JSON contracts as backend/api/app.py, but the
+Bedrock calls are awaited on an event loop instead of holding a thread per
+request, so one worker can keep hundreds of conversations in flight.
+Database-backed endpoints run the existing pooled queries in worker
+threads; the chat path itself never waits on PostgreSQL because turns are
+logged through the write-behind queue.
+
+Run with:
+    python run.py --asgi
+    uvicorn backend.api.asgi:app --workers 4
+"""
+import os
+import sys
+import json
+import uuid
+import asyncio
+import decimal
+import contextlib
+import dataclasses
+from datetime import date
+from dotenv import load_dotenv
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Add project root to path for imports
+sys.path.insert(0, PROJECT_ROOT)
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from werkzeug.http import http_date
+from backend.agents.chat_async import chat_async, chat_stream_async
+from backend.api.handlers import submit_feedback, header_stats, dashboard_data, runtime_metrics
+from backend.utils.bedrock_async import close_async_bedrock
+from backend.utils.cache import etag_matches
+from backend.utils.clients import warm_up, warm_up_enabled
+from backend.utils.metrics import render_metrics
+
+# React build directory
+REACT_BUILD_DIR = os.path.join(PROJECT_ROOT, 'frontend', 'dist')
+
+
+def _json_default(o):
+    """Serialize the same extra types as Flask's jsonify"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class JSON(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, default=_json_default).encode('utf-8')
+
+
+def _session_id(request):
+    """Get or create session_id for this user"""
+    if 'session_id' not in request.session:
+        request.session['session_id'] = str(uuid.uuid4())
+    return request.session['session_id']
+
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def index(request):
+    """Serve React app"""
+    return FileResponse(os.path.join(REACT_BUILD_DIR, 'index.html'))
+
+
+async def chat_endpoint(request):
+    data = await _json_body(request)
+
+    if not data or 'message' not in data:
+        return JSON({'error': 'No message provided'}, status_code=400)
+
+    session_id = _session_id(request)
+
+    try:
+        result = await chat_async(data['message'], session_id)
+        return JSON({
+            'response': result['answer'],
+            'conversation_id': result['conversation_id'],
+            'session_id': session_id
+        })
+    except Exception as e:
+        return JSON({'error': str(e)}, status_code=500)
+
+
+async def chat_stream_endpoint(request):
+    """Stream the answer as Server-Sent Events (token, error and done events)"""
+    data = await _json_body(request)
+
+    if not data or 'message' not in data:
+        return JSON({'error': 'No message provided'}, status_code=400)
+
+    # Set before the stream starts so the cookie is sent with the headers
+    session_id = _session_id(request)
+
+    async def generate():
+        try:
+            async for event in chat_stream_async(data['message'], session_id):
+                event_type = event.pop('type')
+                yield f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def feedback_endpoint(request):
+    payload, status = await asyncio.to_thread(submit_feedback, await _json_body(request))
+    return JSON(payload, status_code=status)
+
+
+def _cached_json(request, payload, etag, status=200):
+    """JSON response that answers a matching If-None-Match with 304"""
+    if not etag:
+        return JSON(payload, status_code=status)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return JSON(payload, status_code=status, headers=headers)
+
+
+async def stats_endpoint(request):
+    """Get quick stats for the chat header"""
+    payload, etag = await asyncio.to_thread(header_stats)
+    return _cached_json(request, payload, etag)
+
+
+async def dashboard_api(request):
+    """Dashboard analytics API endpoint"""
+    payload, status, etag = await asyncio.to_thread(dashboard_data)
+    return _cached_json(request, payload, etag, status)
+
+
+async def metrics_api(request):
+    """Runtime metrics for the backend's shared resources"""
+    return JSON(await asyncio.to_thread(runtime_metrics))
+
+
+async def prometheus_metrics(request):
+    """Per-stage chat latency histograms and token counters for Prometheus"""
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+routes = [
+    Route('/', index),
+    Route('/chat', chat_endpoint, methods=['POST']),
+    Route('/chat/stream', chat_stream_endpoint, methods=['POST']),
+    Route('/feedback', feedback_endpoint, methods=['POST']),
+    Route('/stats', stats_endpoint),
+    Route('/api/dashboard', dashboard_api),
+    Route('/api/metrics', metrics_api),
+    Route('/metrics', prometheus_metrics),
+]
+if os.path.isdir(REACT_BUILD_DIR):
+    # React assets and other build files
+    routes.append(Mount('/', StaticFiles(directory=REACT_BUILD_DIR)))
+
+if not os.getenv('FLASK_SECRET_KEY') and os.getenv('SESSION_BACKEND', 'memory').lower() != 'memory':
+    # Each worker would sign cookies with its own random key and lose the session_id
+    print("Warning: set FLASK_SECRET_KEY when running several workers with a shared SESSION_BACKEND")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if warm_up_enabled():
+        # Each uvicorn worker is its own process, so each one warms up before serving
+        await asyncio.to_thread(warm_up)
+    yield
+    await close_async_bedrock()
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_credentials=True,
+                   allow_methods=['*'], allow_headers=['*']),
+        Middleware(SessionMiddleware, secret_key=os.getenv('FLASK_SECRET_KEY', os.urandom(24).hex()))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,122 @@
+"""
+Request handling shared by the Flask app and the ASGI app
+
+Each function takes plain Python values and returns a JSON-ready payload
+(with a status code where it can fail and an ETag where it is cached), so
+both servers expose the same /feedback, /stats, /api/dashboard and
+/api/metrics contracts.
+"""
+import os
+from backend.agents.answer_cache import (
+    get_answer_cache_entries,
+    get_answer_cache_stats,
+    evict_answer_for_conversation
+)
+from backend.agents.sessions import get_session_stats
+from backend.database.database import save_feedback
+from backend.database.pool import get_pool_stats
+from backend.database.write_queue import get_writer_stats
+from backend.utils.cache import CachedPayload
+from backend.utils.embeddings import get_embedding_cache_stats
+from backend.utils.retrieval_cache import get_retrieval_cache_stats
+from backend.database.analytics import get_dashboard_data, get_header_stats
+
+
+def submit_feedback(data):
+    """Validate and save a /feedback request body
+
+    Returns:
+        (payload, status) tuple
+    """
+    if not data or 'conversation_id' not in data or 'rating' not in data:
+        return {'error': 'conversation_id and rating are required'}, 400
+
+    conversation_id = data['conversation_id']
+    rating = data['rating']
+    feedback_text = data.get('feedback_text')
+
+    # Validate rating
+    if rating not in (1, -1):
+        return {'error': 'Rating must be 1 (thumbs up) or -1 (thumbs down)'}, 400
+
+    try:
+        result = save_feedback(conversation_id, rating, feedback_text)
+        if rating == -1:
+            # Never serve a cached answer that a user flagged as unhelpful, in any worker
+            evict_answer_for_conversation(conversation_id)
+        if result:
+            return {'success': True, 'conversation_id': result}, 200
+        else:
+            return {'error': 'Conversation not found'}, 404
+    except ValueError as e:
+        # Malformed conversation_id
+        return {'error': str(e)}, 400
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+def _compute_header_stats():
+    try:
+        stats = get_header_stats()
+        return {
+            'online': True,
+            'queries_today': stats['queries_today'],
+            'avg_response_time_ms': stats['response_time']['average_ms']
+        }
+    except Exception as e:
+        return {
+            'online': False,
+            'queries_today': 0,
+            'avg_response_time_ms': 0,
+            'error': str(e)
+        }
+
+
+def _compute_dashboard():
+    data = get_dashboard_data(days=7, intents=5, questions=10, recent=20)
+    data['cached_answers'] = get_answer_cache_entries(limit=10)
+    return data
+
+
+# Every open chat tab polls /stats and every open dashboard polls /api/dashboard;
+# within a TTL window they all share one computation
+_header_stats = CachedPayload(_compute_header_stats, ttl=float(os.getenv('STATS_CACHE_TTL', '5')))
+_dashboard = CachedPayload(_compute_dashboard, ttl=float(os.getenv('DASHBOARD_CACHE_TTL', '10')))
+
+
+def header_stats():
+    """Quick stats for the chat header (never fails; reports offline instead)
+
+    Returns:
+        (payload, etag) tuple
+    """
+    return _header_stats.get()
+
+
+def dashboard_data():
+    """Dashboard analytics
+
+    Returns:
+        (payload, status, etag) tuple; etag is None for errors
+    """
+    try:
+        payload, etag = _dashboard.get()
+        return payload, 200, etag
+    except Exception as e:
+        return {'error': str(e)}, 500, None
+
+
+def runtime_metrics():
+    """Runtime metrics for the backend's shared resources"""
+    return {
+        'db_pool': get_pool_stats(),
+        'write_queue': get_writer_stats(),
+        'embedding_cache': get_embedding_cache_stats(),
+        'retrieval_cache': get_retrieval_cache_stats(),
+        'answer_cache': get_answer_cache_stats(),
+        'sessions': get_session_stats(),
+        'response_cache': {
+            'stats': _header_stats.stats(),
+            'dashboard': _dashboard.stats()
+        }
+    }
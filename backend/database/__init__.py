@@ -1,5 +1,8 @@
 # Database package
-from .database import init_database, save_conversation, save_feedback, get_connection
+from .database import init_database, save_conversation, queue_conversation, save_feedback, get_connection
+from .pool import get_pool, get_pool_stats, close_pool, PoolTimeout
+from .write_queue import get_writer, get_writer_stats, shutdown_writer, QueueFull
+from .rollups import rebuild_rollups
 from .analytics import (
     get_total_queries,
     get_queries_today,
@@ -12,5 +15,6 @@ from .analytics import (
     get_conversation_stats,
     get_intent_distribution,
     get_daily_conversations,
-    get_slow_responses
+    get_slow_responses,
+    get_response_time_percentiles
 )
@@ -1,18 +1,25 @@
 from .database import get_connection
+from .rollups import LATENCY_QUANTILES, histogram_percentiles
 
 
 def get_conversation_stats(days=7):
-    """Get conversation statistics for the past N days"""
+    """Get conversation statistics for the past N days
+
+    This already reads every conversation in the window (for the distinct
+    session count), so its response time percentiles are exact.
+    """
     conn = get_connection()
     cursor = conn.cursor()
 
-    query = """
+    fractions = ', '.join(str(q / 100) for q in LATENCY_QUANTILES)
+    query = f"""
     SELECT
         COUNT(*) as total_conversations,
         COUNT(DISTINCT session_id) as unique_sessions,
         AVG(response_time_ms) as avg_response_time,
         MIN(created_at) as first_conversation,
-        MAX(created_at) as last_conversation
+        MAX(created_at) as last_conversation,
+        PERCENTILE_DISC(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY response_time_ms) as percentiles
     FROM conversations
     WHERE created_at >= NOW() - INTERVAL '%s days';
     """
@@ -20,13 +27,16 @@ def get_conversation_stats(days=7):
     try:
         cursor.execute(query, (days,))
         result = cursor.fetchone()
-        return {
+        stats = {
             'total_conversations': result[0],
             'unique_sessions': result[1],
             'avg_response_time_ms': round(result[2], 2) if result[2] else 0,
             'first_conversation': result[3],
             'last_conversation': result[4]
         }
+        for q, value in zip(LATENCY_QUANTILES, result[5] or [None] * len(LATENCY_QUANTILES)):
+            stats[f'p{q}_response_time_ms'] = value or 0
+        return stats
     finally:
         cursor.close()
         conn.close()
@@ -40,11 +50,12 @@ def get_intent_distribution(days=7):
     query = """
     SELECT
         intent,
-        COUNT(*) as count,
-        ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER(), 2) as percentage
-    FROM conversations
-    WHERE created_at >= NOW() - INTERVAL '%s days'
+        SUM(conversations)::bigint as count,
+        ROUND(SUM(conversations) * 100.0 / SUM(SUM(conversations)) OVER(), 2) as percentage
+    FROM conversation_daily_rollup
+    WHERE day >= CURRENT_DATE - %s
     GROUP BY intent
+    HAVING SUM(conversations) > 0
     ORDER BY count DESC;
     """
 
@@ -67,11 +78,12 @@ def get_daily_conversations(days=7):
 
     query = """
     SELECT
-        DATE(created_at) as date,
-        COUNT(*) as count
-    FROM conversations
-    WHERE created_at >= NOW() - INTERVAL '%s days'
-    GROUP BY DATE(created_at)
+        day as date,
+        SUM(conversations)::bigint as count
+    FROM conversation_daily_rollup
+    WHERE day >= CURRENT_DATE - %s
+    GROUP BY day
+    HAVING SUM(conversations) > 0
     ORDER BY date;
     """
 
@@ -87,11 +99,23 @@ def get_daily_conversations(days=7):
         conn.close()
 
 
-def get_slow_responses(threshold_ms=5000, limit=10):
-    """Get conversations with slow response times"""
+def get_slow_responses(threshold_ms=5000, limit=10, days=None, intent=None):
+    """Get conversations with slow response times, slowest first
+
+    Args:
+        threshold_ms: Only responses slower than this; None uses the p95
+            of the same window (from the latency histogram)
+        limit: Maximum number of conversations
+        days: Only the past N days (None = all time)
+        intent: Only this intent
+    """
+    if threshold_ms is None:
+        threshold_ms = get_response_time_percentiles(days, intent=intent)['p95_ms']
+
     conn = get_connection()
     cursor = conn.cursor()
 
+    # Walks idx_conversations_response_time from the slowest response down
     query = """
     SELECT
         id,
@@ -101,13 +125,15 @@ def get_slow_responses(threshold_ms=5000, limit=10):
         response_time_ms,
         created_at
     FROM conversations
-    WHERE response_time_ms > %s
+    WHERE response_time_ms > %(threshold)s
+      AND (%(days)s::int IS NULL OR created_at >= CURRENT_DATE - %(days)s::int)
+      AND (%(intent)s::text IS NULL OR intent = %(intent)s::text)
     ORDER BY response_time_ms DESC
-    LIMIT %s;
+    LIMIT %(limit)s;
     """
 
     try:
-        cursor.execute(query, (threshold_ms, limit))
+        cursor.execute(query, {'threshold': threshold_ms, 'limit': limit, 'days': days, 'intent': intent})
         results = cursor.fetchall()
         return [
             {
@@ -125,227 +151,387 @@ def get_slow_responses(threshold_ms=5000, limit=10):
         conn.close()
 
 
-def get_total_queries():
-    """Get total count of all conversations"""
+# Dashboard queries. Each reads the rollup tables (see rollups.py) and is used
+# on its own by the functions below and together by get_dashboard_data().
+TOTAL_QUERIES_QUERY = """
+SELECT COALESCE(SUM(conversations), 0)::bigint AS total FROM conversation_daily_rollup
+"""
+
+QUERIES_TODAY_QUERY = """
+SELECT COALESCE(SUM(conversations), 0)::bigint AS total FROM conversation_daily_rollup
+WHERE day = CURRENT_DATE
+"""
+
+QUERIES_BY_DATE_QUERY = """
+SELECT
+    TO_CHAR(day, 'YYYY-MM-DD') as date,
+    SUM(conversations)::bigint as count
+FROM conversation_daily_rollup
+WHERE day >= CURRENT_DATE - %(days)s
+GROUP BY day
+HAVING SUM(conversations) > 0
+ORDER BY date
+"""
+
+TOP_INTENTS_QUERY = """
+SELECT
+    intent,
+    SUM(conversations)::bigint as count
+FROM conversation_daily_rollup
+GROUP BY intent
+HAVING SUM(conversations) > 0
+ORDER BY count DESC, intent
+LIMIT %(intents)s
+"""
+
+RESPONSE_TIME_QUERY = """
+SELECT
+    SUM(response_time_sum)::float / NULLIF(SUM(response_time_count), 0) as avg_time,
+    MIN(response_time_min) as min_time,
+    MAX(response_time_max) as max_time
+FROM conversation_daily_rollup
+"""
+
+FEEDBACK_QUERY = """
+SELECT
+    SUM(thumbs_up)::bigint as thumbs_up,
+    SUM(thumbs_down)::bigint as thumbs_down,
+    SUM(thumbs_up + thumbs_down)::bigint as total_rated,
+    SUM(conversations)::bigint as total_conversations
+FROM conversation_daily_rollup
+"""
+
+MOST_ASKED_QUERY = """
+SELECT
+    question,
+    count,
+    intent
+FROM question_rollup
+WHERE intent = 'question' AND count > 0
+ORDER BY count DESC, question
+LIMIT %(questions)s
+"""
+
+RECENT_CONVERSATIONS_QUERY = """
+SELECT
+    id,
+    session_id::text as session_id,
+    user_message,
+    bot_response,
+    intent,
+    response_time_ms,
+    rating,
+    TO_CHAR(created_at, 'YYYY-MM-DD HH24:MI') as created_at,
+    created_at as sort_key
+FROM conversations
+ORDER BY sort_key DESC
+LIMIT %(recent)s
+"""
+
+
+def _latency_query(key, where='TRUE'):
+    """Latency histogram counts and observed min/max per group
+
+    Args:
+        key: SQL expression naming the group of a rollup row
+        where: SQL condition selecting the rollup rows (day, intent)
+    """
+    return f"""
+WITH window_histogram AS (
+    SELECT {key} as key, bucket, SUM(count)::bigint as count
+    FROM conversation_latency_histogram
+    WHERE {where}
+    GROUP BY 1, 2
+    HAVING SUM(count) > 0
+),
+window_bounds AS (
+    SELECT {key} as key, MIN(response_time_min) as min_ms, MAX(response_time_max) as max_ms
+    FROM conversation_daily_rollup
+    WHERE {where}
+    GROUP BY 1
+)
+SELECT key, bucket, count, min_ms, max_ms
+FROM window_histogram JOIN window_bounds USING (key)
+"""
+
+
+LATENCY_GROUP_KEYS = {
+    None: "'all'",
+    'intent': 'intent',
+    'day': "TO_CHAR(day, 'YYYY-MM-DD')"
+}
+
+LATENCY_WINDOW = "day >= CURRENT_DATE - %(days)s"
+
+LATENCY_FILTERED_WINDOW = """(%(days)s::int IS NULL OR day >= CURRENT_DATE - %(days)s::int)
+      AND (%(intent)s::text IS NULL OR intent = %(intent)s::text)"""
+
+# All-time percentiles next to the all-time average, min and max
+LATENCY_QUERY = _latency_query(LATENCY_GROUP_KEYS[None])
+LATENCY_BY_DATE_QUERY = _latency_query(LATENCY_GROUP_KEYS['day'], LATENCY_WINDOW)
+LATENCY_BY_INTENT_QUERY = _latency_query(LATENCY_GROUP_KEYS['intent'], LATENCY_WINDOW)
+
+
+def _run(query, params=None, many=True):
+    """Run one analytics query on a pooled connection"""
     conn = get_connection()
     cursor = conn.cursor()
 
-    query = "SELECT COUNT(*) FROM conversations;"
-
     try:
-        cursor.execute(query)
-        result = cursor.fetchone()
-        return result[0] if result else 0
+        cursor.execute(query, params)
+        return cursor.fetchall() if many else cursor.fetchone()
     finally:
         cursor.close()
         conn.close()
 
 
-def get_queries_today():
-    """Get count of conversations from today"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def _format_by_date(rows):
+    return {
+        'labels': [row[0] for row in rows],
+        'data': [row[1] for row in rows]
+    }
+
+
+def _format_top_intents(rows):
+    return {
+        'labels': [row[0] for row in rows],
+        'data': [row[1] for row in rows]
+    }
+
+
+def _latency_groups(rows):
+    """Percentiles per group from (key, bucket, count, min_ms, max_ms) rows, in row order"""
+    buckets = {}
+    bounds = {}
+    for key, bucket, count, min_ms, max_ms in rows:
+        buckets.setdefault(key, []).append((bucket, count))
+        bounds[key] = (min_ms, max_ms)
+    return {
+        key: histogram_percentiles(pairs, min_ms=bounds[key][0], max_ms=bounds[key][1])
+        for key, pairs in buckets.items()
+    }
+
+
+def _format_response_time(row, latency_rows=None):
+    result = {
+        'average_ms': round(row[0], 2) if row[0] else 0,
+        'min_ms': row[1] if row[1] else 0,
+        'max_ms': row[2] if row[2] else 0
+    }
+    if latency_rows is not None:
+        percentiles = _latency_groups(latency_rows).get('all') or histogram_percentiles([])
+        del percentiles['count']
+        result.update(percentiles)
+    return result
+
+
+def _format_latency_by_date(rows):
+    groups = _latency_groups(sorted(rows, key=lambda row: row[0]))
+    result = {'labels': list(groups)}
+    for q in LATENCY_QUANTILES:
+        result[f'p{q}'] = [groups[day][f'p{q}_ms'] for day in groups]
+    return result
+
+
+def _format_latency_by_intent(rows):
+    groups = _latency_groups(rows)
+    return sorted(
+        ({'intent': intent, **percentiles} for intent, percentiles in groups.items()),
+        key=lambda item: (-item['count'], item['intent'])
+    )
+
+
+def _format_feedback(row):
+    thumbs_up = row[0] or 0
+    thumbs_down = row[1] or 0
+    total_rated = row[2] or 0
+    total_conversations = row[3] or 0
+
+    return {
+        'thumbs_up': thumbs_up,
+        'thumbs_down': thumbs_down,
+        'total_rated': total_rated,
+        'total_conversations': total_conversations,
+        'thumbs_up_percent': round((thumbs_up / total_rated * 100), 1) if total_rated > 0 else 0,
+        'thumbs_down_percent': round((thumbs_down / total_rated * 100), 1) if total_rated > 0 else 0,
+        'feedback_rate': round((total_rated / total_conversations * 100), 1) if total_conversations > 0 else 0
+    }
+
+
+def _format_questions(rows):
+    return [
+        {
+            'question': row[0][:100] + '...' if len(row[0]) > 100 else row[0],
+            'count': row[1],
+            'intent': row[2]
+        }
+        for row in rows
+    ]
+
+
+def _format_recent(rows):
+    return [
+        {
+            'id': row[0],
+            'session_id': str(row[1])[:8] + '...',
+            'user_message': row[2][:50] + '...' if len(row[2]) > 50 else row[2],
+            'bot_response': row[3][:50] + '...' if len(row[3]) > 50 else row[3],
+            'intent': row[4] or 'unknown',
+            'response_time_ms': row[5] or 0,
+            'rating': row[6],
+            'created_at': row[7] or ''
+        }
+        for row in rows
+    ]
 
-    query = """
-    SELECT COUNT(*) FROM conversations
-    WHERE DATE(created_at) = CURRENT_DATE;
-    """
 
-    try:
-        cursor.execute(query)
-        result = cursor.fetchone()
-        return result[0] if result else 0
-    finally:
-        cursor.close()
-        conn.close()
+def get_total_queries():
+    """Get total count of all conversations"""
+    return _run(TOTAL_QUERIES_QUERY, many=False)[0]
 
 
-def get_queries_by_date(days=7):
-    """Get queries per day for last N days, formatted for charts"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def get_queries_today():
+    """Get count of conversations from today"""
+    return _run(QUERIES_TODAY_QUERY, many=False)[0]
 
-    query = """
-    SELECT
-        DATE(created_at) as date,
-        COUNT(*) as count
-    FROM conversations
-    WHERE created_at >= NOW() - INTERVAL '%s days'
-    GROUP BY DATE(created_at)
-    ORDER BY date;
-    """
 
-    try:
-        cursor.execute(query, (days,))
-        results = cursor.fetchall()
-        return {
-            'labels': [row[0].strftime('%Y-%m-%d') for row in results],
-            'data': [row[1] for row in results]
-        }
-    finally:
-        cursor.close()
-        conn.close()
+def get_queries_by_date(days=7):
+    """Get queries per day for last N days, formatted for charts"""
+    return _format_by_date(_run(QUERIES_BY_DATE_QUERY, {'days': days}))
 
 
 def get_top_intents(limit=5):
     """Get most common intent types, formatted for charts"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    return _format_top_intents(_run(TOP_INTENTS_QUERY, {'intents': limit}))
 
-    query = """
-    SELECT
-        COALESCE(intent, 'unknown') as intent,
-        COUNT(*) as count
-    FROM conversations
-    GROUP BY intent
-    ORDER BY count DESC
-    LIMIT %s;
-    """
 
-    try:
-        cursor.execute(query, (limit,))
-        results = cursor.fetchall()
-        return {
-            'labels': [row[0] for row in results],
-            'data': [row[1] for row in results]
-        }
-    finally:
-        cursor.close()
-        conn.close()
+def get_average_response_time():
+    """Get average, min, max and p50/p90/p95/p99 response time in milliseconds"""
+    response_time, latency_rows = _run(RESPONSE_TIME_SUMMARY_QUERY, many=False)
+    return _format_response_time(_values(response_time), [_values(r) for r in latency_rows])
 
 
-def get_average_response_time():
-    """Get average response time in milliseconds"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def get_response_time_percentiles(days=7, group_by=None, intent=None):
+    """Response time percentiles from the latency histogram rollup
 
-    query = """
-    SELECT
-        AVG(response_time_ms) as avg_time,
-        MIN(response_time_ms) as min_time,
-        MAX(response_time_ms) as max_time
-    FROM conversations
-    WHERE response_time_ms IS NOT NULL;
+    Never reads conversations, so any window costs the same. Estimates are
+    within about 20% of the exact value (one histogram bucket).
+
+    Args:
+        days: Only the past N days (None = all time)
+        group_by: None for one summary, 'intent' for one per intent
+            (busiest first) or 'day' for one per day (oldest first)
+        intent: Only this intent
+
+    Returns:
+        Dict with 'count' and p50_ms/p90_ms/p95_ms/p99_ms, or for group_by a
+        list of such dicts that also carry 'intent' or 'date'
     """
+    if group_by not in LATENCY_GROUP_KEYS:
+        raise ValueError("group_by must be None, 'intent' or 'day'")
 
-    try:
-        cursor.execute(query)
-        result = cursor.fetchone()
-        return {
-            'average_ms': round(result[0], 2) if result[0] else 0,
-            'min_ms': result[1] if result[1] else 0,
-            'max_ms': result[2] if result[2] else 0
-        }
-    finally:
-        cursor.close()
-        conn.close()
+    rows = _run(
+        _latency_query(LATENCY_GROUP_KEYS[group_by], LATENCY_FILTERED_WINDOW),
+        {'days': days, 'intent': intent}
+    )
+    groups = _latency_groups(rows)
+
+    if group_by is None:
+        return groups.get('all') or histogram_percentiles([])
+    if group_by == 'intent':
+        return _format_latency_by_intent(rows)
+    return [{'date': day, **groups[day]} for day in sorted(groups)]
 
 
 def get_feedback_stats():
     """Get thumbs up/down counts and percentages"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    return _format_feedback(_run(FEEDBACK_QUERY, many=False))
 
-    query = """
-    SELECT
-        COUNT(*) FILTER (WHERE rating = 1) as thumbs_up,
-        COUNT(*) FILTER (WHERE rating = -1) as thumbs_down,
-        COUNT(*) FILTER (WHERE rating IS NOT NULL) as total_rated,
-        COUNT(*) as total_conversations
-    FROM conversations;
-    """
 
-    try:
-        cursor.execute(query)
-        result = cursor.fetchone()
-        thumbs_up = result[0] or 0
-        thumbs_down = result[1] or 0
-        total_rated = result[2] or 0
-        total_conversations = result[3] or 0
-
-        return {
-            'thumbs_up': thumbs_up,
-            'thumbs_down': thumbs_down,
-            'total_rated': total_rated,
-            'total_conversations': total_conversations,
-            'thumbs_up_percent': round((thumbs_up / total_rated * 100), 1) if total_rated > 0 else 0,
-            'thumbs_down_percent': round((thumbs_down / total_rated * 100), 1) if total_rated > 0 else 0,
-            'feedback_rate': round((total_rated / total_conversations * 100), 1) if total_conversations > 0 else 0
-        }
-    finally:
-        cursor.close()
-        conn.close()
+def get_most_asked_questions(limit=10):
+    """Get most frequent user messages (case and whitespace insensitive)"""
+    return _format_questions(_run(MOST_ASKED_QUERY, {'questions': limit}))
 
 
-def get_most_asked_questions(limit=10):
-    """Get most frequent user messages"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def get_recent_conversations(limit=20):
+    """Get most recent conversations"""
+    return _format_recent(_run(RECENT_CONVERSATIONS_QUERY, {'recent': limit}))
 
-    query = """
-    SELECT
-        user_message,
-        COUNT(*) as count,
-        intent
-    FROM conversations
-    WHERE intent = 'question'
-    GROUP BY user_message, intent
-    ORDER BY count DESC
-    LIMIT %s;
-    """
 
-    try:
-        cursor.execute(query, (limit,))
-        results = cursor.fetchall()
-        return [
-            {
-                'question': row[0][:100] + '...' if len(row[0]) > 100 else row[0],
-                'count': row[1],
-                'intent': row[2]
-            }
-            for row in results
-        ]
-    finally:
-        cursor.close()
-        conn.close()
+def _json_rows(query, order_by):
+    """Wrap a query so it returns its rows as one JSON array of objects"""
+    return f"(SELECT COALESCE(json_agg(row_to_json(s) ORDER BY {order_by}), '[]') FROM ({query}) s)"
 
 
-def get_recent_conversations(limit=20):
-    """Get most recent conversations"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def _json_row(query):
+    return f"(SELECT row_to_json(s) FROM ({query}) s)"
 
-    query = """
-    SELECT
-        id,
-        session_id,
-        user_message,
-        bot_response,
-        intent,
-        response_time_ms,
-        rating,
-        created_at
-    FROM conversations
-    ORDER BY created_at DESC
-    LIMIT %s;
-    """
 
-    try:
-        cursor.execute(query, (limit,))
-        results = cursor.fetchall()
-        return [
-            {
-                'id': row[0],
-                'session_id': str(row[1])[:8] + '...',
-                'user_message': row[2][:50] + '...' if len(row[2]) > 50 else row[2],
-                'bot_response': row[3][:50] + '...' if len(row[3]) > 50 else row[3],
-                'intent': row[4] or 'unknown',
-                'response_time_ms': row[5] or 0,
-                'rating': row[6],
-                'created_at': row[7].strftime('%Y-%m-%d %H:%M') if row[7] else ''
-            }
-            for row in results
-        ]
-    finally:
-        cursor.close()
-        conn.close()
+RESPONSE_TIME_SUMMARY_QUERY = f"""
+SELECT
+    {_json_row(RESPONSE_TIME_QUERY)},
+    {_json_rows(LATENCY_QUERY, 'bucket')};
+"""
+
+# Every dashboard section in one statement, so a page load is one round trip
+DASHBOARD_QUERY = f"""
+SELECT
+    {_json_row(TOTAL_QUERIES_QUERY)},
+    {_json_rows(QUERIES_BY_DATE_QUERY, 'date')},
+    {_json_rows(TOP_INTENTS_QUERY, 'count DESC, intent')},
+    {_json_row(RESPONSE_TIME_QUERY)},
+    {_json_rows(LATENCY_QUERY, 'bucket')},
+    {_json_rows(LATENCY_BY_DATE_QUERY, 'key, bucket')},
+    {_json_rows(LATENCY_BY_INTENT_QUERY, 'key, bucket')},
+    {_json_row(FEEDBACK_QUERY)},
+    {_json_rows(MOST_ASKED_QUERY, 'count DESC, question')},
+    {_json_rows(RECENT_CONVERSATIONS_QUERY, 'sort_key DESC')};
+"""
+
+HEADER_STATS_QUERY = f"""
+SELECT
+    {_json_row(QUERIES_TODAY_QUERY)},
+    {_json_row(RESPONSE_TIME_QUERY)};
+"""
+
+
+def _values(obj):
+    """Column values of a row returned as a JSON object, in select order"""
+    return tuple(obj.values())
+
+
+def get_dashboard_data(days=7, intents=5, questions=10, recent=20):
+    """Every database-backed /api/dashboard section from a single query
+
+    Returns a dict with total_queries, queries_by_date, top_intents,
+    response_time, response_time_by_date, response_time_by_intent,
+    feedback_stats, top_questions and recent_conversations, each formatted
+    exactly like the matching get_* function. response_time_by_date holds
+    one series per percentile for charting tail latency over the window.
+    """
+    (total, by_date, top_intents, response_time, latency, latency_by_date, latency_by_intent,
+     feedback, top_questions, recent_rows) = _run(
+        DASHBOARD_QUERY,
+        {'days': days, 'intents': intents, 'questions': questions, 'recent': recent},
+        many=False
+    )
+    return {
+        'total_queries': _values(total)[0],
+        'queries_by_date': _format_by_date([_values(r) for r in by_date]),
+        'top_intents': _format_top_intents([_values(r) for r in top_intents]),
+        'response_time': _format_response_time(_values(response_time), [_values(r) for r in latency]),
+        'response_time_by_date': _format_latency_by_date([_values(r) for r in latency_by_date]),
+        'response_time_by_intent': _format_latency_by_intent([_values(r) for r in latency_by_intent]),
+        'feedback_stats': _format_feedback(_values(feedback)),
+        'top_questions': _format_questions([_values(r) for r in top_questions]),
+        'recent_conversations': _format_recent([_values(r) for r in recent_rows])
+    }
+
+
+def get_header_stats():
+    """Conversations today and response time summary from a single query"""
+    today, response_time = _run(HEADER_STATS_QUERY, many=False)
+    return {
+        'queries_today': _values(today)[0],
+        'response_time': _format_response_time(_values(response_time))
+    }
@@ -1,6 +1,10 @@
-import psycopg2
 import os
+import json
+import uuid
 from dotenv import load_dotenv
+from .pool import get_pool
+from .write_queue import get_writer, write_behind_enabled, QueueFull
+from .rollups import init_rollups
 
 # Get project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -9,11 +13,11 @@ load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 
 
 def get_connection():
-    """Create and return a database connection using DATABASE_URL"""
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment variables")
-    return psycopg2.connect(database_url)
+    """Check out a pooled database connection for DATABASE_URL
+
+    Calling close() on the returned connection hands it back to the pool.
+    """
+    return get_pool().getconn()
 
 
 def init_database():
@@ -31,7 +35,16 @@ def init_database():
         response_time_ms INTEGER,
         rating INTEGER,
         feedback_text TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        conversation_uuid UUID,
+        time_to_first_token_ms INTEGER,
+        stage_timings_ms JSONB,
+        input_tokens INTEGER,
+        output_tokens INTEGER,
+        estimated_input_tokens INTEGER,
+        estimated_output_tokens INTEGER,
+        cache_read_tokens INTEGER,
+        cache_write_tokens INTEGER
     );
 
     CREATE INDEX IF NOT EXISTS idx_conversations_session_id
@@ -53,12 +66,51 @@ def init_database():
                        WHERE table_name='conversations' AND column_name='feedback_text') THEN
             ALTER TABLE conversations ADD COLUMN feedback_text TEXT;
         END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name='conversations' AND column_name='conversation_uuid') THEN
+            ALTER TABLE conversations ADD COLUMN conversation_uuid UUID;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name='conversations' AND column_name='time_to_first_token_ms') THEN
+            ALTER TABLE conversations ADD COLUMN time_to_first_token_ms INTEGER;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name='conversations' AND column_name='stage_timings_ms') THEN
+            ALTER TABLE conversations ADD COLUMN stage_timings_ms JSONB;
+            ALTER TABLE conversations ADD COLUMN input_tokens INTEGER;
+            ALTER TABLE conversations ADD COLUMN output_tokens INTEGER;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name='conversations' AND column_name='estimated_input_tokens') THEN
+            ALTER TABLE conversations ADD COLUMN estimated_input_tokens INTEGER;
+            ALTER TABLE conversations ADD COLUMN estimated_output_tokens INTEGER;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name='conversations' AND column_name='cache_read_tokens') THEN
+            ALTER TABLE conversations ADD COLUMN cache_read_tokens INTEGER;
+            ALTER TABLE conversations ADD COLUMN cache_write_tokens INTEGER;
+        END IF;
+        -- created_at holds an absolute instant, so the write-behind queue's UTC stamps and the
+        -- server's CURRENT_TIMESTAMP agree; init_rollups() recreates the trigger dropped here
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name='conversations' AND column_name='created_at'
+                     AND data_type='timestamp without time zone') THEN
+            DROP TRIGGER IF EXISTS conversations_rollup_update ON conversations;
+            ALTER TABLE conversations ALTER COLUMN created_at TYPE TIMESTAMPTZ;
+        END IF;
     END $$;
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_conversation_uuid
+    ON conversations(conversation_uuid);
+
+    CREATE INDEX IF NOT EXISTS idx_conversations_response_time
+    ON conversations(response_time_ms);
     """
 
     try:
         cursor.execute(create_table_query)
         cursor.execute(add_columns_query)
+        init_rollups(cursor)
         conn.commit()
         print("Database initialized successfully")
     except Exception as e:
@@ -74,22 +126,43 @@ def save_feedback(conversation_id, rating, feedback_text=None):
     """Save user feedback for a conversation
 
     Args:
-        conversation_id: The ID of the conversation to update
+        conversation_id: The ID of the conversation to update, either the
+            integer row id or the conversation_uuid returned by queue_conversation
         rating: 1 for thumbs up, -1 for thumbs down
         feedback_text: Optional text comment from user
     """
     if rating not in (1, -1):
         raise ValueError("Rating must be 1 (thumbs up) or -1 (thumbs down)")
 
+    by_uuid = not str(conversation_id).isdigit()
+    if by_uuid:
+        try:
+            conversation_id = str(uuid.UUID(str(conversation_id)))
+        except ValueError:
+            raise ValueError("conversation_id must be a conversation row id or UUID")
+    if by_uuid and write_behind_enabled():
+        # The row may still be waiting in the write-behind queue
+        writer = get_writer()
+        if writer.is_pending(conversation_id):
+            writer.flush()
+
     conn = get_connection()
     cursor = conn.cursor()
 
-    update_query = """
-    UPDATE conversations
-    SET rating = %s, feedback_text = %s
-    WHERE id = %s
-    RETURNING id;
-    """
+    if by_uuid:
+        update_query = """
+        UPDATE conversations
+        SET rating = %s, feedback_text = %s
+        WHERE conversation_uuid = %s
+        RETURNING conversation_uuid;
+        """
+    else:
+        update_query = """
+        UPDATE conversations
+        SET rating = %s, feedback_text = %s
+        WHERE id = %s
+        RETURNING id;
+        """
 
     try:
         cursor.execute(update_query, (rating, feedback_text, conversation_id))
@@ -107,7 +180,9 @@ def save_feedback(conversation_id, rating, feedback_text=None):
         conn.close()
 
 
-def save_conversation(session_id, user_msg, bot_response, intent, response_time):
+def save_conversation(session_id, user_msg, bot_response, intent, response_time, time_to_first_token=None,
+                      stage_timings=None, input_tokens=None, output_tokens=None, estimated_input_tokens=None,
+                      estimated_output_tokens=None, cache_read_tokens=None, cache_write_tokens=None):
     """Save a conversation to the database
 
     Args:
@@ -116,18 +191,32 @@ def save_conversation(session_id, user_msg, bot_response, intent, response_time)
         bot_response: The bot's response
         intent: Classified intent (greeting, question, etc.)
         response_time: Response time in milliseconds
+        time_to_first_token: Milliseconds until the first streamed token, if streamed
+        stage_timings: Dict of milliseconds per chat stage (classify, embed, ...)
+        input_tokens: Claude prompt tokens, if Claude was called
+        output_tokens: Claude completion tokens, if Claude was called
+        estimated_input_tokens: Locally estimated prompt tokens, if Claude was called
+        estimated_output_tokens: Locally estimated completion tokens, if Claude was called
+        cache_read_tokens: Prompt tokens read from Claude's prompt cache
+        cache_write_tokens: Prompt tokens written to Claude's prompt cache
     """
     conn = get_connection()
     cursor = conn.cursor()
 
     insert_query = """
-    INSERT INTO conversations (session_id, user_message, bot_response, intent, response_time_ms)
-    VALUES (%s, %s, %s, %s, %s)
+    INSERT INTO conversations (session_id, user_message, bot_response, intent, response_time_ms, time_to_first_token_ms,
+                               stage_timings_ms, input_tokens, output_tokens, estimated_input_tokens,
+                               estimated_output_tokens, cache_read_tokens, cache_write_tokens)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     RETURNING id;
     """
 
     try:
-        cursor.execute(insert_query, (session_id, user_msg, bot_response, intent, response_time))
+        cursor.execute(insert_query, (
+            session_id, user_msg, bot_response, intent, response_time, time_to_first_token,
+            json.dumps(stage_timings) if stage_timings else None, input_tokens, output_tokens,
+            estimated_input_tokens, estimated_output_tokens, cache_read_tokens, cache_write_tokens
+        ))
         conversation_id = cursor.fetchone()[0]
         conn.commit()
         return conversation_id
@@ -140,5 +229,42 @@ def save_conversation(session_id, user_msg, bot_response, intent, response_time)
         conn.close()
 
 
+def queue_conversation(session_id, user_msg, bot_response, intent, response_time, time_to_first_token=None,
+                       stage_timings=None, input_tokens=None, output_tokens=None, estimated_input_tokens=None,
+                       estimated_output_tokens=None, cache_read_tokens=None, cache_write_tokens=None):
+    """Queue a conversation for write-behind logging and return its id
+
+    Returns a client-generated conversation_uuid immediately; the row is
+    written by the background writer. Falls back to a synchronous
+    save_conversation() when write-behind is disabled (WRITE_BEHIND=0) or
+    the queue is full with no journal to spill to.
+    """
+    if not write_behind_enabled():
+        return save_conversation(session_id, user_msg, bot_response, intent, response_time, time_to_first_token,
+                                 stage_timings, input_tokens, output_tokens, estimated_input_tokens,
+                                 estimated_output_tokens, cache_read_tokens, cache_write_tokens)
+
+    try:
+        return get_writer().enqueue({
+            'session_id': session_id,
+            'user_message': user_msg,
+            'bot_response': bot_response,
+            'intent': intent,
+            'response_time_ms': response_time,
+            'time_to_first_token_ms': time_to_first_token,
+            'stage_timings_ms': json.dumps(stage_timings) if stage_timings else None,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'estimated_input_tokens': estimated_input_tokens,
+            'estimated_output_tokens': estimated_output_tokens,
+            'cache_read_tokens': cache_read_tokens,
+            'cache_write_tokens': cache_write_tokens
+        })
+    except QueueFull:
+        return save_conversation(session_id, user_msg, bot_response, intent, response_time, time_to_first_token,
+                                 stage_timings, input_tokens, output_tokens, estimated_input_tokens,
+                                 estimated_output_tokens, cache_read_tokens, cache_write_tokens)
+
+
 if __name__ == "__main__":
     init_database()
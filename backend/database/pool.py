@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+import atexit
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class PooledConnection:
+    """Thin proxy around a psycopg2 connection
+
+    Behaves like the raw connection, except close() hands it back to the pool
+    instead of tearing down the socket. That keeps every existing
+    `conn.close()` in a finally block working unchanged.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        """The underlying psycopg2 connection"""
+        return self._conn
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool
+
+    Args:
+        dsn: Connection string passed to psycopg2.connect
+        min_size: Connections opened up front and kept idle
+        max_size: Hard cap on open connections
+        timeout: Seconds to wait for a free connection before PoolTimeout
+        check_interval: Connections idle longer than this (seconds) are
+            pinged with SELECT 1 on checkout; 0 pings on every checkout
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=30.0, check_interval=5.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (connection, last_used_monotonic), used LIFO
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._checkout_ms_total = 0.0
+        self._checkout_ms_max = 0.0
+        self._checkout_ms_last = 0.0
+
+    def fill(self):
+        """Open connections until min_size are available"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting up to `timeout` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        last_used = None
+
+        with self._cond:
+            if self._closed:
+                raise psycopg2.InterfaceError("connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        # Connect / health check outside the lock so other threads are not blocked
+        try:
+            if conn is None:
+                conn = self._connect()
+            else:
+                conn = self._ensure_healthy(conn, last_used)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self._cond:
+            self._in_use += 1
+            self._checkouts += 1
+            self._checkout_ms_total += elapsed_ms
+            self._checkout_ms_last = elapsed_ms
+            self._checkout_ms_max = max(self._checkout_ms_max, elapsed_ms)
+
+        return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        """Return a connection; broken or aborted ones are discarded"""
+        keep = not conn.closed
+        if keep:
+            try:
+                # Leave no half-finished transaction behind for the next user
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                keep = False
+
+        with self._cond:
+            self._in_use -= 1
+            if keep and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._close_quietly(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'checkout_ms_avg': round(self._checkout_ms_total / self._checkouts, 3) if self._checkouts else 0,
+                'checkout_ms_max': round(self._checkout_ms_max, 3),
+                'checkout_ms_last': round(self._checkout_ms_last, 3)
+            }
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn)
+
+    def _ensure_healthy(self, conn, last_used):
+        """Ping stale connections and transparently replace broken ones"""
+        if not conn.closed and time.monotonic() - last_used < self.check_interval:
+            return conn
+
+        if not conn.closed:
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1;")
+                finally:
+                    cursor.close()
+                conn.rollback()
+                return conn
+            except Exception as e:
+                print(f"Discarding broken database connection: {e}")
+
+        self._close_quietly(conn)
+        with self._cond:
+            self._reconnects += 1
+        return self._connect()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use
+
+    Pool size is configured with DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT and DB_POOL_CHECK_INTERVAL. A new pool is created after
+    fork so worker processes never share sockets with their parent.
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            database_url = os.getenv('DATABASE_URL')
+            if not database_url:
+                raise ValueError("DATABASE_URL not found in environment variables")
+
+            pool = ConnectionPool(
+                database_url,
+                min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+                check_interval=float(os.getenv('DB_POOL_CHECK_INTERVAL', '5'))
+            )
+            try:
+                pool.fill()
+            except Exception as e:
+                # Connections are opened on demand once the database is reachable
+                print(f"Could not pre-open database connections: {e}")
+
+            _pool = pool
+            _pool_pid = pid
+
+    return _pool
+
+
+def get_pool_stats():
+    """Pool metrics, or None if no pool has been created in this process"""
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.stats()
+
+
+def close_pool():
+    """Close the process-wide pool (registered to run at interpreter exit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+atexit.register(close_pool)
@@ -0,0 +1,317 @@
+"""
+Materialized dashboard aggregates over the conversations table
+
+Triggers on `conversations` keep three small rollup tables current as rows
+are inserted (by the write-behind queue or save_conversation), rated
+through save_feedback, or deleted:
+
+    conversation_daily_rollup      per day and intent: conversations,
+                                   response time count/sum/min/max, ratings
+    conversation_latency_histogram per day, intent and log-scale latency
+                                   bucket: conversations in that bucket
+    question_rollup                per normalized question and intent: how
+                                   often it was asked
+
+The analytics queries read these instead of scanning conversations.
+Latency histograms for any set of days and intents merge by adding counts,
+so percentiles over any window come from a few dozen rows per day.
+"""
+from .pool import get_pool
+
+# Latency bucket b holds response times in (HISTOGRAM_BASE^(b-1), HISTOGRAM_BASE^b] ms;
+# bucket 0 is <= 1 ms and the last bucket is open-ended
+HISTOGRAM_BASE = 1.2
+HISTOGRAM_MAX_BUCKET = 70
+
+# Percentiles reported wherever response times are summarized
+LATENCY_QUANTILES = (50, 90, 95, 99)
+
+ROLLUP_TABLES_QUERY = """
+CREATE TABLE IF NOT EXISTS conversation_daily_rollup (
+    day DATE NOT NULL,
+    intent VARCHAR(50) NOT NULL,
+    conversations BIGINT NOT NULL DEFAULT 0,
+    response_time_count BIGINT NOT NULL DEFAULT 0,
+    response_time_sum BIGINT NOT NULL DEFAULT 0,
+    response_time_min INTEGER,
+    response_time_max INTEGER,
+    thumbs_up BIGINT NOT NULL DEFAULT 0,
+    thumbs_down BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, intent)
+);
+
+CREATE TABLE IF NOT EXISTS conversation_latency_histogram (
+    day DATE NOT NULL,
+    intent VARCHAR(50) NOT NULL,
+    bucket SMALLINT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, intent, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS question_rollup (
+    question_hash TEXT NOT NULL,
+    intent VARCHAR(50) NOT NULL,
+    question TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    last_asked TIMESTAMPTZ,
+    PRIMARY KEY (question_hash, intent)
+);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name='question_rollup' AND column_name='last_asked'
+                 AND data_type='timestamp without time zone') THEN
+        ALTER TABLE question_rollup ALTER COLUMN last_asked TYPE TIMESTAMPTZ;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_question_rollup_intent_count
+ON question_rollup(intent, count DESC);
+"""
+
+ROLLUP_FUNCTIONS_QUERY = f"""
+CREATE OR REPLACE FUNCTION latency_bucket(ms INTEGER) RETURNS SMALLINT
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE
+        WHEN ms IS NULL THEN NULL
+        WHEN ms <= 1 THEN 0
+        ELSE LEAST(CEIL(LN(ms) / LN({HISTOGRAM_BASE})), {HISTOGRAM_MAX_BUCKET})
+    END::SMALLINT
+$$;
+
+CREATE OR REPLACE FUNCTION normalize_question(message TEXT) RETURNS TEXT
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT LOWER(BTRIM(REGEXP_REPLACE(message, '\\s+', ' ', 'g')))
+$$;
+
+CREATE OR REPLACE FUNCTION conversation_rollup_apply(c conversations, sign INTEGER) RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    row_day DATE := DATE(c.created_at);
+    row_intent VARCHAR(50) := COALESCE(c.intent, 'unknown');
+BEGIN
+    INSERT INTO conversation_daily_rollup AS r (
+        day, intent, conversations, response_time_count, response_time_sum,
+        response_time_min, response_time_max, thumbs_up, thumbs_down
+    ) VALUES (
+        row_day, row_intent, sign,
+        CASE WHEN c.response_time_ms IS NULL THEN 0 ELSE sign END,
+        sign * COALESCE(c.response_time_ms, 0),
+        -- min/max only ever widen; rebuild_rollups() tightens them after deletes
+        CASE WHEN sign > 0 THEN c.response_time_ms END,
+        CASE WHEN sign > 0 THEN c.response_time_ms END,
+        CASE WHEN c.rating = 1 THEN sign ELSE 0 END,
+        CASE WHEN c.rating = -1 THEN sign ELSE 0 END
+    )
+    ON CONFLICT (day, intent) DO UPDATE SET
+        conversations = r.conversations + EXCLUDED.conversations,
+        response_time_count = r.response_time_count + EXCLUDED.response_time_count,
+        response_time_sum = r.response_time_sum + EXCLUDED.response_time_sum,
+        response_time_min = LEAST(r.response_time_min, EXCLUDED.response_time_min),
+        response_time_max = GREATEST(r.response_time_max, EXCLUDED.response_time_max),
+        thumbs_up = r.thumbs_up + EXCLUDED.thumbs_up,
+        thumbs_down = r.thumbs_down + EXCLUDED.thumbs_down;
+
+    IF c.response_time_ms IS NOT NULL THEN
+        INSERT INTO conversation_latency_histogram AS h (day, intent, bucket, count)
+        VALUES (row_day, row_intent, latency_bucket(c.response_time_ms), sign)
+        ON CONFLICT (day, intent, bucket) DO UPDATE SET count = h.count + EXCLUDED.count;
+    END IF;
+
+    INSERT INTO question_rollup AS q (question_hash, intent, question, count, last_asked)
+    VALUES (
+        MD5(normalize_question(c.user_message)), row_intent, LEFT(BTRIM(c.user_message), 200),
+        sign, CASE WHEN sign > 0 THEN c.created_at END
+    )
+    ON CONFLICT (question_hash, intent) DO UPDATE SET
+        count = q.count + EXCLUDED.count,
+        last_asked = GREATEST(q.last_asked, EXCLUDED.last_asked);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION conversations_rollup_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.created_at IS NOT DISTINCT FROM OLD.created_at
+       AND NEW.intent IS NOT DISTINCT FROM OLD.intent
+       AND NEW.response_time_ms IS NOT DISTINCT FROM OLD.response_time_ms
+       AND NEW.user_message IS NOT DISTINCT FROM OLD.user_message THEN
+        -- Feedback: only the rating tallies move
+        UPDATE conversation_daily_rollup SET
+            thumbs_up = thumbs_up
+                + (CASE WHEN NEW.rating = 1 THEN 1 ELSE 0 END)
+                - (CASE WHEN OLD.rating = 1 THEN 1 ELSE 0 END),
+            thumbs_down = thumbs_down
+                + (CASE WHEN NEW.rating = -1 THEN 1 ELSE 0 END)
+                - (CASE WHEN OLD.rating = -1 THEN 1 ELSE 0 END)
+        WHERE day = DATE(NEW.created_at) AND intent = COALESCE(NEW.intent, 'unknown');
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM conversation_rollup_apply(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM conversation_rollup_apply(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS conversations_rollup_write ON conversations;
+CREATE TRIGGER conversations_rollup_write
+AFTER INSERT OR DELETE ON conversations
+FOR EACH ROW EXECUTE PROCEDURE conversations_rollup_trigger();
+
+DROP TRIGGER IF EXISTS conversations_rollup_update ON conversations;
+CREATE TRIGGER conversations_rollup_update
+AFTER UPDATE OF rating, intent, response_time_ms, created_at, user_message ON conversations
+FOR EACH ROW
+WHEN (OLD.rating IS DISTINCT FROM NEW.rating
+      OR OLD.intent IS DISTINCT FROM NEW.intent
+      OR OLD.response_time_ms IS DISTINCT FROM NEW.response_time_ms
+      OR OLD.created_at IS DISTINCT FROM NEW.created_at
+      OR OLD.user_message IS DISTINCT FROM NEW.user_message)
+EXECUTE PROCEDURE conversations_rollup_trigger();
+"""
+
+REBUILD_QUERY = """
+LOCK TABLE conversations IN SHARE MODE;
+
+TRUNCATE conversation_daily_rollup, conversation_latency_histogram, question_rollup;
+
+INSERT INTO conversation_daily_rollup (
+    day, intent, conversations, response_time_count, response_time_sum,
+    response_time_min, response_time_max, thumbs_up, thumbs_down
+)
+SELECT
+    DATE(created_at),
+    COALESCE(intent, 'unknown'),
+    COUNT(*),
+    COUNT(response_time_ms),
+    COALESCE(SUM(response_time_ms), 0),
+    MIN(response_time_ms),
+    MAX(response_time_ms),
+    COUNT(*) FILTER (WHERE rating = 1),
+    COUNT(*) FILTER (WHERE rating = -1)
+FROM conversations
+GROUP BY 1, 2;
+
+INSERT INTO conversation_latency_histogram (day, intent, bucket, count)
+SELECT DATE(created_at), COALESCE(intent, 'unknown'), latency_bucket(response_time_ms), COUNT(*)
+FROM conversations
+WHERE response_time_ms IS NOT NULL
+GROUP BY 1, 2, 3;
+
+INSERT INTO question_rollup (question_hash, intent, question, count, last_asked)
+SELECT
+    MD5(normalize_question(user_message)),
+    COALESCE(intent, 'unknown'),
+    LEFT(BTRIM(MIN(user_message)), 200),
+    COUNT(*),
+    MAX(created_at)
+FROM conversations
+GROUP BY 1, 2;
+"""
+
+
+def bucket_bounds(bucket):
+    """(low, high] response time range in ms covered by a latency bucket"""
+    if bucket <= 0:
+        return 0.0, 1.0
+    return HISTOGRAM_BASE ** (bucket - 1), HISTOGRAM_BASE ** bucket
+
+
+def histogram_percentiles(buckets, quantiles=LATENCY_QUANTILES, min_ms=None, max_ms=None):
+    """Estimate percentiles from latency histogram counts
+
+    Interpolates within the bucket holding each rank, so an estimate is
+    within one bucket width (about 20%) of the exact value.
+
+    Args:
+        buckets: Iterable of (bucket, count) pairs; a bucket may repeat
+            (e.g. one pair per day), counts are added
+        quantiles: Percentiles to report, 0-100
+        min_ms: Smallest observed response time, to clamp the estimates
+        max_ms: Largest observed response time, to clamp the estimates
+
+    Returns:
+        Dict with 'count' and a 'p<q>_ms' key per quantile (0 if there
+        is no data)
+    """
+    merged = {}
+    for bucket, count in buckets:
+        merged[bucket] = merged.get(bucket, 0) + count
+
+    ordered = sorted((b, c) for b, c in merged.items() if c > 0)
+    total = sum(c for _, c in ordered)
+    result = {'count': total}
+
+    for q in quantiles:
+        key = f'p{q}_ms'
+        if not total:
+            result[key] = 0
+            continue
+
+        rank = q / 100 * total
+        seen = 0
+        for bucket, count in ordered:
+            if seen + count >= rank:
+                break
+            seen += count
+
+        low, high = bucket_bounds(bucket)
+        if bucket >= HISTOGRAM_MAX_BUCKET and max_ms:
+            # The last bucket is open-ended
+            high = max(max_ms, low)
+        estimate = low + (high - low) * (rank - seen) / count
+
+        if min_ms is not None:
+            estimate = max(estimate, min_ms)
+        if max_ms is not None:
+            estimate = min(estimate, max_ms)
+        result[key] = int(round(estimate))
+
+    return result
+
+
+def init_rollups(cursor):
+    """Create the rollup tables and triggers; backfill them the first time
+
+    Runs inside init_database()'s transaction, after conversations exists.
+    """
+    cursor.execute("SELECT to_regclass('conversation_daily_rollup') IS NULL;")
+    first_time = cursor.fetchone()[0]
+
+    cursor.execute(ROLLUP_TABLES_QUERY)
+    cursor.execute(ROLLUP_FUNCTIONS_QUERY)
+    if first_time:
+        cursor.execute(REBUILD_QUERY)
+
+
+def rebuild_rollups():
+    """Recompute every rollup from conversations
+
+    Blocks conversation writes while it runs. Only needed after editing
+    conversations with triggers disabled, or to tighten min/max after deletes.
+    """
+    conn = get_pool().getconn()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(REBUILD_QUERY)
+        conn.commit()
+        print("Dashboard rollups rebuilt")
+    except Exception as e:
+        conn.rollback()
+        print(f"Error rebuilding rollups: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    rebuild_rollups()
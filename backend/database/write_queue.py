@@ -0,0 +1,506 @@
+import os
+import glob
+import json
+import uuid
+import time
+import atexit
+import threading
+from collections import deque
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from .pool import get_pool
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Columns written for every queued conversation, in INSERT order
+COLUMNS = (
+    'conversation_uuid',
+    'session_id',
+    'user_message',
+    'bot_response',
+    'intent',
+    'response_time_ms',
+    'time_to_first_token_ms',
+    'stage_timings_ms',
+    'input_tokens',
+    'output_tokens',
+    'estimated_input_tokens',
+    'estimated_output_tokens',
+    'cache_read_tokens',
+    'cache_write_tokens',
+    'created_at'
+)
+
+MAX_RETRY_DELAY = 30.0
+# Times a row Postgres rejects on its own is retried before it goes to the dead-letter file
+MAX_ROW_ATTEMPTS = 3
+
+
+class QueueFull(Exception):
+    """Raised when the in-memory queue is full and there is no journal to spill to"""
+
+
+def _row_error(e):
+    """True for errors caused by a row's data rather than by the connection"""
+    return isinstance(e, psycopg2.DatabaseError) and not isinstance(e, psycopg2.OperationalError)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ConversationWriter:
+    """Bounded write-behind queue that batches conversation INSERTs
+
+    Rows are acknowledged as soon as they are queued; a background thread
+    writes them with one multi-row INSERT per batch. With a journal directory
+    every row is also appended to a per-process JSON-lines file before it is
+    acknowledged, so rows survive a crash and rows that do not fit in the
+    in-memory queue spill to disk instead of blocking the caller.
+
+    When Postgres rejects a batch, its rows are retried one at a time. A row
+    that is rejected MAX_ROW_ATTEMPTS times is moved to the dead-letter file
+    conversations.<pid>.failed.jsonl in the journal directory, so one bad
+    row cannot hold up the rows behind it.
+
+    Args:
+        max_queue: Rows held in memory before spilling (or blocking without a journal)
+        batch_size: Rows per INSERT statement; a full batch triggers an early flush
+        flush_interval: Seconds between background flushes
+        journal_dir: Directory for the spill-to-disk journal, or None to disable it
+        put_timeout: Seconds enqueue() waits for room when there is no journal
+    """
+
+    def __init__(self, max_queue=1000, batch_size=100, flush_interval=0.5,
+                 journal_dir=None, put_timeout=0.05):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_dir = journal_dir
+        self.put_timeout = put_timeout
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._pending_ids = set()
+        self._pending_since = {}
+        self._flush_requested = False
+        self._stopping = False
+        self._thread = None
+        self._pid = os.getpid()
+        self._journal = None
+        self._journal_rows = 0
+        self._retry_delay = 0.0
+        self._row_attempts = {}
+
+        # Metrics
+        self._enqueued = 0
+        self._flushed = 0
+        self._spilled = 0
+        self._blocked = 0
+        self._failed_flushes = 0
+        self._dead_lettered = 0
+        self._last_flush_ms = 0.0
+        self._last_batch_size = 0
+        self._last_error = None
+
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+            self._recover_journals()
+
+    def start(self):
+        """Start the background flusher thread"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='conversation-writer', daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def enqueue(self, row):
+        """Queue one conversation row and return its conversation_uuid"""
+        row = dict(row)
+        row.setdefault('conversation_uuid', str(uuid.uuid4()))
+        # UTC with an offset: created_at is TIMESTAMPTZ, like save_conversation()'s server-side default
+        row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        conversation_uuid = row['conversation_uuid']
+
+        with self._cond:
+            if self._journal_path():
+                self._append_journal(row)
+                if len(self._queue) >= self.max_queue:
+                    # Row is durable in the journal; the flusher reads it from there
+                    self._spilled += 1
+                else:
+                    self._queue.append(row)
+            else:
+                deadline = time.monotonic() + self.put_timeout
+                while len(self._queue) >= self.max_queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._blocked += 1
+                        raise QueueFull(f"Conversation write queue is full ({self.max_queue} rows)")
+                    self._cond.wait(remaining)
+                self._queue.append(row)
+
+            self._pending_ids.add(conversation_uuid)
+            self._pending_since[conversation_uuid] = time.monotonic()
+            self._enqueued += 1
+            if len(self._pending_ids) >= self.batch_size:
+                self._cond.notify_all()
+
+        return conversation_uuid
+
+    def is_pending(self, conversation_uuid):
+        """True if the row has been queued but not yet written to Postgres"""
+        with self._cond:
+            return str(conversation_uuid) in self._pending_ids
+
+    def flush(self, timeout=5.0):
+        """Ask the flusher to write now and wait until the queue drains
+
+        Returns True if nothing is left pending when the call returns.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending_ids:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=5.0):
+        """Flush what we can and stop the background thread"""
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        with self._cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def stats(self):
+        """Snapshot of queue depth, throughput and backpressure metrics"""
+        with self._cond:
+            oldest = min(self._pending_since.values()) if self._pending_since else None
+            return {
+                'queue_depth': len(self._queue),
+                'pending': len(self._pending_ids),
+                'max_queue': self.max_queue,
+                'enqueued': self._enqueued,
+                'flushed': self._flushed,
+                'spilled': self._spilled,
+                'blocked': self._blocked,
+                'failed_flushes': self._failed_flushes,
+                'dead_lettered': self._dead_lettered,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'last_batch_size': self._last_batch_size,
+                'oldest_pending_s': round(time.monotonic() - oldest, 3) if oldest else 0,
+                'journal_files': len(self._journal_files()) if self.journal_dir else 0,
+                'last_error': self._last_error
+            }
+
+    # ---- background flushing -------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + max(self.flush_interval, self._retry_delay)
+                while not (self._stopping or self._flush_requested or self._batch_ready()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+                self._flush_requested = False
+
+            self._flush_once()
+
+    def _flush_once(self):
+        start = time.monotonic()
+        written = 0
+        try:
+            if self.journal_dir:
+                with self._cond:
+                    self._queue.clear()
+                    self._rotate_journal()
+                    self._cond.notify_all()
+                rejected = 0
+                for path in self._journal_files():
+                    rows = self._read_journal(path)
+                    retry, dead = self._write_rows(rows)
+                    done = self._without(rows, retry + dead)
+                    written += len(done)
+                    self._mark_written(done, dead)
+                    if retry:
+                        # Keep only the rejected rows and carry on with the later files
+                        self._rewrite_journal(path, retry)
+                        rejected += len(retry)
+                    else:
+                        os.remove(path)
+                if rejected:
+                    raise RuntimeError(f"{rejected} rows rejected, will retry")
+            else:
+                with self._cond:
+                    rows = list(self._queue)
+                    self._queue.clear()
+                    self._cond.notify_all()
+                try:
+                    retry, dead = self._write_rows(rows)
+                except Exception:
+                    with self._cond:
+                        self._queue.extendleft(reversed(rows))
+                    raise
+                done = self._without(rows, retry + dead)
+                written = len(done)
+                self._mark_written(done, dead)
+                if retry:
+                    with self._cond:
+                        self._queue.extendleft(reversed(retry))
+                    raise RuntimeError(f"{len(retry)} rows rejected, will retry")
+        except Exception as e:
+            with self._cond:
+                self._failed_flushes += 1
+                self._last_error = f"{type(e).__name__}: {e}"
+                self._retry_delay = min(max(self._retry_delay * 2, 1.0), MAX_RETRY_DELAY)
+            print(f"Error flushing conversations (retrying in {self._retry_delay:.0f}s): {e}")
+            return
+
+        with self._cond:
+            self._retry_delay = 0.0
+            if written:
+                self._last_flush_ms = (time.monotonic() - start) * 1000
+                self._last_batch_size = written
+
+    def _write_rows(self, rows):
+        """Insert `rows`, one at a time if Postgres rejects the batch
+
+        Returns (rows to try again later, rows dead-lettered after being
+        rejected MAX_ROW_ATTEMPTS times); connection errors are raised.
+        """
+        try:
+            self._insert(rows)
+            return [], []
+        except Exception as e:
+            if not _row_error(e):
+                raise
+
+        retry = []
+        dead = []
+        for row in rows:
+            try:
+                # Rows of the batch that did go in before are skipped by ON CONFLICT
+                self._insert([row])
+                self._row_attempts.pop(row['conversation_uuid'], None)
+            except Exception as e:
+                if not _row_error(e):
+                    raise
+                attempts = self._row_attempts.get(row['conversation_uuid'], 0) + 1
+                if attempts >= MAX_ROW_ATTEMPTS:
+                    self._row_attempts.pop(row['conversation_uuid'], None)
+                    self._dead_letter(row, e)
+                    dead.append(row)
+                else:
+                    self._row_attempts[row['conversation_uuid']] = attempts
+                    retry.append(row)
+        return retry, dead
+
+    @staticmethod
+    def _without(rows, excluded):
+        excluded_ids = {row['conversation_uuid'] for row in excluded}
+        return [row for row in rows if row['conversation_uuid'] not in excluded_ids]
+
+    def _dead_letter(self, row, error):
+        """Set aside a row Postgres keeps rejecting"""
+        with self._cond:
+            self._dead_lettered += 1
+        record = json.dumps({'row': row, 'error': f"{type(error).__name__}: {str(error).strip()}",
+                             'failed_at': datetime.now(timezone.utc).isoformat()})
+        print(f"Conversation {row['conversation_uuid']} rejected {MAX_ROW_ATTEMPTS} times, dead-lettered: {str(error).strip()}")
+        if not self.journal_dir:
+            print(f"Dropped conversation (no journal directory): {record}")
+            return
+        path = os.path.join(self.journal_dir, f"conversations.{self._pid}.failed.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(record + '\n')
+
+    def _insert(self, rows):
+        if not rows:
+            return
+        columns = ', '.join(COLUMNS)
+        insert_query = f"""
+        INSERT INTO conversations ({columns})
+        VALUES %s
+        ON CONFLICT (conversation_uuid) DO NOTHING;
+        """
+        values = [tuple(row.get(column) for column in COLUMNS) for row in rows]
+
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+        try:
+            execute_values(cursor, insert_query, values, page_size=self.batch_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _mark_written(self, rows, dead_lettered=()):
+        """Stop tracking `rows` (inserted) and `dead_lettered`; only the former count as flushed"""
+        with self._cond:
+            for row in list(rows) + list(dead_lettered):
+                self._pending_ids.discard(row['conversation_uuid'])
+                self._pending_since.pop(row['conversation_uuid'], None)
+            self._flushed += len(rows)
+            self._cond.notify_all()
+
+    def _batch_ready(self):
+        # While backing off after a failure only the timer (or an explicit flush) retries
+        return not self._retry_delay and len(self._pending_ids) >= self.batch_size
+
+    # ---- journal -------------------------------------------------------------
+
+    def _journal_path(self):
+        if not self.journal_dir:
+            return None
+        return os.path.join(self.journal_dir, f"conversations.{self._pid}.active.jsonl")
+
+    def _append_journal(self, row):
+        if self._journal is None:
+            self._journal = open(self._journal_path(), 'a', encoding='utf-8')
+        self._journal.write(json.dumps(row) + '\n')
+        self._journal.flush()
+        self._journal_rows += 1
+
+    def _rotate_journal(self):
+        """Seal the active journal so new rows go to a fresh file"""
+        if self._journal is None or self._journal_rows == 0:
+            return
+        self._journal.close()
+        self._journal = None
+        self._journal_rows = 0
+        sealed = os.path.join(
+            self.journal_dir, f"conversations.{self._pid}.{time.time_ns()}.pending.jsonl"
+        )
+        os.replace(self._journal_path(), sealed)
+
+    def _journal_files(self):
+        pattern = os.path.join(self.journal_dir, f"conversations.{self._pid}.*.pending.jsonl")
+        return sorted(glob.glob(pattern))
+
+    def _rewrite_journal(self, path, rows):
+        """Replace a sealed journal with just `rows`"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        os.replace(tmp_path, path)
+
+    def _read_journal(self, path):
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write; the row was never acknowledged
+                    continue
+        return rows
+
+    def _recover_journals(self):
+        """Adopt journals left behind by processes that are no longer running"""
+        for path in glob.glob(os.path.join(self.journal_dir, 'conversations.*.jsonl')):
+            name = os.path.basename(path)
+            if name.endswith('.failed.jsonl'):
+                continue  # dead letters are kept for inspection, not replayed
+            try:
+                owner = int(name.split('.')[1])
+            except (IndexError, ValueError):
+                continue
+            if owner == self._pid or _pid_alive(owner):
+                continue
+
+            adopted = os.path.join(
+                self.journal_dir, f"conversations.{self._pid}.{time.time_ns()}.pending.jsonl"
+            )
+            try:
+                os.replace(path, adopted)
+            except FileNotFoundError:
+                continue  # another worker adopted it first
+
+            rows = self._read_journal(adopted)
+            now = time.monotonic()
+            for row in rows:
+                self._pending_ids.add(row['conversation_uuid'])
+                self._pending_since[row['conversation_uuid']] = now
+            if rows:
+                print(f"Recovered {len(rows)} unsaved conversations from {name}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def write_behind_enabled():
+    """Write-behind logging is on unless WRITE_BEHIND is set to 0/false"""
+    return os.getenv('WRITE_BEHIND', '1').lower() not in ('0', 'false', 'no')
+
+
+def get_writer():
+    """Return the process-wide writer, starting it on first use (and after fork)"""
+    global _writer
+
+    if _writer is not None and _writer._pid == os.getpid():
+        return _writer
+
+    with _writer_lock:
+        if _writer is None or _writer._pid != os.getpid():
+            journal_dir = os.getenv('WRITE_JOURNAL_DIR', os.path.join(PROJECT_ROOT, 'write_journal'))
+            _writer = ConversationWriter(
+                max_queue=int(os.getenv('WRITE_QUEUE_MAX_SIZE', '1000')),
+                batch_size=int(os.getenv('WRITE_BATCH_SIZE', '100')),
+                flush_interval=float(os.getenv('WRITE_FLUSH_INTERVAL', '0.5')),
+                journal_dir=journal_dir or None
+            ).start()
+
+    return _writer
+
+
+def get_writer_stats():
+    """Writer metrics, or None if nothing has been queued in this process"""
+    if _writer is None or _writer._pid != os.getpid():
+        return None
+    return _writer.stats()
+
+
+def shutdown_writer(timeout=5.0):
+    """Flush and stop the writer (registered to run at interpreter exit)"""
+    if _writer is not None and _writer._pid == os.getpid():
+        _writer.stop(timeout=timeout)
+
+
+atexit.register(shutdown_writer)
@@ -0,0 +1,10 @@
+# Offline benchmark and evaluation harness for the chat pipeline
+from .fakes import FakeBedrock, InMemoryCollection, SQLiteConversationStore, build_knowledge_base
+from .harness import (
+    ChatBenchmark,
+    load_chat_module,
+    load_questions,
+    export_questions,
+    format_report,
+    compare_to_baseline
+)
@@ -0,0 +1,455 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from backend.utils.chunking import chunk_document, document_title, embedding_text
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def _content_blocks(content):
+    """A system prompt or message content (a string or content blocks) as a list of text blocks"""
+    if isinstance(content, str):
+        return [{'type': 'text', 'text': content}]
+    return [block for block in content if block.get('type') == 'text']
+
+
+def _content_text(content):
+    return ''.join(block['text'] for block in _content_blocks(content))
+
+
+class Latency:
+    """Simulated call latency: a mean in milliseconds with proportional jitter
+
+    Args:
+        mean_ms: Average latency; 0 disables sleeping
+        jitter: Standard deviation as a fraction of the mean
+        rng: random.Random used for sampling (shared, so runs are repeatable)
+    """
+
+    def __init__(self, mean_ms, jitter=0.2, rng=None):
+        self.mean_ms = mean_ms
+        self.jitter = jitter
+        self._rng = rng or random.Random(0)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if self.mean_ms <= 0:
+            return 0.0
+        with self._lock:
+            ms = self._rng.gauss(self.mean_ms, self.mean_ms * self.jitter)
+        return max(ms, 0.0) / 1000
+
+    def sleep(self):
+        seconds = self.sample()
+        if seconds:
+            time.sleep(seconds)
+        return seconds
+
+
+def hashed_embedding(text, dimensions=1536):
+    """Deterministic bag-of-words embedding
+
+    Each word is hashed to a signed dimension, so texts sharing words are
+    close and retrieval returns topically sensible chunks without a model.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeBedrock:
+    """Offline stand-in for the bedrock-runtime client
+
+    Titan embedding calls return deterministic hashed embeddings; any other
+    model id is treated as Claude and returns a canned answer built from the
+    question. Both sleep for a configurable latency so the pipeline sees
+    realistic waits, and a fraction of calls can be made to fail with
+    ThrottlingException to exercise the error paths. Claude requests with
+    cache_control breakpoints are billed like Bedrock prompt caching: the
+    longest prefix seen before at a breakpoint is reported as
+    cache_read_input_tokens, the rest up to the last breakpoint as
+    cache_creation_input_tokens.
+
+    Args:
+        embed_latency_ms: Mean latency of an embedding call
+        llm_latency_ms: Mean latency of a full Claude answer
+        jitter: Latency standard deviation as a fraction of the mean
+        throttle_rate: Fraction of calls that raise ThrottlingException
+        dimensions: Embedding size (Titan v1 is 1536)
+        answer_chars: Approximate length of generated answers
+        seed: Seed for latency jitter and throttling
+    """
+
+    def __init__(self, embed_latency_ms=50, llm_latency_ms=500, jitter=0.2, throttle_rate=0.0,
+                 dimensions=1536, answer_chars=600, seed=0):
+        rng = random.Random(seed)
+        self.embed_latency = Latency(embed_latency_ms, jitter, rng)
+        self.llm_latency = Latency(llm_latency_ms, jitter, rng)
+        self.throttle_rate = throttle_rate
+        self.dimensions = dimensions
+        self.answer_chars = answer_chars
+        self._rng = rng
+        self._lock = threading.Lock()
+        self.calls = {'embed': 0, 'llm': 0, 'stream': 0, 'throttled': 0}
+        self._prompt_cache = set()
+
+    def embed(self, text):
+        """Embedding without latency, for building the test knowledge base"""
+        return hashed_embedding(text, self.dimensions)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        if 'titan-embed' in modelId:
+            self._count('embed')
+            self.embed_latency.sleep()
+            self._maybe_throttle()
+            embedding = self.embed(request['inputText']).tolist()
+            return {'body': io.BytesIO(json.dumps({'embedding': embedding}).encode('utf-8'))}
+
+        self._count('llm')
+        self.llm_latency.sleep()
+        self._maybe_throttle()
+        answer = self._answer(request)
+        return {'body': io.BytesIO(json.dumps({
+            'content': [{'type': 'text', 'text': answer}],
+            'usage': self._usage(request, answer)
+        }).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        self._count('stream')
+        total = self.llm_latency.sample()
+        self._maybe_throttle()
+        answer = self._answer(request)
+        usage = self._usage(request, answer)
+        words = answer.split(' ')
+        pieces = [' '.join(words[i:i + 5]) + ' ' for i in range(0, len(words), 5)]
+
+        def events():
+            # About a third of the latency before the first token, the rest spread over the answer
+            time.sleep(total * 0.3)
+            yield self._event({
+                'type': 'message_start',
+                'message': {'usage': dict(usage, output_tokens=1)}
+            })
+            for piece in pieces:
+                time.sleep(total * 0.7 / len(pieces))
+                yield self._event({
+                    'type': 'content_block_delta',
+                    'delta': {'type': 'text_delta', 'text': piece}
+                })
+            yield self._event({
+                'type': 'message_delta',
+                'delta': {'stop_reason': 'end_turn'},
+                'usage': {'output_tokens': usage['output_tokens']}
+            })
+            yield self._event({'type': 'message_stop'})
+
+        return {'body': events()}
+
+    def _answer(self, request):
+        question = ''
+        for message in reversed(request.get('messages', [])):
+            if message['role'] == 'user':
+                question = _content_text(message['content'])
+                break
+        match = re.search(r'Current question: (.*)', question)
+        subject = (match.group(1) if match else question)[:120].strip()
+        sentence = f"Here is how to handle {subject} in Supabase. "
+        repeats = max(1, self.answer_chars // len(sentence))
+        return (sentence * repeats).strip()
+
+    def _usage(self, request, answer):
+        """Token counts at about 4 characters per token, with prompt cache reads and writes"""
+        blocks = _content_blocks(request.get('system', ''))
+        for message in request.get('messages', []):
+            blocks.extend(_content_blocks(message['content']))
+
+        digest = hashlib.sha256()
+        prompt_chars = read_chars = cached_chars = 0
+        for block in blocks:
+            digest.update(block['text'].encode('utf-8'))
+            prompt_chars += len(block['text'])
+            if 'cache_control' not in block:
+                continue
+            key = digest.hexdigest()
+            with self._lock:
+                if key in self._prompt_cache:
+                    read_chars = prompt_chars
+                self._prompt_cache.add(key)
+            cached_chars = prompt_chars
+
+        usage = {'input_tokens': (prompt_chars - cached_chars) // 4, 'output_tokens': len(answer) // 4}
+        if cached_chars:
+            usage['cache_read_input_tokens'] = read_chars // 4
+            usage['cache_creation_input_tokens'] = (cached_chars - read_chars) // 4
+        return usage
+
+    @staticmethod
+    def _event(payload):
+        return {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _maybe_throttle(self):
+        if not self.throttle_rate:
+            return
+        with self._lock:
+            throttled = self._rng.random() < self.throttle_rate
+            if throttled:
+                self.calls['throttled'] += 1
+        if throttled:
+            from botocore.exceptions import ClientError
+            raise ClientError(
+                {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                'InvokeModel'
+            )
+
+
+class InMemoryCollection:
+    """Minimal in-memory stand-in for a Chroma collection
+
+    Implements the subset of the Collection API the app uses (add, upsert,
+    update, get, delete, count, query) with exact squared-L2 search, which
+    matches Chroma's default distance.
+    """
+
+    def __init__(self, name="supabase_knowledge_base"):
+        self.name = name
+        self._lock = threading.RLock()
+        self._ids = []
+        self._index = {}
+        self._documents = []
+        self._metadatas = []
+        self._embeddings = []
+        self._matrix = None
+
+    def add(self, ids, documents=None, embeddings=None, metadatas=None):
+        self.upsert(ids, documents, embeddings, metadatas)
+
+    def upsert(self, ids, documents=None, embeddings=None, metadatas=None):
+        with self._lock:
+            for i, item_id in enumerate(ids):
+                document = documents[i] if documents else None
+                metadata = metadatas[i] if metadatas else None
+                embedding = np.asarray(embeddings[i], dtype=np.float32)
+                if item_id in self._index:
+                    k = self._index[item_id]
+                    self._documents[k] = document
+                    self._metadatas[k] = metadata
+                    self._embeddings[k] = embedding
+                else:
+                    self._index[item_id] = len(self._ids)
+                    self._ids.append(item_id)
+                    self._documents.append(document)
+                    self._metadatas.append(metadata)
+                    self._embeddings.append(embedding)
+            self._matrix = None
+
+    def update(self, ids, documents=None, metadatas=None, embeddings=None):
+        with self._lock:
+            for i, item_id in enumerate(ids):
+                k = self._index[item_id]
+                if documents:
+                    self._documents[k] = documents[i]
+                if metadatas:
+                    self._metadatas[k] = metadatas[i]
+                if embeddings:
+                    self._embeddings[k] = np.asarray(embeddings[i], dtype=np.float32)
+            self._matrix = None
+
+    def delete(self, ids):
+        removed = set(ids)
+        with self._lock:
+            keep = [k for k, item_id in enumerate(self._ids) if item_id not in removed]
+            self._ids = [self._ids[k] for k in keep]
+            self._documents = [self._documents[k] for k in keep]
+            self._metadatas = [self._metadatas[k] for k in keep]
+            self._embeddings = [self._embeddings[k] for k in keep]
+            self._index = {item_id: k for k, item_id in enumerate(self._ids)}
+            self._matrix = None
+
+    def count(self):
+        return len(self._ids)
+
+    def get(self, ids=None, include=None, **kwargs):
+        with self._lock:
+            rows = range(len(self._ids)) if ids is None else [self._index[i] for i in ids if i in self._index]
+            result = {
+                'ids': [self._ids[k] for k in rows],
+                'documents': [self._documents[k] for k in rows],
+                'metadatas': [self._metadatas[k] for k in rows]
+            }
+            if include and 'embeddings' in include:
+                result['embeddings'] = [self._embeddings[k] for k in rows]
+            return result
+
+    def query(self, query_embeddings, n_results=10, **kwargs):
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.vstack(self._embeddings) if self._embeddings else np.zeros((0, 0), dtype=np.float32)
+            matrix = self._matrix
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for embedding in query_embeddings:
+            query = np.asarray(embedding, dtype=np.float32)
+            if not len(ids):
+                hits, distances = [], []
+            else:
+                distances = ((matrix - query) ** 2).sum(axis=1)
+                k = min(n_results, len(ids))
+                hits = np.argpartition(distances, k - 1)[:k]
+                hits = hits[np.argsort(distances[hits])]
+            results['ids'].append([ids[k] for k in hits])
+            results['documents'].append([documents[k] for k in hits])
+            results['metadatas'].append([metadatas[k] for k in hits])
+            results['distances'].append([float(distances[k]) for k in hits])
+        return results
+
+
+def build_knowledge_base(collection, embed):
+    """Chunk data/raw the same way the ingest script does and add it to `collection`
+
+    `embed` maps text to a vector (FakeBedrock.embed for offline runs).
+    Returns the number of chunks added.
+    """
+    sources = [
+        (os.path.join(PROJECT_ROOT, "data", "raw"), 'documentation', 'doc'),
+        (os.path.join(PROJECT_ROOT, "data", "raw", "github"), 'github_issue', 'github'),
+    ]
+    added = 0
+    for folder, source, id_prefix in sources:
+        if not os.path.exists(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if not filename.endswith('.txt'):
+                continue
+            with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+                content = f.read()
+            title = document_title(content)
+            chunks = chunk_document(content)
+            if not chunks:
+                continue
+            collection.add(
+                ids=[f"{id_prefix}_{filename}#{chunk['index']}" for chunk in chunks],
+                documents=[chunk['text'] for chunk in chunks],
+                embeddings=[embed(embedding_text(title, chunk)) for chunk in chunks],
+                metadatas=[
+                    {
+                        'source': source,
+                        'filename': filename,
+                        'title': title,
+                        'heading': chunk['heading'],
+                        'chunk_index': chunk['index'],
+                        'chunk_count': len(chunks),
+                        'start': chunk['start'],
+                        'end': chunk['end']
+                    }
+                    for chunk in chunks
+                ]
+            )
+            added += len(chunks)
+    return added
+
+
+class SQLiteConversationStore:
+    """Conversation log in SQLite, standing in for PostgreSQL during benchmarks
+
+    `queue_conversation` has the same signature and return value as
+    backend.database.queue_conversation, so it can replace it in chat.py.
+
+    Args:
+        path: SQLite file, or ':memory:' for a throwaway store
+    """
+
+    def __init__(self, path=':memory:'):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_uuid TEXT UNIQUE,
+                session_id TEXT NOT NULL,
+                user_message TEXT NOT NULL,
+                bot_response TEXT NOT NULL,
+                intent TEXT,
+                response_time_ms INTEGER,
+                time_to_first_token_ms INTEGER,
+                stage_timings_ms TEXT,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                estimated_input_tokens INTEGER,
+                estimated_output_tokens INTEGER,
+                cache_read_tokens INTEGER,
+                cache_write_tokens INTEGER,
+                rating INTEGER,
+                created_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def queue_conversation(self, session_id, user_msg, bot_response, intent, response_time,
+                           time_to_first_token=None, stage_timings=None, input_tokens=None,
+                           output_tokens=None, estimated_input_tokens=None, estimated_output_tokens=None,
+                           cache_read_tokens=None, cache_write_tokens=None):
+        conversation_uuid = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO conversations
+                   (conversation_uuid, session_id, user_message, bot_response, intent,
+                    response_time_ms, time_to_first_token_ms, stage_timings_ms,
+                    input_tokens, output_tokens, estimated_input_tokens, estimated_output_tokens,
+                    cache_read_tokens, cache_write_tokens, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (conversation_uuid, session_id, user_msg, bot_response, intent,
+                 response_time, time_to_first_token,
+                 json.dumps(stage_timings) if stage_timings else None,
+                 input_tokens, output_tokens, estimated_input_tokens, estimated_output_tokens,
+                 cache_read_tokens, cache_write_tokens, time.time())
+            )
+            self._conn.commit()
+        return conversation_uuid
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def intent_counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT intent, COUNT(*) FROM conversations GROUP BY intent ORDER BY COUNT(*) DESC"
+            ).fetchall()
+        return dict(rows)
+
+    def token_totals(self):
+        """Claude tokens summed over all logged turns"""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT SUM(input_tokens), SUM(output_tokens), SUM(cache_read_tokens), SUM(cache_write_tokens)
+                   FROM conversations"""
+            ).fetchone()
+        return dict(zip(('input', 'output', 'cache_read', 'cache_write'), (value or 0 for value in row)))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
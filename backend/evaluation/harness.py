@@ -0,0 +1,361 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import platform
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from backend.evaluation.fakes import FakeBedrock, InMemoryCollection, SQLiteConversationStore, build_knowledge_base
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stages reported for every request, in pipeline order; 'other' is total minus the measured stages
+STAGES = ['classify', 'embed', 'vector_search', 'llm', 'persist', 'other', 'total']
+
+# Questions used when no export is given
+DEFAULT_QUESTIONS = [
+    "How do I set up Google OAuth with Supabase?",
+    "How do I enable Row Level Security on a table?",
+    "How do I upload a file to a storage bucket?",
+    "Why am I getting a 401 error from the REST API?",
+    "How do I subscribe to realtime changes on a table?",
+    "How do I create a table with a foreign key?",
+    "How do I reset a user's password?",
+    "What is the difference between the anon key and the service role key?",
+    "How do I call an edge function from the JavaScript client?",
+    "How do I fix CORS errors when calling Supabase from the browser?",
+    "How do I query rows where a column is null?",
+    "How do I refresh an expired JWT session?",
+    "hi",
+    "thanks, that fixed it!",
+    "tell me a joke",
+]
+
+
+class StageRecorder:
+    """Collects per-stage timings for the request running on the current thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start(self):
+        self._local.stages = {}
+
+    def add(self, stage, ms):
+        stages = getattr(self._local, 'stages', None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + ms
+
+    def finish(self, total_ms):
+        stages = self._local.stages
+        self._local.stages = None
+        measured = sum(stages.values())
+        stages['other'] = max(total_ms - measured, 0.0)
+        stages['total'] = total_ms
+        return stages
+
+    def timed(self, stage, fn):
+        """Wrap `fn` so its wall time is added to `stage`"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+        return wrapper
+
+
+class TimedBedrock:
+    """Bedrock client proxy recording Claude call time as the 'llm' stage
+
+    Embedding calls are timed by the get_embedding wrapper (which also
+    covers embedding cache hits), so they are passed through untimed.
+    """
+
+    def __init__(self, client, recorder):
+        self._client = client
+        self._recorder = recorder
+
+    def invoke_model(self, modelId, body, **kwargs):
+        if 'titan-embed' in modelId:
+            return self._client.invoke_model(modelId=modelId, body=body, **kwargs)
+        return self._recorder.timed('llm', self._client.invoke_model)(modelId=modelId, body=body, **kwargs)
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        start = time.perf_counter()
+        response = self._client.invoke_model_with_response_stream(modelId=modelId, body=body, **kwargs)
+        recorder = self._recorder
+
+        def events():
+            try:
+                yield from response['body']
+            finally:
+                recorder.add('llm', (time.perf_counter() - start) * 1000)
+
+        return dict(response, body=events())
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class TimedCollection:
+    """Collection proxy recording query time as the 'vector_search' stage"""
+
+    def __init__(self, collection, recorder):
+        self._collection = collection
+        self.query = recorder.timed('vector_search', collection.query)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def load_chat_module(bedrock, collection):
+    """Import backend.agents.chat wired to `bedrock` and `collection`
+
+    The shared clients are replaced before chat.py ever creates them, so no
+    chroma_db directory or AWS credentials are needed.
+    """
+    from backend.utils.clients import set_clients
+
+    set_clients(bedrock=bedrock, collection=collection)
+    importlib.import_module('backend.agents.chat')
+
+    # backend.agents re-exports the chat() function under the same name as the module
+    return sys.modules['backend.agents.chat']
+
+
+def reset_caches():
+    """Drop the process-wide embedding, retrieval and answer caches so every run starts cold"""
+    import backend.utils.embeddings as embeddings
+    import backend.utils.retrieval_cache as retrieval_cache
+    import backend.agents.answer_cache as answer_cache
+    embeddings._cache = None
+    retrieval_cache._cache = None
+    answer_cache._cache = None
+
+
+class ChatBenchmark:
+    """Replays questions through chat() against offline stand-ins and times each stage
+
+    Args:
+        bedrock: Bedrock client (FakeBedrock by default)
+        collection: Vector collection (InMemoryCollection loaded from data/raw by default)
+        store: Conversation store with queue_conversation (in-memory SQLite by default)
+        stream: Use chat_stream() and also report time to first token
+    """
+
+    def __init__(self, bedrock=None, collection=None, store=None, stream=False):
+        self.bedrock = bedrock or FakeBedrock()
+        if collection is None:
+            collection = InMemoryCollection()
+            build_knowledge_base(collection, self.bedrock.embed)
+        self.collection = collection
+        self.store = store or SQLiteConversationStore()
+        self.stream = stream
+        self.recorder = StageRecorder()
+
+        os.environ.setdefault('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+        # Keep the caches in memory so runs never read or write the shared cache files
+        os.environ['EMBEDDING_CACHE_PATH'] = ''
+        os.environ['RETRIEVAL_CACHE_PATH'] = ''
+        os.environ['ANSWER_CACHE_EVICTIONS_PATH'] = ''
+        chat_module = load_chat_module(
+            TimedBedrock(self.bedrock, self.recorder),
+            TimedCollection(self.collection, self.recorder)
+        )
+        reset_caches()
+        chat_module.active_sessions.clear()
+        self._original = {
+            name: getattr(chat_module, name)
+            for name in ('classify_intent', 'get_embedding', 'queue_conversation')
+        }
+        chat_module.classify_intent = self.recorder.timed('classify', self._original['classify_intent'])
+        chat_module.get_embedding = self.recorder.timed('embed', self._original['get_embedding'])
+        chat_module.queue_conversation = self.recorder.timed('persist', self.store.queue_conversation)
+        self.chat_module = chat_module
+
+    def close(self):
+        """Restore the chat module's functions"""
+        for name, fn in self._original.items():
+            setattr(self.chat_module, name, fn)
+
+    def run_turn(self, question, session_id):
+        """Send one message; returns the sample dict for it"""
+        self.recorder.start()
+        start = time.perf_counter()
+        ttft_ms = None
+        error = None
+        try:
+            if self.stream:
+                for event in self.chat_module.chat_stream(question, session_id):
+                    if event['type'] == 'token' and ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+            else:
+                self.chat_module.chat(question, session_id)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        stages = self.recorder.finish((time.perf_counter() - start) * 1000)
+        if ttft_ms is not None:
+            stages['ttft'] = ttft_ms
+        return {'stages': stages, 'error': error}
+
+    def run(self, questions, concurrency=8, requests=None, session_turns=1, warmup=0, seed=0):
+        """Replay `questions` with `concurrency` worker threads
+
+        Questions are grouped into sessions of `session_turns` consecutive
+        turns; each session runs on one worker so history builds up as in a
+        real conversation. `requests` turns are sent in total (cycling
+        through the questions), after `warmup` untimed turns.
+
+        Returns a result dict (see summarize()).
+        """
+        requests = requests or len(questions)
+        rng = random.Random(seed)
+        replay = [questions[i % len(questions)] for i in range(requests + warmup)]
+        rng.shuffle(replay)
+
+        for question in replay[:warmup]:
+            self.run_turn(question, str(uuid.uuid4()))
+        replay = replay[warmup:]
+
+        sessions = [replay[i:i + session_turns] for i in range(0, len(replay), session_turns)]
+
+        def run_session(turns):
+            session_id = str(uuid.uuid4())
+            return [self.run_turn(question, session_id) for question in turns]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = [sample for session in executor.map(run_session, sessions) for sample in session]
+        wall_seconds = time.perf_counter() - start
+
+        return summarize(samples, wall_seconds, concurrency, stream=self.stream)
+
+
+def percentiles(values):
+    """p50/p95/p99, mean and max of a list of milliseconds"""
+    if not values:
+        return {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0, 'mean': 0, 'max': 0}
+    array = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        'count': len(values),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'mean': round(float(array.mean()), 2),
+        'max': round(float(array.max()), 2)
+    }
+
+
+def summarize(samples, wall_seconds, concurrency, stream=False):
+    """Aggregate per-request samples into per-stage percentiles and throughput
+
+    A stage that a request never reached (e.g. the LLM for a greeting) is
+    left out of that stage's distribution rather than counted as 0 ms.
+    """
+    stages = {}
+    for stage in STAGES + (['ttft'] if stream else []):
+        values = [s['stages'][stage] for s in samples if stage in s['stages']]
+        stages[stage] = percentiles(values)
+    errors = [s['error'] for s in samples if s['error']]
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_examples': errors[:3],
+        'wall_seconds': round(wall_seconds, 3),
+        'rps': round(len(samples) / wall_seconds, 2) if wall_seconds else 0,
+        'stages': stages
+    }
+
+
+def format_report(result):
+    """Human-readable table for one benchmark result"""
+    lines = [
+        f"Concurrency {result['concurrency']}: {result['requests']} requests in {result['wall_seconds']:.2f}s "
+        f"= {result['rps']:.2f} req/s, {result['errors']} errors",
+        f"  {'stage':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}"
+    ]
+    for stage, stats in result['stages'].items():
+        lines.append(
+            f"  {stage:<14} {stats['count']:>6} {stats['p50']:>9.2f} {stats['p95']:>9.2f} "
+            f"{stats['p99']:>9.2f} {stats['mean']:>9.2f}"
+        )
+    for example in result['error_examples']:
+        lines.append(f"  error: {example}")
+    return '\n'.join(lines)
+
+
+def compare_to_baseline(results, baseline, max_regression=0.2, min_delta_ms=1.0):
+    """Regressions of `results` against a saved baseline report
+
+    A stage regresses when its p95 grows by more than `max_regression`
+    (a fraction) and by at least `min_delta_ms`; throughput regresses when
+    requests per second drop by more than `max_regression`.
+
+    Returns a list of human-readable regression descriptions (empty if none).
+    """
+    by_concurrency = {r['concurrency']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = by_concurrency.get(result['concurrency'])
+        if not base:
+            continue
+        label = f"concurrency {result['concurrency']}"
+        if base['rps'] and result['rps'] < base['rps'] * (1 - max_regression):
+            regressions.append(f"{label}: throughput {base['rps']} -> {result['rps']} req/s")
+        for stage, stats in result['stages'].items():
+            base_stats = base['stages'].get(stage)
+            if not base_stats or not base_stats['count'] or not stats['count']:
+                continue
+            delta = stats['p95'] - base_stats['p95']
+            if delta >= min_delta_ms and stats['p95'] > base_stats['p95'] * (1 + max_regression):
+                regressions.append(f"{label}: {stage} p95 {base_stats['p95']} -> {stats['p95']} ms")
+    return regressions
+
+
+def load_questions(path=None):
+    """Questions to replay
+
+    Accepts a JSON export of get_most_asked_questions() (a list of
+    {'question', 'count'} dicts; each question is repeated `count` times so
+    the replay follows real traffic), a JSON list of strings, or a text file
+    with one question per line. Without a path the built-in sample is used.
+    """
+    if not path:
+        return list(DEFAULT_QUESTIONS)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            questions = []
+            for item in data:
+                if isinstance(item, dict):
+                    questions.extend([item['question']] * max(int(item.get('count', 1)), 1))
+                else:
+                    questions.append(str(item))
+            return questions
+        return [line.strip() for line in f if line.strip()]
+
+
+def export_questions(path, limit=100):
+    """Write get_most_asked_questions() to `path` as JSON for later replays"""
+    from backend.database.analytics import get_most_asked_questions
+    questions = get_most_asked_questions(limit=limit)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(questions, f, indent=2)
+    return len(questions)
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
@@ -0,0 +1,151 @@
+import os
+import json
+import base64
+import asyncio
+import threading
+from urllib.parse import quote
+import boto3
+import httpx
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.eventstream import EventStreamBuffer
+from dotenv import load_dotenv
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+
+class BedrockError(Exception):
+    """A Bedrock runtime error; the message starts with the AWS error type
+
+    Error handling in chat.py matches on names like ThrottlingException in
+    str(e), the same way it does for botocore's ClientError.
+    """
+
+    def __init__(self, error_type, message, status=None):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.status = status
+
+
+class AsyncBedrockClient:
+    """asyncio client for the Bedrock runtime InvokeModel APIs
+
+    Requests are signed with botocore's SigV4 signer and sent over a pooled
+    httpx connection, so one event loop can hold hundreds of calls in
+    flight without a thread each. Credentials resolve like boto3's
+    (explicit keys, then the usual environment/profile/instance chain).
+
+    Args:
+        region: AWS region of the Bedrock runtime endpoint
+        aws_access_key_id: Explicit access key, or None for the default chain
+        aws_secret_access_key: Explicit secret key, or None for the default chain
+        max_connections: Open HTTP connections to Bedrock
+        timeout: Seconds allowed for connecting and between streamed reads
+    """
+
+    def __init__(self, region=None, aws_access_key_id=None, aws_secret_access_key=None,
+                 max_connections=200, timeout=60.0):
+        session = boto3.Session(
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            region_name=region
+        )
+        self.region = session.region_name or 'us-east-1'
+        self.endpoint = f"https://bedrock-runtime.{self.region}.amazonaws.com"
+        self._credentials = session.get_credentials()
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def _signed_request(self, model_id, action, body, accept):
+        if self._credentials is None:
+            raise BedrockError('UnrecognizedClientException', 'No AWS credentials found')
+        url = f"{self.endpoint}/model/{quote(model_id, safe='')}/{action}"
+        request = AWSRequest(method='POST', url=url, data=body, headers={
+            'Content-Type': 'application/json',
+            'Accept': accept
+        })
+        SigV4Auth(self._credentials.get_frozen_credentials(), 'bedrock', self.region).add_auth(request)
+        return url, dict(request.headers.items())
+
+    @staticmethod
+    def _raise_for_error(response, content):
+        if response.status_code < 400:
+            return
+        error_type = response.headers.get('x-amzn-ErrorType', '').split(':')[0]
+        try:
+            message = json.loads(content).get('message', '')
+        except ValueError:
+            message = content.decode('utf-8', errors='replace')
+        raise BedrockError(error_type or f"HTTP{response.status_code}", message, response.status_code)
+
+    async def invoke_model(self, modelId, body):
+        """Invoke a model and return its decoded JSON response body"""
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        url, headers = self._signed_request(modelId, 'invoke', body, 'application/json')
+        response = await self._http.post(url, content=body, headers=headers)
+        self._raise_for_error(response, response.content)
+        return response.json()
+
+    async def invoke_model_stream(self, modelId, body):
+        """Invoke a model with a streamed response, yielding each decoded chunk payload"""
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        url, headers = self._signed_request(
+            modelId, 'invoke-with-response-stream', body, 'application/vnd.amazon.eventstream'
+        )
+        async with self._http.stream('POST', url, content=body, headers=headers) as response:
+            if response.status_code >= 400:
+                self._raise_for_error(response, await response.aread())
+
+            events = EventStreamBuffer()
+            async for data in response.aiter_bytes():
+                events.add_data(data)
+                for message in events:
+                    message_type = message.headers.get(':message-type')
+                    if message_type == 'exception':
+                        payload = json.loads(message.payload or b'{}')
+                        raise BedrockError(message.headers.get(':exception-type', 'Exception'),
+                                           payload.get('message', ''))
+                    if message_type == 'error':
+                        raise BedrockError(message.headers.get(':error-code', 'Error'),
+                                           message.headers.get(':error-message', ''))
+                    if message.headers.get(':event-type') == 'chunk':
+                        yield json.loads(base64.b64decode(json.loads(message.payload)['bytes']))
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_client = None
+_client_loop = None
+_client_lock = threading.Lock()
+
+
+def get_async_bedrock():
+    """Bedrock client for the running event loop, configured from AWS_* env vars"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # httpx connections belong to the loop they were opened on
+    if _client is None or _client_loop is not loop:
+        with _client_lock:
+            if _client is None or _client_loop is not loop:
+                _client = AsyncBedrockClient(
+                    region=os.getenv('AWS_REGION'),
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                    max_connections=int(os.getenv('BEDROCK_MAX_CONNECTIONS', '200'))
+                )
+                _client_loop = loop
+    return _client
+
+
+async def close_async_bedrock():
+    """Close the pooled connections (call on application shutdown)"""
+    global _client, _client_loop
+    if _client is not None:
+        client, _client, _client_loop = _client, None, None
+        await client.aclose()
@@ -0,0 +1,160 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry time-to-live
+
+    Args:
+        maxsize: Maximum number of entries; the least recently used is evicted
+        ttl: Seconds an entry stays valid, or None to keep entries until evicted
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Snapshot of live (key, value) pairs, least recently used first"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and (item[1] is None or item[1] > time.monotonic())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+        }
+
+
+def _etag(payload):
+    body = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+class CachedPayload:
+    """A computed JSON payload shared by every request for `ttl` seconds
+
+    The first request after expiry recomputes it while concurrent callers
+    wait for that result instead of computing their own, so polling costs
+    one computation per TTL window. Each payload carries an ETag derived
+    from its content for If-None-Match revalidation.
+
+    Args:
+        compute: Zero-argument function returning a JSON-serializable payload
+        ttl: Seconds a payload is reused; 0 computes on every call
+    """
+
+    def __init__(self, compute, ttl=5.0):
+        self.compute = compute
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._payload = None
+        self._etag = None
+        self._expires_at = 0.0
+        self.hits = 0
+        self.computations = 0
+
+    def get(self):
+        """(payload, etag), computing the payload if it has expired
+
+        Exceptions from compute() propagate and are not cached.
+        """
+        if not self.ttl:
+            payload = self.compute()
+            return payload, _etag(payload)
+
+        with self._lock:
+            if self._payload is not None and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._payload, self._etag
+
+            payload = self.compute()
+            self._payload = payload
+            self._etag = _etag(payload)
+            self._expires_at = time.monotonic() + self.ttl
+            self.computations += 1
+            return self._payload, self._etag
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+
+    def stats(self):
+        lookups = self.hits + self.computations
+        return {
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'computations': self.computations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+        }
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value names `etag` (or is `*`)"""
+    if not if_none_match or not etag:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag.strip('"') == etag:
+            return True
+    return False
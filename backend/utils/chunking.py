@@ -0,0 +1,229 @@
+import re
+
+# Defaults sized so 3 retrieved chunks are a little more context than the old 2 x 800-char prefixes
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_CHUNK_OVERLAP = 150
+
+MARKDOWN_HEADING = re.compile(r'^#{1,6}\s+\S')
+SECTION_LABEL = re.compile(r'^[A-Z][A-Z/ ]{2,}:\s*$')   # e.g. "PROBLEM:", "DISCUSSION/SOLUTIONS:"
+HEADER_RULE = re.compile(r'^={10,}\s*$')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _split_lines(text):
+    """Lines with their (start, end) offsets; end excludes the newline"""
+    lines = []
+    pos = 0
+    for line in text.split('\n'):
+        lines.append((line, pos, pos + len(line)))
+        pos += len(line) + 1
+    return lines
+
+
+def document_title(text):
+    """Title from the scraper header ("Title: ..." for docs, "Issue #N: ..." for issues)"""
+    first_line = text.split('\n', 1)[0].strip()
+    if first_line.startswith('Title:'):
+        return first_line[len('Title:'):].strip()
+    return first_line
+
+
+def _blocks(text):
+    """Split a document into (start, end, heading) blocks
+
+    A block is a paragraph, a fenced code block (never split) or a single
+    line of scraped docs where paragraphs are not separated by blank lines.
+    `heading` is set on blocks that are themselves a section heading.
+    """
+    lines = _split_lines(text)
+    blocks = []
+    i = 0
+
+    # Skip the scraper header (Title/URL/Labels ... =====)
+    for j, (line, _, _) in enumerate(lines[:10]):
+        if HEADER_RULE.match(line):
+            i = j + 1
+            break
+
+    paragraph_start = None
+    paragraph_end = None
+
+    def close_paragraph():
+        nonlocal paragraph_start, paragraph_end
+        if paragraph_start is not None:
+            blocks.append((paragraph_start, paragraph_end, None))
+        paragraph_start = paragraph_end = None
+
+    while i < len(lines):
+        line, start, end = lines[i]
+        stripped = line.strip()
+
+        if not stripped:
+            close_paragraph()
+            i += 1
+            continue
+
+        if stripped.startswith('```'):
+            close_paragraph()
+            j = i + 1
+            while j < len(lines) and not lines[j][0].strip().startswith('```'):
+                j += 1
+            j = min(j, len(lines) - 1)
+            blocks.append((start, lines[j][2], None))
+            i = j + 1
+            continue
+
+        # Scraped docs mark headings with an anchor line containing just "#"
+        next_is_anchor = i + 1 < len(lines) and lines[i + 1][0].strip() == '#'
+        if MARKDOWN_HEADING.match(stripped) or SECTION_LABEL.match(stripped) or next_is_anchor:
+            close_paragraph()
+            heading = stripped.lstrip('#').strip().rstrip(':')
+            block_end = lines[i + 1][2] if next_is_anchor else end
+            blocks.append((start, block_end, heading))
+            i += 2 if next_is_anchor else 1
+            continue
+
+        if stripped == '#':
+            i += 1
+            continue
+
+        if paragraph_start is None:
+            paragraph_start = start
+        paragraph_end = end
+        i += 1
+
+    close_paragraph()
+    return blocks
+
+
+def _split_long_block(text, start, end, chunk_size):
+    """Break an oversized block at sentence, line or word boundaries"""
+    pieces = []
+    piece_start = start
+    min_cut = chunk_size // 4
+    while end - piece_start > chunk_size:
+        window = text[piece_start:piece_start + chunk_size]
+        cut = None
+        for match in SENTENCE_END.finditer(window):
+            cut = match.end()
+        if not cut or cut < min_cut:
+            newline = window.rfind('\n')
+            space = window.rfind(' ')
+            if newline > min_cut:
+                cut = newline + 1
+            elif space > min_cut:
+                cut = space + 1
+            else:
+                cut = chunk_size
+        pieces.append((piece_start, piece_start + cut))
+        piece_start += cut
+    pieces.append((piece_start, end))
+    return pieces
+
+
+def chunk_document(text, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP):
+    """Split a document into overlapping, heading-aware chunks
+
+    Chunks are packed from whole paragraphs and code blocks up to
+    `chunk_size` characters. A heading starts a new chunk, and consecutive
+    chunks within a section share up to `overlap` characters of trailing
+    blocks. Every chunk's text is exactly text[start:end], so neighbouring
+    hits from the same file can be stitched back together by offset.
+
+    Returns:
+        list of dicts with 'index', 'text', 'start', 'end' and 'heading'
+    """
+    spans = []
+    for start, end, heading in _blocks(text):
+        if end - start > chunk_size and heading is None:
+            spans.extend((s, e, None) for s, e in _split_long_block(text, start, end, chunk_size))
+        else:
+            spans.append((start, end, heading))
+
+    chunks = []
+    current = []          # spans in the chunk being built
+    current_heading = ''  # heading the current chunk belongs to
+    section_heading = ''
+
+    def emit():
+        if current:
+            chunk_start, chunk_end = current[0][0], current[-1][1]
+            chunks.append({
+                'index': len(chunks),
+                'text': text[chunk_start:chunk_end],
+                'start': chunk_start,
+                'end': chunk_end,
+                'heading': current_heading
+            })
+
+    for span in spans:
+        start, end, heading = span
+
+        if heading is not None:
+            section_heading = heading
+            # Fold a near-empty section (e.g. a heading followed straight by a subheading) into this one
+            if current and current[-1][1] - current[0][0] < chunk_size // 4 and end - current[0][0] <= chunk_size:
+                current.append(span)
+                continue
+            # New section: close the running chunk, no overlap across sections
+            emit()
+            current = [span]
+            current_heading = heading
+            continue
+
+        chunk_start = current[0][0] if current else start
+        if current and end - chunk_start > chunk_size:
+            emit()
+            # Carry trailing blocks (up to `overlap` chars) into the next chunk
+            carried = []
+            for prev in reversed(current):
+                if prev[2] is not None or end - prev[0] > chunk_size or current[-1][1] - prev[0] > overlap:
+                    break
+                carried.insert(0, prev)
+            current = carried
+            current_heading = section_heading
+
+        current.append(span)
+
+    emit()
+    return chunks
+
+
+def embedding_text(title, chunk):
+    """Text sent to the embedding model: document title and section give each chunk context"""
+    heading = f" > {chunk['heading']}" if chunk['heading'] else ''
+    return f"{title}{heading}\n{chunk['text']}"
+
+
+def merge_adjacent_chunks(documents, metadatas):
+    """Stitch overlapping chunks of the same file into one passage
+
+    Takes Chroma query results (documents and metadatas for one query) and
+    returns (documents, metadatas) in rank order, with each later chunk that
+    overlaps an earlier hit from the same file folded into that hit.
+    """
+    merged_docs = []
+    merged_meta = []
+    for doc, metadata in zip(documents, metadatas):
+        if 'start' not in metadata:
+            merged_docs.append(doc)
+            merged_meta.append(metadata)
+            continue
+        for k, existing in enumerate(merged_meta):
+            if existing.get('filename') != metadata.get('filename') or 'start' not in existing:
+                continue
+            if metadata['start'] <= existing['end'] and metadata['end'] >= existing['start']:
+                if metadata['start'] >= existing['start']:
+                    merged_docs[k] = merged_docs[k] + doc[existing['end'] - metadata['start']:]
+                else:
+                    merged_docs[k] = doc + merged_docs[k][metadata['end'] - existing['start']:]
+                merged_meta[k] = dict(
+                    existing,
+                    start=min(existing['start'], metadata['start']),
+                    end=max(existing['end'], metadata['end'])
+                )
+                break
+        else:
+            merged_docs.append(doc)
+            merged_meta.append(dict(metadata))
+    return merged_docs, merged_meta
@@ -0,0 +1,159 @@
+"""
+Shared Chroma and Bedrock clients, created on first use
+
+Importing the chat pipeline opens nothing: the Bedrock client is built by
+the first embedding or Claude call and the Chroma client and collection by
+the first vector search, and every module in the process shares them. A
+missing chroma_db therefore only fails the requests that search, and the
+greeting/thanks fast paths never pay for either client.
+
+warm_up() creates everything up front. Call it at startup (WARM_UP=1 does
+this for both servers) so the first request is not the slow one; with a
+pre-fork server such as `gunicorn --preload` it runs once in the master and
+the workers inherit the imported modules, the Bedrock client and the loaded
+retrieval indexes. The Chroma client holds SQLite connections, which must
+not cross a fork, so each worker drops it, and Chroma's own per-path client
+cache, and reopens its own on first use.
+"""
+import os
+import sys
+import time
+import threading
+from dotenv import load_dotenv
+from backend.utils.embedding_providers import collection_name, get_embedding_provider
+from backend.utils.vector_store import get_vector_store, vector_store_backend
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+CHROMA_PATH = os.path.join(PROJECT_ROOT, "chroma_db")
+
+_bedrock = None
+_chroma = None
+_collections = {}
+_missing_stores = set()
+_overrides = {}
+_lock = threading.Lock()
+
+
+def get_bedrock():
+    """Process-wide bedrock-runtime client configured from AWS_* env vars
+
+    boto3 clients are thread-safe, so one is shared by every request.
+    """
+    global _bedrock
+    if _bedrock is None:
+        with _lock:
+            if _bedrock is None:
+                import boto3
+                _bedrock = boto3.client(
+                    service_name='bedrock-runtime',
+                    region_name=os.getenv('AWS_REGION'),
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                )
+    return _bedrock
+
+
+def get_chroma_client():
+    """Process-wide Chroma client on chroma_db/"""
+    global _chroma
+    if _chroma is None:
+        with _lock:
+            if _chroma is None:
+                import chromadb
+                _chroma = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma
+
+
+def get_collection(name=None):
+    """The knowledge base collection (default: the configured embedding provider's)
+
+    With VECTOR_STORE=numpy this is the in-process NumpyVectorStore, or the
+    Chroma collection if that store has not been built. Raises the Chroma
+    error if the collection has not been ingested yet; the next call tries
+    again.
+    """
+    name = name or collection_name()
+    if name in _overrides:
+        return _overrides[name]
+    if vector_store_backend() == 'numpy':
+        store = get_vector_store(name)
+        if store is not None:
+            return store
+        if name not in _missing_stores:
+            _missing_stores.add(name)
+            print(f"No NumPy vector store for {name}; using Chroma (build it with `python -m backend.utils.vector_store`)")
+
+    collection = _collections.get(name)
+    if collection is None:
+        client = get_chroma_client()
+        with _lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = _collections[name] = client.get_collection(name=name)
+    return collection
+
+
+def set_clients(bedrock=None, collection=None):
+    """Use these clients in this process instead of creating them (benchmarks)"""
+    global _bedrock
+    with _lock:
+        if bedrock is not None:
+            _bedrock = bedrock
+        if collection is not None:
+            _overrides[collection_name()] = collection
+
+
+def _reset_after_fork():
+    global _chroma, _lock
+    # A worker forked while another thread held the lock would otherwise never acquire it
+    _lock = threading.Lock()
+    _chroma = None
+    _collections.clear()
+    # Chroma also caches its System (and SQLite connections) per path at class
+    # level, so a new PersistentClient would reuse the parent's without this
+    if 'chromadb' in sys.modules:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def warm_up_enabled():
+    """Startup warm-up is off unless WARM_UP is set to 1/true"""
+    return os.getenv('WARM_UP', '0').lower() in ('1', 'true', 'yes')
+
+
+def warm_up():
+    """Create the shared clients and load the retrieval indexes now
+
+    A step that fails (no chroma_db yet, no AWS region) is reported and
+    skipped; it is retried lazily by the first request that needs it.
+
+    Returns:
+        Dict of step name to milliseconds (None for a failed step)
+    """
+    from backend.utils.lexical import get_lexical_index
+
+    steps = [
+        ('bedrock', get_bedrock),
+        ('embedding_provider', get_embedding_provider),
+        ('collection', get_collection),
+        ('lexical_index', get_lexical_index),
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e:
+            print(f"Warm-up: {name} failed: {e}")
+            timings[name] = None
+    print(f"Warm-up: {timings}")
+    return timings
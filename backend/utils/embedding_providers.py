@@ -0,0 +1,214 @@
+"""
+Embedding providers
+
+The knowledge base and the questions searched against it must be embedded
+by the same model. EMBEDDING_PROVIDER picks one:
+
+    titan    Bedrock amazon.titan-embed-text-v1 (default; 1536 dims, network)
+    minilm   all-MiniLM-L6-v2 on the ONNX runtime bundled with chromadb
+             (384 dims, local CPU; the model is downloaded on first use)
+    hashing  signed feature hashing of words, word pairs and character
+             trigrams (1024 dims, local, no model at all)
+
+Local providers encode a whole batch of texts per call. Each provider's
+vectors live in their own Chroma collection (collection_name()), so
+switching providers never mixes incompatible vectors: run
+scripts/load_data_to_chromadb.py with the new provider before serving it.
+"""
+import os
+import json
+import math
+import zlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from backend.utils.lexical import tokenize
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Collection of the default (Titan) provider; other providers get a suffixed name
+BASE_COLLECTION = "supabase_knowledge_base"
+
+
+class EmbeddingProvider:
+    """Turns texts into vectors
+
+    Subclasses set `name` (the EMBEDDING_PROVIDER value), `model_id` (part
+    of the embedding cache key and the ingest manifest), `dimensions` and
+    `local` (False when every call is a network round-trip).
+    """
+    name = None
+    model_id = None
+    dimensions = None
+    local = True
+
+    def embed(self, texts):
+        """Embed a batch of texts; returns one list of floats per text"""
+        raise NotImplementedError
+
+    @property
+    def collection_name(self):
+        return collection_name(self.name)
+
+
+class TitanProvider(EmbeddingProvider):
+    """Bedrock Titan embeddings, one request per text
+
+    Args:
+        client: bedrock-runtime client (the process-wide one from
+            get_bedrock() if omitted)
+    """
+    name = 'titan'
+    model_id = 'amazon.titan-embed-text-v1'
+    dimensions = 1536
+    local = False
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            # clients imports this module, so look it up on use
+            from backend.utils.clients import get_bedrock
+            return get_bedrock()
+        return self._client
+
+    def embed(self, texts):
+        embeddings = []
+        for text in texts:
+            response = self.client.invoke_model(
+                modelId=self.model_id,
+                body=json.dumps({"inputText": text[:8000]})  # Titan limit is ~8K chars
+            )
+            embeddings.append(json.loads(response['body'].read())['embedding'])
+        return embeddings
+
+
+class MiniLMProvider(EmbeddingProvider):
+    """all-MiniLM-L6-v2 sentence embeddings on the CPU
+
+    Uses the ONNX model that chromadb ships for its default embedding
+    function, so no extra dependency is needed. Batches are tokenized and
+    run through the model together; vectors come back unit length.
+    """
+    name = 'minilm'
+    model_id = 'all-MiniLM-L6-v2'
+    dimensions = 384
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        self._model = ONNXMiniLM_L6_V2(preferred_providers=['CPUExecutionProvider'])
+
+    def embed(self, texts):
+        if not texts:
+            return []
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in self._model(list(texts))]
+
+
+class HashingProvider(EmbeddingProvider):
+    """Model-free embeddings from hashed lexical features
+
+    Words (with the lexical index's tokenizer, so identifiers like auth.uid
+    also yield their parts), adjacent word pairs and character trigrams are
+    each hashed to a signed dimension with a sublinear term-frequency
+    weight, and every row is scaled to unit length. Texts sharing words,
+    phrases or word stems end up close. Useful offline and as a cheap
+    baseline; it has no notion of synonyms.
+
+    Args:
+        dimensions: Vector size
+    """
+    name = 'hashing'
+
+    # Relative weight of each feature type
+    WORD_WEIGHT = 1.0
+    PAIR_WEIGHT = 0.7
+    TRIGRAM_WEIGHT = 0.3
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+        self.model_id = f"feature-hashing-{dimensions}"
+
+    def _features(self, text):
+        """Feature -> weight for one text"""
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[('w', term)] = counts.get(('w', term), 0) + 1
+            padded = f"<{term}>"
+            for i in range(len(padded) - 2):
+                key = ('c', padded[i:i + 3])
+                counts[key] = counts.get(key, 0) + 1
+        for pair in zip(terms, terms[1:]):
+            key = ('p', ' '.join(pair))
+            counts[key] = counts.get(key, 0) + 1
+
+        weights = {'w': self.WORD_WEIGHT, 'p': self.PAIR_WEIGHT, 'c': self.TRIGRAM_WEIGHT}
+        return {
+            f"{kind}:{value}": weights[kind] * (1 + math.log(tf))
+            for (kind, value), tf in counts.items()
+        }
+
+    def embed(self, texts):
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text).items():
+                h = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                columns.append(h % self.dimensions)
+                values.append(weight if h & 0x80000000 else -weight)
+
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)),
+                  np.array(values, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1)
+        return matrix.tolist()
+
+
+PROVIDERS = {
+    'titan': TitanProvider,
+    'minilm': MiniLMProvider,
+    'hashing': HashingProvider
+}
+
+
+def collection_name(provider_name=None):
+    """Chroma collection holding the vectors of `provider_name` (default: the configured one)"""
+    provider_name = provider_name or embedding_provider_name()
+    if provider_name == 'titan':
+        return BASE_COLLECTION
+    return f"{BASE_COLLECTION}__{provider_name}"
+
+
+def embedding_provider_name():
+    """The EMBEDDING_PROVIDER setting (titan unless configured)"""
+    name = os.getenv('EMBEDDING_PROVIDER', 'titan').lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}; expected one of {', '.join(PROVIDERS)}")
+    return name
+
+
+def create_embedding_provider(name, **kwargs):
+    """A new provider instance by name"""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {name!r}; expected one of {', '.join(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider():
+    """Process-wide provider selected by EMBEDDING_PROVIDER"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_embedding_provider(embedding_provider_name())
+    return _provider
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from dotenv import load_dotenv
+from backend.utils.cache import LRUCache
+from backend.utils.clients import get_bedrock
+from backend.utils.embedding_providers import get_embedding_provider
+from backend.utils.rate_limit import is_throttling_error
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# An embedding call slower than EMBED_SLOW_MS, or a throttled one, marks the
+# service degraded for EMBED_DEGRADED_SECONDS; chat() then answers from
+# lexical search alone instead of waiting on Bedrock
+EMBED_SLOW_MS = float(os.getenv('EMBED_SLOW_MS', '2000'))
+EMBED_DEGRADED_SECONDS = float(os.getenv('EMBED_DEGRADED_SECONDS', '30'))
+
+_degraded_until = 0.0
+
+
+def normalize_text(text):
+    """Normalize a query for cache lookups (case and whitespace insensitive)"""
+    return ' '.join(text.lower().split())
+
+
+def cache_key(text, model_id):
+    normalized = normalize_text(text)
+    return hashlib.sha256(f"{model_id}\0{normalized}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier cache of query embeddings keyed by normalized text + model id
+
+    The memory tier is an LRU with TTL. The optional persistent tier is a
+    SQLite file that survives restarts and is shared by every worker on the
+    host; hits there are promoted into memory.
+
+    Args:
+        maxsize: Entries kept in the memory tier
+        ttl: Seconds an entry stays in the memory tier
+        path: SQLite file for the persistent tier, or None to disable it
+    """
+
+    def __init__(self, maxsize=10000, ttl=86400, path=None):
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.path = path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.miss_ms_total = 0.0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model_id TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            self._db.commit()
+
+    def get(self, text, model_id):
+        key = cache_key(text, model_id)
+
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            with self._stats_lock:
+                self.memory_hits += 1
+            return embedding
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?;", (key,)
+                ).fetchone()
+            if row:
+                embedding = array('f', row[0]).tolist()
+                self.memory.set(key, embedding)
+                with self._stats_lock:
+                    self.disk_hits += 1
+                return embedding
+
+        return None
+
+    def put(self, text, model_id, embedding):
+        key = cache_key(text, model_id)
+        self.memory.set(key, embedding)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, model_id, vector, created_at) VALUES (?, ?, ?, ?);",
+                        (key, model_id, array('f', embedding).tobytes(), time.time())
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing embedding cache: {e}")
+
+    def record_miss(self, elapsed_ms):
+        with self._stats_lock:
+            self.misses += 1
+            self.miss_ms_total += elapsed_ms
+
+    def clear(self):
+        self.memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings;")
+                self._db.commit()
+
+    def stats(self):
+        with self._stats_lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            avg_miss_ms = self.miss_ms_total / self.misses if self.misses else 0
+            return {
+                'memory_size': len(self.memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'bedrock_calls_saved': hits,
+                'avg_bedrock_ms': round(avg_miss_ms, 2),
+                'estimated_ms_saved': round(hits * avg_miss_ms, 2),
+                'persistent': self._db is not None
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide embedding cache configured from EMBEDDING_CACHE_* env vars"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    maxsize=int(os.getenv('EMBEDDING_CACHE_SIZE', '10000')),
+                    ttl=float(os.getenv('EMBEDDING_CACHE_TTL', '86400')),
+                    path=os.getenv('EMBEDDING_CACHE_PATH') or None
+                )
+    return _cache
+
+
+def get_embedding_cache_stats():
+    """Embedding cache hit/miss counters, or None if the cache is unused"""
+    return _cache.stats() if _cache is not None else None
+
+
+def embedding_degraded():
+    """True while the embedding service is considered slow or throttled"""
+    return time.monotonic() < _degraded_until
+
+
+def _record_call(start, error=None):
+    """Track embedding latency and throttling; returns the call's milliseconds"""
+    global _degraded_until
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms > EMBED_SLOW_MS or (error is not None and is_throttling_error(error)):
+        _degraded_until = time.monotonic() + EMBED_DEGRADED_SECONDS
+    return elapsed_ms
+
+
+def get_embedding(text, bedrock_client=None, model_id=None):
+    """Embed `text` with the configured provider, serving repeats from the embedding cache
+
+    Titan calls go through `bedrock_client` (the shared client by default);
+    local providers ignore it.
+    """
+    provider = get_embedding_provider()
+    model_id = model_id or provider.model_id
+    cache = get_embedding_cache()
+    embedding = cache.get(text, model_id)
+    if embedding is not None:
+        return embedding
+
+    start = time.perf_counter()
+    if provider.local:
+        embedding = provider.embed([text])[0]
+        cache.record_miss((time.perf_counter() - start) * 1000)
+        cache.put(text, model_id, embedding)
+        return embedding
+
+    try:
+        response = (bedrock_client or get_bedrock()).invoke_model(
+            modelId=model_id,
+            body=json.dumps({"inputText": text})
+        )
+        embedding = json.loads(response['body'].read())['embedding']
+    except Exception as e:
+        _record_call(start, e)
+        raise
+    cache.record_miss(_record_call(start))
+
+    cache.put(text, model_id, embedding)
+    return embedding
+
+
+async def get_embedding_async(text, bedrock_client, model_id=None):
+    """get_embedding() for an AsyncBedrockClient, sharing the same cache
+
+    Local providers encode in a worker thread so the event loop keeps serving.
+    """
+    provider = get_embedding_provider()
+    model_id = model_id or provider.model_id
+    cache = get_embedding_cache()
+    embedding = cache.get(text, model_id)
+    if embedding is not None:
+        return embedding
+
+    start = time.perf_counter()
+    if provider.local:
+        embedding = (await asyncio.to_thread(provider.embed, [text]))[0]
+        cache.record_miss((time.perf_counter() - start) * 1000)
+        cache.put(text, model_id, embedding)
+        return embedding
+
+    try:
+        response = await bedrock_client.invoke_model(
+            modelId=model_id,
+            body=json.dumps({"inputText": text})
+        )
+        embedding = response['embedding']
+    except Exception as e:
+        _record_call(start, e)
+        raise
+    cache.record_miss(_record_call(start))
+
+    cache.put(text, model_id, embedding)
+    return embedding
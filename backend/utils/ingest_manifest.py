@@ -0,0 +1,62 @@
+import os
+import json
+import hashlib
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Manifest of what is currently embedded in Chroma, kept next to the Chroma data
+MANIFEST_PATH = os.path.join(PROJECT_ROOT, "chroma_db", "ingest_manifest.json")
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(provider_name='titan'):
+    """Manifest of the collection embedded by `provider_name` (see embedding_providers)"""
+    if provider_name == 'titan':
+        return MANIFEST_PATH
+    return os.path.join(PROJECT_ROOT, "chroma_db", f"ingest_manifest__{provider_name}.json")
+
+
+def content_hash(text):
+    """Stable SHA-256 hex digest of a string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def metadata_hash(metadata):
+    """Hash of a chunk's metadata, so offset/heading changes are detected without re-embedding"""
+    return content_hash(json.dumps(metadata, sort_keys=True))
+
+
+def empty_manifest(settings):
+    return {'version': MANIFEST_VERSION, 'settings': settings, 'files': {}}
+
+
+def load_manifest(settings, path=MANIFEST_PATH):
+    """Load the manifest, or an empty one if missing or built with different settings
+
+    `settings` captures everything that changes chunk boundaries or vectors
+    (chunk size, overlap, embedding model). A manifest built with other
+    settings is ignored so every file is re-embedded.
+
+    Returns (manifest, existed) where `existed` is False when starting over.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return empty_manifest(settings), False
+
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        print("Ingest settings changed since the last run; re-indexing everything")
+        return empty_manifest(settings), False
+    return manifest, True
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Atomically write the manifest"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
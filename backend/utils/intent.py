@@ -0,0 +1,362 @@
+import threading
+from functools import lru_cache
+from backend.utils.cache import LRUCache
+
+# Keyword lists used by intent classification and the hallucination guards in backend/agents/chat.py.
+# Matching is plain substring matching on the lowercased text, as before.
+KEYWORDS = {
+    # Supabase/tech keywords in the current message
+    'supabase': [
+        'supabase', 'database', 'postgres', 'sql', 'table', 'column',
+        'auth', 'authentication', 'login', 'signup', 'password',
+        'storage', 'bucket', 'upload', 'download',
+        'api', 'rest', 'client', 'sdk', 'javascript', 'react', 'next',
+        'realtime', 'subscription', 'websocket', 'broadcast',
+        'rls', 'row level security', 'policy', 'permission',
+        'query', 'insert', 'update', 'delete', 'select',
+        'oauth', 'social login',
+        'error', '502', '500', '401', '403', '404', 'cors',
+        'jwt', 'token', 'session', 'deploy', 'hosting'
+    ],
+    # Supabase context in earlier messages of the conversation
+    'context': [
+        'supabase', 'database', 'postgres', 'sql', 'table', 'column',
+        'auth', 'authentication', 'login', 'signup', 'user', 'password',
+        'storage', 'bucket', 'upload', 'download', 'file',
+        'api', 'rest', 'client', 'sdk', 'javascript', 'react', 'next',
+        'realtime', 'subscription', 'websocket', 'broadcast',
+        'rls', 'row level security', 'policy', 'permission',
+        'query', 'insert', 'update', 'delete', 'select',
+        'oauth', 'google', 'facebook', 'github', 'social login',
+        'error', 'cors', 'jwt', 'token', 'session', 'deploy', 'hosting'
+    ],
+    # Entertainment/Personal
+    'entertainment': [
+        'joke', 'funny', 'laugh', 'story', 'sing', 'song',
+        'movie', 'music', 'game', 'play', 'favorite color',
+        'hobby', 'dream', 'feel', 'emotion', 'tell me about yourself',
+        'tell me about urself', 'about yourself', 'about you',
+        'who are you', 'what are you', 'are you human', 'are you robot',
+        'how old are you', 'where are you from', 'who created you',
+        'who made you', 'who built you'
+    ],
+    # Personal questions that should ALWAYS be off_topic (checked before Supabase keywords)
+    'personal': [
+        'tell me about yourself', 'tell me about urself', 'about yourself',
+        'who are you', 'what are you', 'who made you', 'who built you',
+        'who created you', 'are you human', 'are you robot', 'are you ai',
+        'how old are you', 'where are you from'
+    ],
+    # General Knowledge
+    'general_knowledge': [
+        'weather', 'time', 'date', 'president', 'news', 'celebrity',
+        'cook', 'recipe', 'capital', 'mountain', 'ocean', 'country',
+        'sport', 'team', 'win', 'lose', 'score',
+        'stock', 'invest', 'bitcoin', 'crypto', 'exchange rate',
+        'lose weight', 'diet', 'exercise', 'health', 'doctor',
+        'meaning of life', 'philosophy', 'religion', 'politics'
+    ],
+    # Non-Supabase tech
+    'other_tech': [
+        'mongodb', 'mysql', 'firebase', 'aws', 'azure', 'docker',
+        'kubernetes', 'redis', 'graphql', 'prisma', 'django'
+    ],
+    # Thanks/Goodbye
+    'thanks': [
+        'thank', 'thx', 'appreciate', "that's it", "thats it",
+        'perfect', 'got it', 'understood', 'bye', 'goodbye',
+        'see you', 'later', 'have a good', 'take care'
+    ],
+    # Praise/Compliments
+    'praise': [
+        'amazing', 'awesome', 'great job', 'helpful', 'impressive',
+        'smart', 'clever', 'brilliant', 'inspiration', 'best',
+        'perfect answer', 'exactly what', 'you rock'
+    ],
+    # Follow-up patterns
+    'followup': [
+        'yes', 'no', 'ok', 'okay', 'sure', 'right', 'correct',
+        'what about', 'how about', 'and', 'also', 'but', 'however',
+        'can you', 'could you', 'would you', 'please', 'show me',
+        'explain', 'tell me', 'what if', 'why', 'when', 'where',
+        'how do i', 'how can i', 'what is', 'is it', 'does it',
+        'another', 'more', 'else', 'instead', 'different', 'other'
+    ],
+    # Hallucination guards
+    'pricing': ['cost', 'price', 'pricing', 'how much', 'expensive', 'pay', 'subscription', 'plan'],
+    'unsupported_platform': ['azure', 'heroku', 'digital ocean', 'digitalocean', 'render'],
+    'roadmap': ['when will', 'roadmap', 'future', 'upcoming', 'release', 'next version'],
+    # Short check for strong Supabase context in vague messages
+    'supabase_check': ['supabase', 'database', 'auth', 'storage', 'api', 'table', 'query', 'rls', 'realtime'],
+    # Recent topics summarised in the prompt
+    'topic': [
+        'oauth', 'google auth', 'facebook', 'auth', 'github', 'table', 'create table',
+        'storage', 'upload', 'file', 'realtime', 'rls', 'row level', 'edge function'
+    ],
+}
+
+GREETINGS = frozenset([
+    'hi', 'hello', 'hey', 'greetings', 'good morning',
+    'good afternoon', 'good evening', 'howdy', 'yo', 'sup'
+])
+
+VAGUE_ONLY = frozenset([
+    'help', 'error', 'problem', 'issue', 'broken', 'not working',
+    'stuck', 'confused', 'urgent', 'please help'
+])
+
+
+class KeywordHits:
+    """Result of scanning one text: which categories matched
+
+    `keywords` holds every matching keyword of the categories the matcher
+    was told to report in full; for other categories scanning stops at the
+    first match, as `any()` did.
+    """
+
+    __slots__ = ('categories', 'keywords')
+
+    def __init__(self, categories, keywords):
+        self.categories = categories
+        self.keywords = keywords
+
+    def has(self, category):
+        return category in self.categories
+
+
+class KeywordMatcher:
+    """Finds which keyword categories occur in a text in a single pass over the keywords
+
+    Built once from a {category: [keywords]} table. Each distinct keyword is
+    searched for at most once per text however many categories share it,
+    and is skipped entirely once all of its categories have matched. Large
+    texts whose distinct words are much shorter than the text itself (pasted
+    logs and stack traces) are searched via their distinct words for
+    keywords without spaces. Results are identical to
+    `any(keyword in text for keyword in keywords)` for every category.
+
+    Args:
+        categories: Mapping of category name to keyword list
+        report_all: Categories whose individual matching keywords are needed
+        dedupe_min_chars: Only consider searching distinct words above this size
+    """
+
+    def __init__(self, categories, report_all=(), dedupe_min_chars=16384):
+        self.names = tuple(categories)
+        self.dedupe_min_chars = dedupe_min_chars
+
+        masks = {}
+        for i, name in enumerate(self.names):
+            for keyword in categories[name]:
+                masks[keyword] = masks.get(keyword, 0) | (1 << i)
+        full_mask = sum(1 << i for i, name in enumerate(self.names) if name in report_all)
+
+        # (keyword, category bitmask, report individually, contains whitespace) in table order
+        self._plan = tuple(
+            (keyword, mask, bool(mask & full_mask), keyword.split() != [keyword])
+            for keyword, mask in masks.items()
+        )
+        self._categories = {}  # matched bitmask -> frozenset of category names
+
+    def scan(self, text):
+        """Return KeywordHits for `text` (already lowercased)"""
+        words_text = text
+        if len(text) > self.dedupe_min_chars:
+            distinct = '\n'.join(set(text.split()))
+            if len(distinct) * 2 < len(text):
+                words_text = distinct
+
+        matched = 0
+        keywords = []
+        for keyword, mask, report, phrase in self._plan:
+            if not (mask & ~matched) and not report:
+                continue
+            if keyword in (text if phrase else words_text):
+                matched |= mask
+                if report:
+                    keywords.append(keyword)
+
+        categories = self._categories.get(matched)
+        if categories is None:
+            categories = frozenset(name for i, name in enumerate(self.names) if matched >> i & 1)
+            self._categories[matched] = categories
+        return KeywordHits(categories, frozenset(keywords))
+
+
+matcher = KeywordMatcher(KEYWORDS, report_all=('unsupported_platform', 'topic'))
+
+
+@lru_cache(maxsize=4096)
+def scan_message(text):
+    """Keyword hits for one message, memoized so each message is scanned once"""
+    return matcher.scan(text.lower())
+
+
+class ConversationContext:
+    """Keyword hits for every message of one conversation's history
+
+    Messages are scanned once, when they first appear; later turns only scan
+    what was appended since. If the history was truncated or replaced the
+    cached hits are rebuilt.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self._messages = []
+        self._hits = []
+
+    def refresh(self):
+        cached = len(self._messages)
+        if cached > len(self.history) or (cached and self.history[cached - 1] is not self._messages[-1]):
+            self._messages = []
+            self._hits = []
+            cached = 0
+        for msg in self.history[cached:]:
+            self._messages.append(msg)
+            self._hits.append((msg.get('role'), scan_message(msg.get('content', ''))))
+        return self
+
+    def recent(self, n=None, role=None):
+        """Hit sets of the last `n` messages (all if None), optionally only one role"""
+        hits = self._hits[-n:] if n else self._hits
+        return [h for r, h in hits if role is None or r == role]
+
+    def any_recent(self, category, n=None, role=None):
+        """True if any of the last `n` messages matches `category`"""
+        return any(h.has(category) for h in self.recent(n, role))
+
+
+_contexts = LRUCache(maxsize=2048)
+_contexts_lock = threading.Lock()
+
+
+def get_conversation_context(history):
+    """Incrementally updated keyword context for a history list
+
+    Keyed on the list object itself, so it follows a session's history as
+    turns are appended to it.
+    """
+    key = id(history)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is None or context.history is not history:
+            context = ConversationContext(history)
+            _contexts.set(key, context)
+        return context.refresh()
+
+
+def forget_conversation_context(history):
+    """Drop the cached context of a history list that is no longer used"""
+    with _contexts_lock:
+        _contexts.pop(id(history))
+
+
+def check_conversation_has_supabase_context(history):
+    """Check if recent conversation history contains Supabase-related content"""
+    # Check last 6 messages for Supabase context
+    recent = history[-6:] if len(history) > 6 else history
+    return any(scan_message(msg.get('content', '')).has('context') for msg in recent)
+
+
+def classify_intent(message, history=None):
+    """Classify user intent using priority-based pattern matching
+
+    Priority system (highest wins):
+    1. Has Supabase keywords → 'question'
+    2. Has entertainment/general knowledge → 'off_topic'
+    3. Has greeting (short message, no prior context) → 'greeting'
+    4. Has thanks/praise → 'thanks' or 'praise'
+    5. Default based on context
+
+    All keyword lists are matched in one scan of the message, and history
+    is only scanned for messages added since the previous turn.
+
+    Args:
+        message: The user's message
+        history: Optional conversation history for context awareness
+    """
+    message_lower = message.lower().strip()
+    history = history or []
+    words = message_lower.split()
+
+    # Check if conversation already has Supabase context (last 6 messages)
+    has_prior_context = get_conversation_context(history).any_recent('context', 6)
+
+    # === Early exits for invalid input ===
+    if not message or len(message.strip()) < 2:
+        return 'unclear'
+
+    if not any(c.isalpha() for c in message):
+        return 'unclear'
+
+    # === Detect ALL pattern types (don't return yet) ===
+    hits = scan_message(message)
+
+    has_supabase = hits.has('supabase')
+    has_entertainment = hits.has('entertainment')
+    is_personal_question = hits.has('personal')
+    has_general_knowledge = hits.has('general_knowledge')
+    has_other_tech = hits.has('other_tech')
+
+    # Greetings
+    has_greeting = (
+        (len(words) > 0 and words[0] in GREETINGS) or
+        message_lower in GREETINGS
+    )
+
+    has_thanks = hits.has('thanks')
+    has_praise = hits.has('praise')
+    has_followup = hits.has('followup')
+
+    # === Apply priority rules ===
+
+    # Priority 0: Personal questions ALWAYS off_topic (before Supabase check)
+    if is_personal_question:
+        return 'off_topic'
+
+    # Priority 1: Supabase keywords ALWAYS win
+    if has_supabase:
+        return 'question'
+
+    # Priority 2: Off-topic (entertainment, general knowledge, other tech)
+    if has_entertainment or has_general_knowledge:
+        return 'off_topic'
+
+    if has_other_tech and not has_prior_context:
+        return 'off_topic'
+
+    # Priority 3: Greeting (only if short and no prior context)
+    if has_greeting and len(words) < 5 and not has_prior_context:
+        return 'greeting'
+
+    # Priority 4: Thanks/Praise (only if not asking a question)
+    if has_thanks and '?' not in message and 'how' not in message_lower:
+        return 'thanks'
+
+    if has_praise and '?' not in message:
+        return 'praise'
+
+    # Priority 5: Context-based defaults
+
+    # Follow-up in ongoing conversation
+    if has_prior_context and (has_followup or '?' in message):
+        return 'question'
+
+    # Has prior context, treat as continuation
+    if has_prior_context:
+        return 'question'
+
+    # Vague messages without context
+    if message_lower in VAGUE_ONLY:
+        return 'unclear'
+
+    # Question mark but no relevant context
+    if '?' in message:
+        return 'off_topic'
+
+    # Very short messages without context
+    if len(words) < 4:
+        return 'unclear'
+
+    # Default: unclear
+    return 'unclear'
@@ -0,0 +1,54 @@
+import os
+import time
+import threading
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stamp file kept next to the Chroma data; rewritten whenever the knowledge base is reloaded
+KB_VERSION_PATH = os.path.join(PROJECT_ROOT, "chroma_db", "kb_version")
+
+# Re-read the stamp at most this often (seconds)
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_cached_version = None
+_checked_at = 0.0
+
+
+def _read_version():
+    try:
+        with open(KB_VERSION_PATH, 'r', encoding='utf-8') as f:
+            return f.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def get_kb_version():
+    """Current knowledge base version stamp ('0' if never stamped)
+
+    The stamp lives on disk so every worker process sees a reload done by
+    scripts/load_data_to_chromadb.py without a restart.
+    """
+    global _cached_version, _checked_at
+    now = time.monotonic()
+    with _lock:
+        if _cached_version is None or now - _checked_at >= CHECK_INTERVAL:
+            _cached_version = _read_version()
+            _checked_at = now
+        return _cached_version
+
+
+def bump_kb_version():
+    """Write a new version stamp, invalidating caches built on the old corpus"""
+    global _cached_version, _checked_at
+    version = str(time.time_ns())
+    os.makedirs(os.path.dirname(KB_VERSION_PATH), exist_ok=True)
+    tmp_path = f"{KB_VERSION_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, KB_VERSION_PATH)
+    with _lock:
+        _cached_version = version
+        _checked_at = time.monotonic()
+    return version
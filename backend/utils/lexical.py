@@ -0,0 +1,260 @@
+"""
+Lexical (BM25) search over the knowledge base chunks
+
+Questions often contain exact identifiers (error codes like 502, function
+names such as auth.uid, issue titles) that keyword search matches directly
+and dense vectors can miss. The index holds the same chunks as the Chroma
+collection and is written to chroma_db/bm25_index.json by
+scripts/load_data_to_chromadb.py; to rebuild it from the collection alone
+run `python -m backend.utils.lexical`.
+
+Results use Chroma's query() layout (nested ids/documents/metadatas lists),
+so they can be fused with vector results by reciprocal rank.
+"""
+import os
+import re
+import json
+import time
+import threading
+import numpy as np
+from backend.utils.kb_version import get_kb_version
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LEXICAL_INDEX_PATH = os.path.join(PROJECT_ROOT, "chroma_db", "bm25_index.json")
+
+INDEX_FORMAT = 1
+
+# Words, numbers and dotted/underscored identifiers (auth.uid, row_level_security)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its me my
+no not of on or so that the their then there these this to was what when where which who why
+will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase terms of `text`; compound identifiers also yield their parts"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if '.' in token or '_' in token:
+            terms.extend(part for part in re.split(r'[._]', token) if part and part not in STOPWORDS)
+    return terms
+
+
+def _indexed_text(document, metadata):
+    """Title and heading are indexed with the chunk, as they are for its embedding"""
+    metadata = metadata or {}
+    return ' '.join(filter(None, [metadata.get('title'), metadata.get('heading'), document]))
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks
+
+    Each term's postings store the document numbers and their precomputed
+    BM25 weights, so a query only adds up a few numpy arrays.
+
+    Args:
+        ids: Chunk ids (the Chroma ids)
+        documents: Chunk texts
+        metadatas: Chunk metadata dicts
+        k1: Term frequency saturation
+        b: Document length normalization
+    """
+
+    def __init__(self, ids, documents, metadatas, k1=1.2, b=0.75, postings=None):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.k1 = k1
+        self.b = b
+        self.postings = postings if postings is not None else self._build_postings()
+
+    def _build_postings(self):
+        term_counts = []
+        lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for i, (document, metadata) in enumerate(zip(self.documents, self.metadatas)):
+            counts = {}
+            for term in tokenize(_indexed_text(document, metadata)):
+                counts[term] = counts.get(term, 0) + 1
+            term_counts.append(counts)
+            lengths[i] = sum(counts.values())
+
+        n = len(self.ids)
+        average = float(lengths.mean()) if n else 0.0
+        norms = self.k1 * (1 - self.b + self.b * lengths / average) if average else np.full(n, self.k1)
+
+        by_term = {}
+        for i, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                by_term.setdefault(term, []).append((i, tf))
+
+        postings = {}
+        for term, hits in by_term.items():
+            docs = np.array([i for i, _ in hits], dtype=np.int32)
+            tfs = np.array([tf for _, tf in hits], dtype=np.float32)
+            idf = np.log(1 + (n - len(hits) + 0.5) / (len(hits) + 0.5))
+            postings[term] = (docs, (idf * tfs * (self.k1 + 1) / (tfs + norms[docs])).astype(np.float32))
+        return postings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, n_results=10):
+        """Best-matching chunks for `query`, in Chroma query() layout with 'scores'"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+                matched = True
+
+        hits = []
+        if matched:
+            candidates = np.flatnonzero(scores)
+            k = min(n_results, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            # Highest score first; ties keep corpus order
+            hits = top[np.lexsort((top, -scores[top]))]
+
+        return {
+            'ids': [[self.ids[i] for i in hits]],
+            'documents': [[self.documents[i] for i in hits]],
+            'metadatas': [[self.metadatas[i] for i in hits]],
+            'scores': [[float(scores[i]) for i in hits]]
+        }
+
+    def to_dict(self):
+        return {
+            'format': INDEX_FORMAT,
+            'k1': self.k1,
+            'b': self.b,
+            'ids': self.ids,
+            'documents': self.documents,
+            'metadatas': self.metadatas,
+            'postings': {
+                term: [docs.tolist(), [round(float(w), 5) for w in weights]]
+                for term, (docs, weights) in self.postings.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        postings = {
+            term: (np.array(docs, dtype=np.int32), np.array(weights, dtype=np.float32))
+            for term, (docs, weights) in data['postings'].items()
+        }
+        return cls(data['ids'], data['documents'], data['metadatas'], data['k1'], data['b'], postings=postings)
+
+
+def reciprocal_rank_fusion(result_sets, n_results, k=60):
+    """Merge ranked results (Chroma query() layout) by reciprocal rank
+
+    A chunk scores sum(1 / (k + rank)) over the lists it appears in, so
+    chunks ranked well by both searches come first. Ties keep the order of
+    the first list.
+
+    Returns the top `n_results` in the same layout, with 'scores'.
+    """
+    scores = {}
+    rows = {}
+    for results in result_sets:
+        ranked = zip(results['ids'][0], results['documents'][0], results['metadatas'][0])
+        for rank, (chunk_id, document, metadata) in enumerate(ranked, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(chunk_id, (document, metadata))
+
+    top = sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:n_results]
+    return {
+        'ids': [top],
+        'documents': [[rows[chunk_id][0] for chunk_id in top]],
+        'metadatas': [[rows[chunk_id][1] for chunk_id in top]],
+        'scores': [[round(scores[chunk_id], 6) for chunk_id in top]]
+    }
+
+
+def build_lexical_index(collection, path=LEXICAL_INDEX_PATH):
+    """Build the BM25 index from every chunk in `collection` and save it to `path`"""
+    start = time.perf_counter()
+    chunks = collection.get(include=['documents', 'metadatas'])
+    index = BM25Index(chunks['ids'], chunks['documents'], chunks['metadatas'])
+    if path:
+        save_lexical_index(index, path)
+    print(f"Lexical index: {len(index)} chunks, {len(index.postings)} terms "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return index
+
+
+def save_lexical_index(index, path=LEXICAL_INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def load_lexical_index(path=LEXICAL_INDEX_PATH):
+    """Load a saved index, or None if there is none (or it is unreadable)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"Error reading lexical index: {e}")
+        return None
+    if data.get('format') != INDEX_FORMAT:
+        print("Lexical index format is outdated; rebuild it with `python -m backend.utils.lexical`")
+        return None
+    return BM25Index.from_dict(data)
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def lexical_search_enabled():
+    """Hybrid retrieval is on unless LEXICAL_SEARCH is set to 0/false"""
+    return os.getenv('LEXICAL_SEARCH', '1').lower() not in ('0', 'false', 'no')
+
+
+def get_lexical_index():
+    """Process-wide BM25 index, reloaded when the knowledge base version changes
+
+    Returns None when lexical search is disabled or no index has been built.
+    """
+    global _index, _index_version
+    if not lexical_search_enabled():
+        return None
+
+    version = get_kb_version()
+    if _index_version == version:
+        return _index
+
+    with _index_lock:
+        if _index_version != version:
+            _index = load_lexical_index()
+            _index_version = version
+    return _index
+
+
+def set_lexical_index(index):
+    """Use `index` in this process until the knowledge base version changes (benchmarks)"""
+    global _index, _index_version
+    with _index_lock:
+        _index = index
+        _index_version = get_kb_version()
+
+
+if __name__ == "__main__":
+    from backend.utils.clients import get_collection
+
+    build_lexical_index(get_collection())
@@ -0,0 +1,161 @@
+"""
+Per-stage chat latency and token usage
+
+chat() times each stage of a turn with a TurnTimer. The timings are logged
+with the conversation row and added to process-wide histograms that
+/metrics exposes in the Prometheus text format. Each worker process keeps
+its own histograms, so scrape every worker (or sum them) when running
+several.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+# Stages of a chat turn, in pipeline order
+STAGES = ('classify', 'embed', 'vector_search', 'prompt_build', 'llm', 'persist')
+
+# Histogram upper bounds in seconds, from a fast classify to a slow Claude call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class TurnTimer:
+    """Wall-clock time of one chat turn, split into stages
+
+    `start_time` is the turn's time.time() start, used for response_time_ms
+    and time to first token. A stage entered more than once accumulates.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.stages = {}
+        self.input_tokens = None
+        self.output_tokens = None
+        # Local estimates (backend/utils/prompt_budget.py), set when Claude is called
+        self.estimated_input_tokens = None
+        self.estimated_output_tokens = None
+        # Prompt cache usage (PROMPT_CACHE=1); input_tokens excludes these
+        self.cache_read_tokens = None
+        self.cache_write_tokens = None
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the `with` block to stage `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def elapsed_ms(self, until=None):
+        """Milliseconds from the start of the turn to `until` (default now)"""
+        return int(((until or time.time()) - self.start_time) * 1000)
+
+    def stage_timings_ms(self):
+        """Milliseconds per stage that ran, in pipeline order"""
+        return {name: round(self.stages[name], 1) for name in STAGES if name in self.stages}
+
+    def record_usage(self, usage):
+        """Take token counts from a Claude `usage` object (non-streamed body or stream event)"""
+        if not usage:
+            return
+        if usage.get('input_tokens') is not None:
+            self.input_tokens = usage['input_tokens']
+        if usage.get('output_tokens') is not None:
+            self.output_tokens = usage['output_tokens']
+        if usage.get('cache_read_input_tokens') is not None:
+            self.cache_read_tokens = usage['cache_read_input_tokens']
+        if usage.get('cache_creation_input_tokens') is not None:
+            self.cache_write_tokens = usage['cache_creation_input_tokens']
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values, like a Prometheus histogram"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ','.join(f'{n}="{v}"' for n, v in zip(self.label_names, label_values))
+                prefix = labels + ',' if labels else ''
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = ','.join(f'{n}="{v}"' for n, v in zip(self.label_names, label_values))
+                lines.append(f'{self.name}{{{labels}}} {value}')
+        return '\n'.join(lines)
+
+
+_stage_seconds = Histogram(
+    'chat_stage_duration_seconds', 'Time spent in each stage of a chat turn', ('stage',)
+)
+_turn_seconds = Histogram(
+    'chat_turn_duration_seconds', 'Chat turn response time by intent', ('intent',)
+)
+_tokens = Counter(
+    'chat_llm_tokens_total', 'Claude tokens used by chat turns', ('direction',)
+)
+
+
+def observe_turn(timer, intent):
+    """Add a finished turn's stage timings and token counts to the histograms"""
+    for name, ms in timer.stages.items():
+        _stage_seconds.observe(ms / 1000, name)
+    _turn_seconds.observe(timer.elapsed_ms() / 1000, intent or 'unknown')
+    if timer.input_tokens:
+        _tokens.inc(timer.input_tokens, 'input')
+    if timer.output_tokens:
+        _tokens.inc(timer.output_tokens, 'output')
+    if timer.cache_read_tokens:
+        _tokens.inc(timer.cache_read_tokens, 'cache_read')
+    if timer.cache_write_tokens:
+        _tokens.inc(timer.cache_write_tokens, 'cache_write')
+
+
+def render_metrics():
+    """This process's chat metrics in the Prometheus text exposition format"""
+    return '\n'.join([_stage_seconds.render(), _turn_seconds.render(), _tokens.render()]) + '\n'
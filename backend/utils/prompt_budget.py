@@ -0,0 +1,173 @@
+"""
+Token-budgeted prompt assembly
+
+Claude's tokenizer is not available offline, so count_tokens() estimates
+it locally: words are split into pieces of about six letters, numbers into
+groups of three digits, and every punctuation mark, newline run and
+indentation run counts as one token. It is an estimate, so both it and
+Bedrock's reported count are logged per conversation
+(estimated_input_tokens next to input_tokens) to keep an eye on the gap.
+
+chat() fills a PromptBudget in priority order: the system prompt, topic
+summary and questions always go in, then retrieved passages in rank order,
+then as many prior turns as still fit. A passage that does not fit is cut
+at a sentence, line or code-fence boundary, never inside a fenced code
+block.
+"""
+import os
+import re
+from dotenv import load_dotenv
+from backend.utils.chunking import SENTENCE_END
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Input tokens per Claude call (system prompt, prior turns and the prompt with reference context)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '3000'))
+# Share of the budget left after the fixed parts that is held back for prior turns
+PROMPT_HISTORY_SHARE = float(os.getenv('PROMPT_HISTORY_SHARE', '0.3'))
+
+# Role and framing tokens Claude adds per message
+MESSAGE_OVERHEAD = 4
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|\n+|[ \t]{2,}|[^\sA-Za-z\d]")
+NEWLINE = re.compile(r'\n')
+CODE_FENCE = re.compile(r'^[ \t]*```.*?^[ \t]*```[^\n]*$', re.MULTILINE | re.DOTALL)
+OPEN_FENCE = re.compile(r'^[ \t]*```', re.MULTILINE)
+
+
+def count_tokens(text):
+    """Approximate number of Claude tokens in `text`"""
+    tokens = 0
+    for piece in TOKEN_PATTERN.findall(text or ''):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += 1 + (len(piece) - 1) // 6
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def count_message_tokens(messages):
+    """Approximate tokens of Claude `messages` including per-message overhead"""
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD for m in messages)
+
+
+def _segments(text):
+    """`text` split into pieces that may be dropped from the end
+
+    A fenced code block is one piece (an unclosed one, from a chunk cut
+    mid-block, runs to the end); other text is split after every sentence
+    and line. Joining the pieces gives back `text`.
+    """
+    cuts = []
+    pos = 0
+    for fence in CODE_FENCE.finditer(text):
+        cuts.extend(_prose_cuts(text, pos, fence.start()))
+        cuts.append(fence.end())
+        pos = fence.end()
+    unclosed = OPEN_FENCE.search(text, pos)
+    cuts.extend(_prose_cuts(text, pos, unclosed.start() if unclosed else len(text)))
+
+    segments = []
+    start = 0
+    for cut in sorted(set(cuts)):
+        if cut > start:
+            segments.append(text[start:cut])
+            start = cut
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+def _prose_cuts(text, start, end):
+    """Offsets just after each sentence end and newline in text[start:end], plus `end`"""
+    cuts = [m.end() for m in SENTENCE_END.finditer(text, start, end)]
+    cuts.extend(m.end() for m in NEWLINE.finditer(text, start, end))
+    cuts.append(end)
+    return cuts
+
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest prefix of `text` within `max_tokens` that ends at a boundary
+
+    Sentences, lines and whole code blocks are kept or dropped as units. If
+    even the first sentence is too long it is cut between words and marked
+    with "..."; a first code block that is too long is dropped entirely.
+    """
+    if max_tokens <= 0:
+        return ''
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept = []
+    used = 0
+    for segment in _segments(text):
+        tokens = count_tokens(segment)
+        if used + tokens > max_tokens:
+            break
+        kept.append(segment)
+        used += tokens
+    if kept:
+        return ''.join(kept).rstrip()
+
+    first = _segments(text)[0]
+    if OPEN_FENCE.match(first.lstrip('\n')):
+        return ''
+    words = []
+    used = 1
+    for word in first.split(' '):
+        used += count_tokens(word)
+        if used > max_tokens:
+            break
+        words.append(word)
+    return ' '.join(words).rstrip() + '...' if words else ''
+
+
+def fit_messages(messages, max_tokens):
+    """The most recent `messages` that fit in `max_tokens`, starting with a user message"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(message['content']) + MESSAGE_OVERHEAD
+        if used + tokens > max_tokens:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    while kept and kept[0]['role'] != 'user':
+        kept.pop(0)
+    return kept
+
+
+class PromptBudget:
+    """Running allocation of a prompt's token budget
+
+    Args:
+        total: Input tokens available for the whole Claude request
+    """
+
+    def __init__(self, total=PROMPT_TOKEN_BUDGET):
+        self.total = total
+        self.parts = {}
+
+    @property
+    def used(self):
+        return sum(self.parts.values())
+
+    @property
+    def remaining(self):
+        return max(0, self.total - self.used)
+
+    def charge(self, part, tokens):
+        """Count `tokens` against `part` whether or not they fit"""
+        self.parts[part] = self.parts.get(part, 0) + tokens
+
+    def require(self, part, text):
+        """Add `text` in full (system prompt, current question)"""
+        self.charge(part, count_tokens(text))
+        return text
@@ -0,0 +1,91 @@
+"""
+Prompt caching for the Claude request
+
+Every call sends the same system prompt, and common topics retrieve the
+same few files. With PROMPT_CACHE=1 these go first in the request as system
+content blocks: the rules, then the reference passages sorted by source,
+file and chunk position instead of by rank, so two questions that retrieve
+the same passages produce the same prefix. The conversation context and the
+question follow in the messages.
+
+A cache_control breakpoint after a block asks Bedrock to cache the prompt up
+to that point; a later request with the same prefix reads it from the cache,
+which is billed at a fraction of the input price and processed faster.
+Prefixes shorter than the model's minimum (1024 tokens, 2048 for Haiku) are
+never cached, and the system prompt with three passages falls short of it,
+so with caching on chat() retrieves PROMPT_CACHE_PASSAGES passages instead.
+Breakpoints are only placed from the first block that reaches the minimum;
+if none does, chat() keeps its usual rank-ordered prompt. Claude reports cache_read_input_tokens and cache_creation_input_tokens
+in its usage, and both are logged per conversation.
+
+The model set in BEDROCK_MODEL_ID must support prompt caching on Bedrock;
+other models reject the request, so this is off by default.
+"""
+import os
+from dotenv import load_dotenv
+from backend.utils.prompt_budget import count_tokens
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Shortest prefix Claude models will cache; Haiku models need twice as much
+DEFAULT_MIN_TOKENS = 1024
+HAIKU_MIN_TOKENS = 2048
+
+# Passages retrieved per question with caching on, enough to take the prefix past the minimum
+PROMPT_CACHE_PASSAGES = int(os.getenv('PROMPT_CACHE_PASSAGES', '8'))
+
+CACHE_CONTROL = {"type": "ephemeral"}
+# Breakpoints allowed per request
+MAX_BREAKPOINTS = 4
+
+
+def prompt_cache_enabled():
+    """Prompt caching is off unless PROMPT_CACHE is set to 1/true"""
+    return os.getenv('PROMPT_CACHE', '0').lower() in ('1', 'true', 'yes')
+
+
+def prompt_cache_min_tokens(model_id=None):
+    """Shortest cacheable prefix for `model_id` (default BEDROCK_MODEL_ID); PROMPT_CACHE_MIN_TOKENS overrides it"""
+    configured = os.getenv('PROMPT_CACHE_MIN_TOKENS')
+    if configured:
+        return int(configured)
+    model_id = (model_id or os.getenv('BEDROCK_MODEL_ID') or '').lower()
+    return HAIKU_MIN_TOKENS if 'haiku' in model_id else DEFAULT_MIN_TOKENS
+
+
+def passage_order_key(metadata):
+    """Sort key that puts passages of the same files in the same order on every request"""
+    return (metadata.get('source') or '', metadata.get('filename') or '', metadata.get('chunk_index') or 0)
+
+
+def system_blocks(texts, min_tokens=None):
+    """System prompt content blocks for `texts`, with cache breakpoints
+
+    A breakpoint follows every block whose prefix is at least `min_tokens`
+    (default prompt_cache_min_tokens()) long, keeping the last
+    MAX_BREAKPOINTS: the longest prefix is cached in full and shorter ones
+    still match requests that share only their first passages.
+    """
+    if min_tokens is None:
+        min_tokens = prompt_cache_min_tokens()
+    blocks = []
+    eligible = []
+    prefix_tokens = 0
+    for text in texts:
+        prefix_tokens += count_tokens(text)
+        if prefix_tokens >= min_tokens:
+            eligible.append(len(blocks))
+        blocks.append({"type": "text", "text": text})
+    for i in eligible[-MAX_BREAKPOINTS:]:
+        blocks[i]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+
+def system_text(system):
+    """The text of a system prompt given as a string or as content blocks"""
+    if isinstance(system, str):
+        return system
+    return ''.join(block['text'] for block in system)
@@ -0,0 +1,48 @@
+import time
+import random
+import threading
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter
+
+    Args:
+        rate: Tokens added per second (sustained requests per second)
+        capacity: Maximum burst size; defaults to `rate`
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then take them; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                shortfall = (tokens - self._tokens) / self.rate
+            time.sleep(shortfall)
+            waited += shortfall
+
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_throttling_error(e):
+    """True for Bedrock/botocore throttling errors"""
+    response = getattr(e, 'response', None)
+    code = response.get('Error', {}).get('Code', '') if isinstance(response, dict) else ''
+    return code in ('ThrottlingException', 'TooManyRequestsException') or 'ThrottlingException' in str(e)
@@ -0,0 +1,103 @@
+"""
+Batched vector retrieval for bulk and evaluation workloads
+
+search_many() answers a list of queries at once: repeated queries are
+searched once, embeddings are computed together (concurrent Bedrock calls
+for Titan, one batched encode for a local provider, the embedding cache
+first either way), and the collection is queried with many embeddings per
+call. Results come back aligned with the input, each in the same layout as
+a single-query collection.query().
+
+This is vector search only: unlike chat's search_knowledge_base(), no BM25
+results are fused in, so rankings can differ from what the agent sees.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from backend.utils.clients import get_collection
+from backend.utils.embeddings import get_embedding, get_embedding_cache
+from backend.utils.embedding_providers import collection_name, get_embedding_provider
+from backend.utils.retrieval_cache import get_retrieval_cache, retrieval_cache_enabled, result_key
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Parallel embedding requests (shared with the ingest script's setting)
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+
+RESULT_FIELDS = ('ids', 'documents', 'metadatas', 'distances')
+
+
+def embed_many(texts, concurrency=EMBED_CONCURRENCY):
+    """Embedding of each distinct text in `texts`, as a dict keyed by text"""
+    unique = list(dict.fromkeys(texts))
+    provider = get_embedding_provider()
+    if not provider.local:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            return dict(zip(unique, executor.map(get_embedding, unique)))
+
+    cache = get_embedding_cache()
+    embeddings = {text: cache.get(text, provider.model_id) for text in unique}
+    missing = [text for text, embedding in embeddings.items() if embedding is None]
+    if missing:
+        start = time.perf_counter()
+        vectors = provider.embed(missing)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for text, embedding in zip(missing, vectors):
+            cache.record_miss(elapsed_ms / len(missing))
+            cache.put(text, provider.model_id, embedding)
+            embeddings[text] = embedding
+    return embeddings
+
+
+def search_many(queries, n_results=3, batch_size=64, concurrency=EMBED_CONCURRENCY):
+    """Vector search for every query in `queries` (no BM25 hybrid)
+
+    Args:
+        queries: Query strings; duplicates are searched once
+        n_results: Chunks per query
+        batch_size: Embeddings per collection.query call
+        concurrency: Parallel embedding requests (Titan)
+
+    Returns:
+        One result per query, in input order, each in Chroma's single-query
+        layout ({'ids': [[...]], 'documents': [[...]], ...}). Each position
+        gets its own dict, but the lists inside may be shared with the cache.
+    """
+    unique = list(dict.fromkeys(queries))
+    embeddings = embed_many(unique, concurrency)
+    collection = get_collection()
+    cache = get_retrieval_cache() if retrieval_cache_enabled() else None
+    name = collection_name()
+
+    results = {}
+    pending = []
+    version = None
+    for query in unique:
+        cached = None
+        if cache:
+            cached, version = cache.get(result_key(embeddings[query], n_results, name))
+        if cached is not None:
+            results[query] = cached
+        else:
+            pending.append(query)
+
+    for offset in range(0, len(pending), batch_size):
+        batch = pending[offset:offset + batch_size]
+        start = time.perf_counter()
+        batch_results = collection.query(query_embeddings=[embeddings[q] for q in batch], n_results=n_results)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for i, query in enumerate(batch):
+            results[query] = {
+                field: [batch_results[field][i]] for field in RESULT_FIELDS if batch_results.get(field) is not None
+            }
+            if cache:
+                cache.put(
+                    result_key(embeddings[query], n_results, name), results[query], elapsed_ms / len(batch), version
+                )
+
+    # Duplicates and cache hits share one dict; a caller editing its result must not change the others
+    return [dict(results[query]) for query in queries]
@@ -0,0 +1,219 @@
+"""
+Cache of vector search results keyed on the query embedding
+
+Between re-ingests the collection never changes, so the same query vector
+always returns the same top-k chunks. Results are cached under a key built
+from the embedding quantized to int8 (so vectors that differ only by float
+noise share an entry), `n_results` and the collection name, and every entry
+is tagged with the knowledge base version that load_documents() bumps: a
+re-ingest invalidates the whole cache in every worker.
+
+The memory tier is an LRU per process. The optional shared tier is a
+SQLite file read through a memory map (PRAGMA mmap_size), so every worker
+on the host serves hits from the same mapped pages instead of each
+querying Chroma.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from backend.utils.cache import LRUCache
+from backend.utils.kb_version import get_kb_version
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+# Bytes of the shared file mapped into each worker
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+def quantize(embedding):
+    """Unit-length `embedding` rounded to int8 steps of 1/127"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector = vector / norm
+    return np.round(vector * 127).astype(np.int8)
+
+
+def result_key(embedding, n_results, collection_name):
+    digest = hashlib.sha256(quantize(embedding).tobytes())
+    digest.update(f"\0{n_results}\0{collection_name}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RetrievalCache:
+    """Two-tier cache of collection.query() results
+
+    Args:
+        maxsize: Entries kept in the memory tier
+        path: SQLite file for the shared tier, or None to disable it
+    """
+
+    def __init__(self, maxsize=2000, path=None):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.path = path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._kb_version = get_kb_version()
+
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.miss_ms_total = 0.0
+        self.invalidations = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    kb_version TEXT NOT NULL,
+                    results BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            self._db.commit()
+
+    def _check_kb_version(self):
+        version = get_kb_version()
+        if version != self._kb_version:
+            self.memory.clear()
+            self._kb_version = version
+            with self._stats_lock:
+                self.invalidations += 1
+            if self._db is not None:
+                try:
+                    with self._db_lock:
+                        self._db.execute("DELETE FROM results WHERE kb_version != ?;", (version,))
+                        self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Error pruning retrieval cache: {e}")
+        return version
+
+    def get(self, key):
+        """(results, kb_version) for `key`; results is None on a miss
+
+        Pass the version on to put() so results queried across a re-ingest
+        are not cached under the new version.
+        """
+        version = self._check_kb_version()
+
+        results = self.memory.get(key)
+        if results is not None:
+            with self._stats_lock:
+                self.memory_hits += 1
+            return results, version
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT results FROM results WHERE key = ? AND kb_version = ?;", (key, version)
+                ).fetchone()
+            if row:
+                results = json.loads(row[0])
+                self.memory.set(key, results)
+                with self._stats_lock:
+                    self.shared_hits += 1
+                return results, version
+
+        return None, version
+
+    def put(self, key, results, elapsed_ms, version):
+        """Cache `results` of a query that took `elapsed_ms`, made at kb_version `version`"""
+        with self._stats_lock:
+            self.misses += 1
+            self.miss_ms_total += elapsed_ms
+        # The knowledge base changed while the query ran; its results may be stale
+        if self._check_kb_version() != version:
+            return
+        self.memory.set(key, results)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO results (key, kb_version, results, created_at) VALUES (?, ?, ?, ?);",
+                        (key, version, json.dumps(results), time.time())
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing retrieval cache: {e}")
+
+    def query(self, collection, query_embedding, n_results, collection_name):
+        """collection.query() for one embedding, served from the cache when possible"""
+        key = result_key(query_embedding, n_results, collection_name)
+        results, version = self.get(key)
+        if results is not None:
+            return results
+
+        start = time.perf_counter()
+        results = collection.query(query_embeddings=[query_embedding], n_results=n_results)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        results = {
+            field: results[field]
+            for field in ('ids', 'documents', 'metadatas', 'distances') if results.get(field) is not None
+        }
+        self.put(key, results, elapsed_ms, version)
+        return results
+
+    def clear(self):
+        self.memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM results;")
+                self._db.commit()
+
+    def stats(self):
+        with self._stats_lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            avg_miss_ms = self.miss_ms_total / self.misses if self.misses else 0
+            return {
+                'memory_size': len(self.memory),
+                'memory_hits': self.memory_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'avg_query_ms': round(avg_miss_ms, 2),
+                'estimated_ms_saved': round(hits * avg_miss_ms, 2),
+                'invalidations': self.invalidations,
+                'shared': self._db is not None,
+                'kb_version': self._kb_version
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def retrieval_cache_enabled():
+    """Vector search results are cached unless RETRIEVAL_CACHE is set to 0/false"""
+    return os.getenv('RETRIEVAL_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+
+def get_retrieval_cache():
+    """Process-wide retrieval cache configured from RETRIEVAL_CACHE_* env vars"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache(
+                    maxsize=int(os.getenv('RETRIEVAL_CACHE_SIZE', '2000')),
+                    path=os.getenv('RETRIEVAL_CACHE_PATH') or None
+                )
+    return _cache
+
+
+def get_retrieval_cache_stats():
+    """Retrieval cache hit/miss counters, or None if the cache is unused"""
+    return _cache.stats() if _cache is not None else None
@@ -0,0 +1,300 @@
+"""
+In-process NumPy vector store for the knowledge base
+
+The corpus is a few hundred chunks, so an exact search is one
+matrix-vector product over a contiguous float32 matrix plus an
+argpartition, with no SQLite or HNSW persistence in the way. The matrix is
+saved as .npy files next to the Chroma data and memory-mapped read-only,
+so every worker on the host shares the same pages.
+
+Above `ann_threshold` vectors the store switches to an inverted-file (IVF)
+index: rows are clustered by k-means and stored grouped by cluster, and a
+query scans only the `nprobe` clusters whose centroids are closest.
+
+With VECTOR_STORE=numpy, get_collection() (backend/utils/clients.py)
+returns this store instead of the Chroma collection. It is rebuilt from
+the collection by scripts/load_data_to_chromadb.py; to build it alone run
+`python -m backend.utils.vector_store`. Like Chroma's default space,
+distances are squared L2.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from backend.utils.kb_version import get_kb_version
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+VECTOR_STORE_DIR = os.path.join(PROJECT_ROOT, "chroma_db", "vectors")
+
+STORE_FORMAT = 1
+
+# Row counts from which the IVF index is used instead of an exact scan
+ANN_THRESHOLD = int(os.getenv('VECTOR_ANN_THRESHOLD', '20000'))
+# Clusters scanned per query in IVF mode
+ANN_NPROBE = int(os.getenv('VECTOR_ANN_NPROBE', '16'))
+
+
+def kmeans(matrix, clusters, iterations=10, sample_size=None, seed=0):
+    """Centroids of `clusters` k-means clusters, trained on a sample of the rows"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), sample_size or clusters * 64)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroids(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=clusters)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        # Empty clusters keep their old centroid
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+    return centroids
+
+
+def nearest_centroids(matrix, centroids, chunk_size=65536):
+    """Index of the closest centroid for every row, computed in chunks to bound memory"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return labels
+
+
+class NumpyVectorStore:
+    """Read-only vector search with Chroma's query()/get() result layout
+
+    Args:
+        ids: Chunk ids, in corpus order
+        documents: Chunk texts
+        metadatas: Chunk metadata dicts
+        matrix: float32 embeddings, one row per vector (grouped by cluster in IVF mode)
+        rows: Corpus index of each matrix row
+        norms: Squared L2 norm of each matrix row
+        centroids: IVF cluster centroids, or None for exact search
+        offsets: Start row of each cluster, plus the total row count
+        nprobe: Clusters scanned per query in IVF mode
+    """
+
+    def __init__(self, ids, documents, metadatas, matrix, rows, norms, centroids=None, offsets=None,
+                 nprobe=ANN_NPROBE):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.matrix = matrix
+        self.rows = rows
+        self.norms = norms
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, ids, documents, metadatas, embeddings, ann_threshold=ANN_THRESHOLD, nprobe=ANN_NPROBE,
+              dimensions=None):
+        """Store over `embeddings`, with an IVF index when there are at least `ann_threshold` rows
+
+        `dimensions` sizes the matrix of an empty store (nothing ingested yet).
+        """
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(ids), -1) if len(ids) else np.zeros((0, dimensions or 0), dtype=np.float32)
+        rows = np.arange(len(matrix), dtype=np.int64)
+        centroids = offsets = None
+
+        if len(matrix) >= ann_threshold:
+            clusters = max(1, int(np.sqrt(len(matrix))))
+            centroids = kmeans(matrix, clusters)
+            labels = nearest_centroids(matrix, centroids)
+            rows = np.argsort(labels, kind='stable')
+            matrix = matrix[rows]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=clusters))]).astype(np.int64)
+
+        norms = (matrix ** 2).sum(axis=1)
+        return cls(ids, documents, metadatas, matrix, rows, norms, centroids, offsets, nprobe)
+
+    @property
+    def ann(self):
+        return self.centroids is not None
+
+    def count(self):
+        return len(self.ids)
+
+    def _candidates(self, query):
+        """Matrix row ranges to scan for `query`"""
+        if not self.ann:
+            return [(0, len(self.matrix))]
+        distances = (self.centroids ** 2).sum(axis=1) - 2 * self.centroids @ query
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        return [(self.offsets[c], self.offsets[c + 1]) for c in probed if self.offsets[c + 1] > self.offsets[c]]
+
+    def _search(self, query, n_results):
+        """(corpus indices, squared L2 distances) of the nearest rows, closest first"""
+        ranges = self._candidates(query)
+        if not ranges:
+            return [], []
+        # Each cluster is a contiguous slice of the matrix, scanned without copying it
+        candidates = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([
+            self.norms[start:end] - 2 * (self.matrix[start:end] @ query) for start, end in ranges
+        ])
+
+        k = min(n_results, len(candidates))
+        if k == 0:
+            return [], []
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top])]
+        distances = np.maximum(scores[top] + float(query @ query), 0)
+        return self.rows[candidates[top]], distances
+
+    def _search_exact_batch(self, queries, n_results):
+        """_search() for many queries in exact mode: one matrix-matrix product"""
+        k = min(n_results, len(self.matrix))
+        if k == 0:
+            return [([], []) for _ in queries]
+        scores = self.norms[:, None] - 2 * (self.matrix @ queries.T)
+        top = np.argpartition(scores, k - 1, axis=0)[:k]
+        hits = []
+        for j in range(len(queries)):
+            column = top[:, j][np.argsort(scores[top[:, j], j])]
+            distances = np.maximum(scores[column, j] + float(queries[j] @ queries[j]), 0)
+            hits.append((self.rows[column], distances))
+        return hits
+
+    def query(self, query_embeddings, n_results=10, **kwargs):
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if len(self.matrix) == 0:
+            # Nothing ingested: empty results per query, as Chroma returns
+            hits = [([], []) for _ in queries]
+        elif len(queries) > 1 and not self.ann:
+            hits = self._search_exact_batch(queries, n_results)
+        else:
+            hits = [self._search(query, n_results) for query in queries]
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for rows, distances in hits:
+            results['ids'].append([self.ids[i] for i in rows])
+            results['documents'].append([self.documents[i] for i in rows])
+            results['metadatas'].append([self.metadatas[i] for i in rows])
+            results['distances'].append([float(d) for d in distances])
+        return results
+
+    def get(self, ids=None, include=None, **kwargs):
+        if ids is None:
+            rows = range(len(self.ids))
+        else:
+            index = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+            rows = [index[chunk_id] for chunk_id in ids if chunk_id in index]
+        return {
+            'ids': [self.ids[i] for i in rows],
+            'documents': [self.documents[i] for i in rows],
+            'metadatas': [self.metadatas[i] for i in rows]
+        }
+
+    def save(self, path):
+        """Write the store to directory `path`, replacing any previous one"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {'matrix': self.matrix, 'rows': self.rows, 'norms': self.norms}
+        if self.ann:
+            arrays.update(centroids=self.centroids, offsets=self.offsets)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(tmp_path, 'chunks.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format': STORE_FORMAT, 'ids': self.ids, 'documents': self.documents,
+                       'metadatas': self.metadatas}, f)
+
+        old_path = f"{path}.{os.getpid()}.old"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, nprobe=ANN_NPROBE):
+        """Store saved at `path` with its arrays memory-mapped, or None if there is none"""
+        try:
+            with open(os.path.join(path, 'chunks.json'), 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f"Error reading vector store: {e}")
+            return None
+        if chunks.get('format') != STORE_FORMAT:
+            print("Vector store format is outdated; rebuild it with `python -m backend.utils.vector_store`")
+            return None
+
+        def array(name):
+            file_path = os.path.join(path, f"{name}.npy")
+            return np.load(file_path, mmap_mode='r') if os.path.exists(file_path) else None
+
+        centroids = array('centroids')
+        return cls(chunks['ids'], chunks['documents'], chunks['metadatas'], array('matrix'), array('rows'),
+                   array('norms'), None if centroids is None else np.asarray(centroids), array('offsets'), nprobe)
+
+
+def vector_store_path(collection_name):
+    return os.path.join(VECTOR_STORE_DIR, collection_name)
+
+
+def build_vector_store(collection, collection_name, dimensions=None):
+    """Copy every vector in `collection` into a saved NumpyVectorStore
+
+    `dimensions` is the embedding size, kept even when the collection is empty.
+    """
+    start = time.perf_counter()
+    chunks = collection.get(include=['documents', 'metadatas', 'embeddings'])
+    store = NumpyVectorStore.build(chunks['ids'], chunks['documents'], chunks['metadatas'], chunks['embeddings'],
+                                   dimensions=dimensions)
+    store.save(vector_store_path(collection_name))
+    print(f"Vector store: {store.count()} vectors ({'IVF' if store.ann else 'exact'}) "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return store
+
+
+def vector_store_backend():
+    """The VECTOR_STORE setting: chroma (default) or numpy"""
+    return os.getenv('VECTOR_STORE', 'chroma').lower()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(collection_name):
+    """Process-wide store for `collection_name`, reloaded when the knowledge base version changes
+
+    Returns None when no store has been built for the collection. That is
+    not cached: save() swaps directories in two steps, so a load can briefly
+    find nothing, and the next call tries again.
+    """
+    version = get_kb_version()
+    cached = _stores.get(collection_name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _stores_lock:
+        cached = _stores.get(collection_name)
+        if cached is None or cached[0] != version:
+            store = NumpyVectorStore.load(vector_store_path(collection_name))
+            if store is None:
+                return None
+            _stores[collection_name] = (version, store)
+        return _stores[collection_name][1]
+
+
+if __name__ == "__main__":
+    from backend.utils.clients import get_chroma_client
+    from backend.utils.embedding_providers import collection_name, get_embedding_provider
+
+    name = collection_name()
+    build_vector_store(get_chroma_client().get_collection(name=name), name, get_embedding_provider().dimensions)
@@ -10,7 +10,7 @@ interface Message {
   text: string;
   isBot: boolean;
   timestamp: string;
-  conversationId?: number;
+  conversationId?: number | string;
 }
 
 interface Stats {
@@ -8,7 +8,7 @@ interface ChatMessageProps {
   isBot: boolean;
   timestamp: string;
   showFeedback?: boolean;
-  conversationId?: number;
+  conversationId?: number | string;
 }
 
 export function ChatMessage({ message, isBot, timestamp, showFeedback, conversationId }: ChatMessageProps) {
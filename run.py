@@ -1,17 +1,37 @@
 """
 Convenience script to run the Supabase Support Agent web app
+
+Usage:
+    python run.py                          # Flask development server
+    python run.py --asgi                   # async server (uvicorn)
+    python run.py --asgi --workers 4       # async server, several worker processes
 """
 import os
 import sys
+import argparse
 
 # Add project root to path
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, PROJECT_ROOT)
 
-from backend.api.app import app
-
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the Supabase Support Agent web app')
+    parser.add_argument('--asgi', action='store_true',
+                        help='Serve the async app (backend/api/asgi.py) with uvicorn instead of Flask')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (--asgi only)')
+    args = parser.parse_args()
+
     print("Starting Supabase Support Agent...")
-    print("Open http://localhost:5000 in your browser")
+    print(f"Open http://localhost:{args.port} in your browser")
     print("-" * 40)
-    app.run(debug=True, port=5000)
+
+    if args.asgi:
+        import uvicorn
+
+        uvicorn.run('backend.api.asgi:app', host=args.host, port=args.port, workers=args.workers)
+    else:
+        from backend.api.app import app
+
+        app.run(debug=True, host=args.host, port=args.port)
@@ -0,0 +1,141 @@
+"""
+Offline throughput and latency benchmark for the chat pipeline
+
+Replays questions through chat() with a fake Bedrock client (configurable
+latency, deterministic embeddings), an in-memory vector collection built
+from data/raw and a SQLite conversation store. Reports p50/p95/p99 per
+pipeline stage and requests per second at each concurrency level.
+
+Usage:
+    python scripts/benchmark_chat.py
+    python scripts/benchmark_chat.py --concurrency 1 8 32 --requests 500
+    python scripts/benchmark_chat.py --prompt-cache --no-answer-cache      # prompt cache token savings
+    python scripts/benchmark_chat.py --export-questions questions.json   # needs PostgreSQL
+    python scripts/benchmark_chat.py --questions questions.json --save baseline.json
+    python scripts/benchmark_chat.py --baseline baseline.json            # exit 1 on regression
+"""
+import os
+import sys
+import json
+import argparse
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.evaluation.fakes import FakeBedrock, InMemoryCollection, SQLiteConversationStore, build_knowledge_base
+from backend.evaluation.harness import (
+    ChatBenchmark,
+    load_questions,
+    export_questions,
+    format_report,
+    compare_to_baseline,
+    environment_info
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chat() offline against fake Bedrock and Chroma')
+    parser.add_argument('--questions', help='JSON export of get_most_asked_questions() or a text file, one question per line')
+    parser.add_argument('--export-questions', metavar='PATH',
+                        help='Export the most asked questions from PostgreSQL to PATH and exit')
+    parser.add_argument('--export-limit', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8],
+                        help='Worker threads; one run per value')
+    parser.add_argument('--requests', type=int, default=200, help='Turns per run')
+    parser.add_argument('--session-turns', type=int, default=1,
+                        help='Consecutive turns sent in the same session')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--stream', action='store_true', help='Use chat_stream() and report time to first token')
+    parser.add_argument('--embed-latency-ms', type=float, default=50)
+    parser.add_argument('--llm-latency-ms', type=float, default=500)
+    parser.add_argument('--jitter', type=float, default=0.2, help='Latency std dev as a fraction of the mean')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of Bedrock calls that are throttled')
+    parser.add_argument('--store', default=':memory:', help="SQLite path for the conversation log (default in memory)")
+    parser.add_argument('--no-answer-cache', action='store_true', help='Disable the semantic answer cache')
+    parser.add_argument('--prompt-cache', action='store_true',
+                        help='Send cacheable prompt prefixes (PROMPT_CACHE=1) and report cache token usage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='PATH', help='Write the results as JSON (usable as a --baseline)')
+    parser.add_argument('--baseline', metavar='PATH', help='Compare against a saved run and exit 1 on regression')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed p95/throughput regression as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    if args.export_questions:
+        count = export_questions(args.export_questions, limit=args.export_limit)
+        print(f"Exported {count} questions to {args.export_questions}")
+        return 0
+
+    if args.no_answer_cache:
+        os.environ['ANSWER_CACHE'] = '0'
+    if args.prompt_cache:
+        os.environ['PROMPT_CACHE'] = '1'
+
+    questions = load_questions(args.questions)
+
+    print("="*80)
+    print("CHAT PIPELINE BENCHMARK (offline)")
+    print("="*80)
+    print(f"{len(questions)} questions, {args.requests} requests per run, "
+          f"fake latency: embed {args.embed_latency_ms:g} ms, LLM {args.llm_latency_ms:g} ms")
+
+    results = []
+    for concurrency in args.concurrency:
+        # Fresh stand-ins per run so caches and history don't leak between concurrency levels
+        bedrock = FakeBedrock(
+            embed_latency_ms=args.embed_latency_ms,
+            llm_latency_ms=args.llm_latency_ms,
+            jitter=args.jitter,
+            throttle_rate=args.throttle_rate,
+            seed=args.seed
+        )
+        collection = InMemoryCollection()
+        chunks = build_knowledge_base(collection, bedrock.embed)
+        store = SQLiteConversationStore(args.store)
+
+        benchmark = ChatBenchmark(bedrock=bedrock, collection=collection, store=store, stream=args.stream)
+        try:
+            result = benchmark.run(
+                questions,
+                concurrency=concurrency,
+                requests=args.requests,
+                session_turns=args.session_turns,
+                warmup=args.warmup,
+                seed=args.seed
+            )
+        finally:
+            benchmark.close()
+
+        result['bedrock_calls'] = dict(bedrock.calls)
+        result['intents'] = store.intent_counts()
+        result['tokens'] = store.token_totals()
+        store.close()
+        results.append(result)
+
+        print(f"\n{format_report(result)}")
+        print(f"  knowledge base: {chunks} chunks, Bedrock calls: {result['bedrock_calls']}")
+        print(f"  intents: {result['intents']}")
+        print(f"  Claude tokens: {result['tokens']}")
+
+    report = {'environment': environment_info(), 'args': vars(args), 'results': results}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, max_regression=args.max_regression)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Benchmark embedding providers: latency, throughput and retrieval quality
+
+Chunks data/raw the way the ingest script does, embeds the corpus with each
+provider (backend/utils/embedding_providers.py) into an in-memory vector
+collection, then reports:
+
+- single-query latency (one text per call, as chat() embeds a question)
+- batch throughput while encoding the corpus
+- known-item recall@k: a sentence is taken from a random chunk and the
+  chunk (or another chunk containing the same sentence) has to come back
+  in the top k; this rewards word overlap, so read it with the next metric
+- agreement with Titan: the share of Titan's top-k chunks a provider also
+  returns for the sample questions (only when Titan is among the providers
+  and AWS credentials are configured)
+
+A provider that cannot start (no AWS credentials, no chromadb ONNX model)
+is reported and skipped.
+
+Usage:
+    python scripts/benchmark_embeddings.py
+    python scripts/benchmark_embeddings.py --providers hashing minilm --probes 500
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.evaluation.fakes import InMemoryCollection, build_knowledge_base
+from backend.evaluation.harness import load_questions, percentiles
+from backend.utils.chunking import embedding_text
+from backend.utils.embedding_providers import PROVIDERS, create_embedding_provider
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]?")
+
+
+def corpus():
+    """(ids, embedding texts, documents) of every data/raw chunk"""
+    collection = InMemoryCollection()
+    build_knowledge_base(collection, lambda text: [0.0])
+    chunks = collection.get(include=['documents', 'metadatas'])
+    texts = [
+        embedding_text(metadata['title'], {'heading': metadata['heading'], 'text': document})
+        for document, metadata in zip(chunks['documents'], chunks['metadatas'])
+    ]
+    return chunks['ids'], texts, chunks['documents']
+
+
+def known_item_probes(ids, documents, count, seed=7):
+    """(sentence, ids of chunks containing it) for `count` random chunks"""
+    rng = random.Random(seed)
+    probes = []
+    order = list(range(len(ids)))
+    rng.shuffle(order)
+    for i in order:
+        sentences = [s.strip() for s in SENTENCE_PATTERN.findall(documents[i]) if len(s.split()) >= 8]
+        if not sentences:
+            continue
+        sentence = ' '.join(rng.choice(sentences).split()[:16])
+        relevant = {ids[j] for j, document in enumerate(documents) if sentence in ' '.join(document.split())}
+        probes.append((sentence, relevant or {ids[i]}))
+        if len(probes) >= count:
+            break
+    return probes
+
+
+def embed_corpus(provider, texts, batch_size):
+    """Embed `texts` in batches; returns (vectors, chunks per second)"""
+    vectors = []
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        vectors.extend(provider.embed(texts[offset:offset + batch_size]))
+    elapsed = time.perf_counter() - start
+    return vectors, len(texts) / elapsed if elapsed > 0 else 0
+
+
+def top_ids(collection, provider, queries, k):
+    """Query -> top-k ids, plus the per-query embedding latencies in ms"""
+    results, samples = {}, []
+    for query in queries:
+        start = time.perf_counter()
+        embedding = provider.embed([query])[0]
+        samples.append((time.perf_counter() - start) * 1000)
+        results[query] = collection.query(query_embeddings=[embedding], n_results=k)['ids'][0]
+    return results, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare embedding providers on the data/raw corpus')
+    parser.add_argument('--providers', nargs='+', default=list(PROVIDERS), choices=list(PROVIDERS),
+                        help='Providers to benchmark')
+    parser.add_argument('--probes', type=int, default=200, help='Known-item queries for recall')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 10], help='Cutoffs for recall@k')
+    parser.add_argument('--batch-size', type=int, default=64, help='Texts per embed() call for the corpus')
+    parser.add_argument('--questions', help='Question file for the Titan agreement check '
+                                            '(see benchmark_chat.py --questions)')
+    args = parser.parse_args()
+
+    ids, texts, documents = corpus()
+    probes = known_item_probes(ids, documents, args.probes)
+    questions = sorted(set(load_questions(args.questions)))
+    k_max = max(args.k)
+
+    print("="*80)
+    print("EMBEDDING PROVIDER BENCHMARK")
+    print("="*80)
+    print(f"Corpus: {len(ids)} chunks, {len(probes)} known-item probes, {len(questions)} questions\n")
+
+    rankings = {}
+    rows = []
+    for name in args.providers:
+        try:
+            provider = create_embedding_provider(name)
+            provider.embed(["warm up"])
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+
+        vectors, throughput = embed_corpus(provider, texts, args.batch_size)
+        collection = InMemoryCollection()
+        collection.add(ids=ids, documents=documents, embeddings=vectors)
+
+        probe_hits, samples = top_ids(collection, provider, [sentence for sentence, _ in probes], k_max)
+        recall = {
+            k: sum(bool(relevant & set(probe_hits[sentence][:k])) for sentence, relevant in probes) / len(probes)
+            for k in args.k
+        }
+        rankings[name], _ = top_ids(collection, provider, questions, k_max)
+        rows.append((name, provider, percentiles(samples), throughput, recall))
+
+    if not rows:
+        print("No provider could be benchmarked")
+        return 1
+
+    recall_header = ''.join(f"{'R@' + str(k):>7}" for k in args.k)
+    print(f"\n{'provider':<9} {'dims':>5} {'query p50':>10} {'p95 ms':>8} {'chunks/s':>9}{recall_header}")
+    for name, provider, latency, throughput, recall in rows:
+        recall_cells = ''.join(f"{recall[k]:>7.2f}" for k in args.k)
+        print(f"{name:<9} {provider.dimensions:>5} {latency['p50']:>10.2f} {latency['p95']:>8.2f} "
+              f"{throughput:>9.0f}{recall_cells}")
+
+    if 'titan' in rankings:
+        print(f"\nShare of Titan's top {k_max} chunks also returned, over {len(questions)} questions:")
+        for name, ranking in rankings.items():
+            if name == 'titan':
+                continue
+            overlap = sum(
+                len(set(ranking[q]) & set(rankings['titan'][q])) / max(len(rankings['titan'][q]), 1)
+                for q in questions
+            ) / len(questions)
+            print(f"  {name:<9} {overlap:.2f}")
+    else:
+        print("\nTitan was not benchmarked; agreement with Titan is not reported")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Microbenchmark for intent classification keyword matching
+
+Compares the compiled KeywordMatcher (one scan per message, incremental
+history context) with the previous approach of one `any(kw in text ...)`
+scan per keyword list and a rescan of recent history on every turn.
+Runs offline; no AWS or ChromaDB needed.
+
+Usage:
+    python scripts/benchmark_intent.py
+    python scripts/benchmark_intent.py --sizes 100 10000 100000 --turns 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.utils.intent import KEYWORDS, matcher, scan_message, classify_intent, get_conversation_context
+
+
+def load_corpus_words():
+    """Words from the scraped docs, so messages look like real pasted content"""
+    words = []
+    raw_dir = os.path.join(PROJECT_ROOT, "data", "raw")
+    for filename in sorted(os.listdir(raw_dir))[:20]:
+        if filename.endswith('.txt'):
+            with open(os.path.join(raw_dir, filename), 'r', encoding='utf-8') as f:
+                words.extend(f.read().split())
+    return words or KEYWORDS['followup']
+
+
+def make_message(words, size):
+    text = []
+    length = 0
+    while length < size:
+        word = random.choice(words)
+        text.append(word)
+        length += len(word) + 1
+    return ' '.join(text)[:size]
+
+
+LOG_LINES = [
+    'Error: relation "public.profiles" does not exist at character 15',
+    '    at Connection.parseE (/app/node_modules/pg/lib/connection.js:614:13)',
+    '    at Socket.emit (node:events:513:28)',
+    'GET /rest/v1/profiles?select=* 404 12ms',
+    'AuthApiError: Invalid Refresh Token: Refresh Token Not Found',
+]
+
+
+def make_log(size):
+    """A pasted log or stack trace: few distinct lines repeated with varying ids"""
+    lines = []
+    length = 0
+    while length < size:
+        line = f"{random.choice(LOG_LINES)} request_id={random.randint(0, 99999)}"
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)[:size]
+
+
+def naive_hits(text):
+    """Previous approach: one any() scan per keyword list"""
+    text = text.lower()
+    return {category: any(keyword in text for keyword in keywords) for category, keywords in KEYWORDS.items()}
+
+
+def naive_turn(message, history):
+    """Keyword work the old chat() did per turn: message scans plus history rescans"""
+    naive_hits(message)
+    recent = history[-6:]
+    any(naive_hits(m['content'])['context'] for m in recent)
+    any(naive_hits(m['content'])['supabase_check'] for m in history[-2:])
+    [naive_hits(m['content'])['topic'] for m in history[-8:] if m['role'] == 'user']
+    user_messages = [m for m in history if m['role'] == 'user'][-6:]
+    any(naive_hits(m['content'])['context'] for m in user_messages)
+
+
+def compiled_turn(message, history):
+    """Current approach: memoized single scan plus incremental history context"""
+    scan_message(message)
+    context = get_conversation_context(history)
+    context.any_recent('context', 6)
+    context.any_recent('supabase_check', 2)
+    context.recent(8, role='user')
+    any(h.has('context') for h in context.recent(role='user')[-6:])
+
+
+def timeit(fn, *args, min_time=0.3):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn(*args)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs * 1000
+
+
+def benchmark_messages(words, sizes):
+    print(f"\n{'Message':>20} {'per-list scans':>16} {'compiled scan':>15} {'speedup':>9}")
+    print("-" * 64)
+    for size in sizes:
+        for kind, message in (('docs', make_message(words, size)), ('log', make_log(size))):
+            # Same answers, category by category
+            hits = matcher.scan(message.lower())
+            assert {c: hits.has(c) for c in KEYWORDS} == naive_hits(message)
+
+            naive_ms = timeit(naive_hits, message)
+            compiled_ms = timeit(matcher.scan, message.lower())
+            label = f"{size:,} chars {kind}"
+            print(f"{label:>20} {naive_ms:>13.3f} ms {compiled_ms:>12.3f} ms {naive_ms / compiled_ms:>8.1f}x")
+
+
+def benchmark_conversation(words, turns, sizes):
+    """A whole session: every turn classifies a new message against the growing history"""
+    print(f"\nConversation of {turns} turns (answers twice the message size)")
+    print(f"{'Message size':>14} {'per-list + rescans':>20} {'compiled + incremental':>24} {'speedup':>9}")
+    print("-" * 72)
+    for size in sizes:
+        messages = [make_message(words, size) for _ in range(turns)]
+        answers = [make_message(words, size * 2) for _ in range(turns)]
+
+        def run(turn_fn):
+            history = []
+            start = time.perf_counter()
+            for message, answer in zip(messages, answers):
+                turn_fn(message, history)
+                history.append({"role": "user", "content": message})
+                history.append({"role": "assistant", "content": answer})
+            return (time.perf_counter() - start) * 1000
+
+        scan_message.cache_clear()
+        naive_ms = run(naive_turn)
+        scan_message.cache_clear()
+        compiled_ms = run(compiled_turn)
+        print(f"{size:>14,} {naive_ms:>17.2f} ms {compiled_ms:>21.2f} ms {naive_ms / compiled_ms:>8.1f}x")
+
+
+def benchmark_classify(words, count):
+    messages = [make_message(words, random.randint(10, 200)) for _ in range(count)]
+    scan_message.cache_clear()
+    start = time.perf_counter()
+    for message in messages:
+        classify_intent(message, [])
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"\nclassify_intent on {count} short messages: {elapsed / count * 1000:.1f} us/message")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark intent keyword matching')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='Message sizes in characters')
+    parser.add_argument('--turns', type=int, default=20, help='Turns in the conversation benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    words = load_corpus_words()
+
+    print("="*80)
+    print("INTENT CLASSIFIER BENCHMARK")
+    print("="*80)
+    distinct = len(set().union(*KEYWORDS.values()))
+    print(f"{sum(len(k) for k in KEYWORDS.values())} keywords in {len(KEYWORDS)} lists, {distinct} distinct")
+
+    benchmark_messages(words, args.sizes)
+    benchmark_conversation(words, args.turns, args.sizes[:3])
+    benchmark_classify(words, 2000)
@@ -0,0 +1,132 @@
+"""
+Offline benchmark for the BM25 index and hybrid retrieval
+
+Builds the knowledge base from data/raw into an in-memory vector collection
+(fake deterministic embeddings, so vector rankings are not meaningful but
+their cost is), then measures BM25 index build, save and load time and the
+per-query cost of lexical, vector and fused (reciprocal rank) search.
+`--scale` repeats the corpus to see how the index grows.
+
+Usage:
+    python scripts/benchmark_retrieval.py
+    python scripts/benchmark_retrieval.py --scale 1 10 50 --queries 500
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.evaluation.fakes import FakeBedrock, InMemoryCollection, build_knowledge_base
+from backend.evaluation.harness import load_questions, percentiles
+from backend.utils.lexical import BM25Index, reciprocal_rank_fusion, save_lexical_index, load_lexical_index
+
+# Questions with exact identifiers, where lexical matching should find the right chunk
+IDENTIFIER_QUERIES = [
+    "I'm getting a 502 error",
+    "auth.uid() returns null in my policy",
+    "signInWithOAuth redirect not working",
+    "PGRST116 error",
+    "enable row_level_security on a table",
+]
+
+
+def scaled_corpus(collection, scale):
+    """ids, documents, metadatas of `collection` repeated `scale` times"""
+    chunks = collection.get(include=['documents', 'metadatas'])
+    ids, documents, metadatas = [], [], []
+    for copy in range(scale):
+        ids.extend(f"{chunk_id}~{copy}" for chunk_id in chunks['ids'])
+        documents.extend(chunks['documents'])
+        metadatas.extend(chunks['metadatas'])
+    return ids, documents, metadatas
+
+
+def time_queries(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BM25 and hybrid retrieval offline')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10],
+                        help='Copies of the data/raw corpus to index; one run per value')
+    parser.add_argument('--queries', type=int, default=200, help='Queries timed per search type')
+    parser.add_argument('--candidates', type=int, default=10, help='Results taken from each search before fusing')
+    parser.add_argument('--questions', help='Question file (see benchmark_chat.py --questions)')
+    args = parser.parse_args()
+
+    bedrock = FakeBedrock(embed_latency_ms=0, jitter=0)
+    base = InMemoryCollection()
+    build_knowledge_base(base, bedrock.embed)
+
+    questions = load_questions(args.questions) + IDENTIFIER_QUERIES
+    queries = [questions[i % len(questions)] for i in range(args.queries)]
+
+    print("="*80)
+    print("RETRIEVAL BENCHMARK (offline)")
+    print("="*80)
+
+    for scale in args.scale:
+        ids, documents, metadatas = scaled_corpus(base, scale)
+
+        start = time.perf_counter()
+        index = BM25Index(ids, documents, metadatas)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bm25_index.json')
+            start = time.perf_counter()
+            save_lexical_index(index, path)
+            save_ms = (time.perf_counter() - start) * 1000
+            size_kb = os.path.getsize(path) / 1024
+            start = time.perf_counter()
+            load_lexical_index(path)
+            load_ms = (time.perf_counter() - start) * 1000
+
+        collection = base
+        if scale > 1:
+            collection = InMemoryCollection()
+            collection.add(ids=ids, documents=documents, metadatas=metadatas,
+                           embeddings=[bedrock.embed(text) for text in documents])
+        embeddings = {query: bedrock.embed(query) for query in set(queries)}
+
+        def vector(query):
+            return collection.query(query_embeddings=[embeddings[query]], n_results=args.candidates)
+
+        def lexical(query):
+            return index.search(query, args.candidates)
+
+        def hybrid(query):
+            return reciprocal_rank_fusion([vector(query), lexical(query)], 3)
+
+        print(f"\nCorpus x{scale}: {len(index)} chunks, {len(index.postings)} terms")
+        print(f"  build {build_ms:.1f} ms, save {save_ms:.1f} ms, load {load_ms:.1f} ms, file {size_kb:.0f} KB")
+        print(f"  {'search':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, fn in (('lexical', lexical), ('vector', vector), ('hybrid', hybrid)):
+            stats = time_queries(fn, queries)
+            print(f"  {name:<10} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['p99']:>9.3f}")
+
+    print("\nTop lexical hit for identifier queries:")
+    index = BM25Index(*scaled_corpus(base, 1))
+    for query in IDENTIFIER_QUERIES:
+        results = index.search(query, 1)
+        if results['ids'][0]:
+            metadata = results['metadatas'][0][0]
+            print(f"  {query!r}: {metadata['filename']} > {metadata.get('heading') or 'intro'} "
+                  f"(score {results['scores'][0][0]:.2f})")
+        else:
+            print(f"  {query!r}: no match")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Measure the import-time cost of the web apps and the cost of warm-up
+
+Each measurement runs in a fresh interpreter so nothing is already
+imported. Reports the median wall time of importing each target, the
+modules with the largest cumulative import time (from `python -X
+importtime`) and, with --warm-up, how long warm_up() spends on each
+client and index.
+
+Usage:
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --runs 10 --warm-up
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = ['backend.agents.chat', 'backend.api.app', 'backend.api.asgi']
+
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+TIMED_IMPORT = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+"""
+
+TIMED_WARM_UP = """
+import sys, json
+sys.path.insert(0, {root!r})
+from backend.utils.clients import warm_up
+print(json.dumps(warm_up()))
+"""
+
+
+def run_python(code, *flags):
+    """Run `code` in a fresh interpreter; returns (stdout, stderr)"""
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+    return result.stdout, result.stderr
+
+
+def import_ms(module, runs):
+    samples = []
+    for _ in range(runs):
+        stdout, _ = run_python(TIMED_IMPORT.format(root=PROJECT_ROOT, module=module))
+        samples.append(float(stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def _self_times(code):
+    """Module name -> self import time (ms) reported by -X importtime"""
+    _, stderr = run_python(code, '-X', 'importtime')
+    return {
+        match.group(3): int(match.group(1)) / 1000
+        for match in IMPORTTIME_PATTERN.finditer(stderr)
+    }
+
+
+def slowest_imports(module, top):
+    """Packages by total self import time (ms), slowest first
+
+    Modules the bare interpreter already imports are left out.
+    """
+    baseline = _self_times(TIMED_IMPORT.format(root=PROJECT_ROOT, module='json'))
+    packages = {}
+    for name, ms in _self_times(TIMED_IMPORT.format(root=PROJECT_ROOT, module=module)).items():
+        if name not in baseline:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + ms
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app import time and warm-up cost')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per target')
+    parser.add_argument('--top', type=int, default=8, help='Slowest packages to list per target')
+    parser.add_argument('--warm-up', action='store_true', help='Also time warm_up() (needs chroma_db and AWS settings)')
+    args = parser.parse_args()
+
+    print("="*80)
+    print("STARTUP BENCHMARK")
+    print("="*80)
+
+    for module in TARGETS:
+        try:
+            median_ms = import_ms(module, args.runs)
+        except RuntimeError as e:
+            print(f"\nimport {module}: failed ({e})")
+            continue
+        print(f"\nimport {module}: {median_ms:.0f} ms (median of {args.runs})")
+        for package, ms in slowest_imports(module, args.top):
+            print(f"  {package:<28} {ms:>8.1f} ms")
+
+    if args.warm_up:
+        stdout, _ = run_python(TIMED_WARM_UP.format(root=PROJECT_ROOT))
+        timings = json.loads(stdout.strip().splitlines()[-1])
+        print("\nwarm_up():")
+        for step, ms in timings.items():
+            print(f"  {step:<28} {'failed' if ms is None else f'{ms:.1f} ms':>11}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Benchmark the NumPy vector store against Chroma
+
+Generates clustered unit vectors (like sentence embeddings, which group by
+topic) and, for each corpus size, measures build/save/load time and
+per-query latency of:
+
+- numpy exact: one matrix-vector product over the memory-mapped matrix
+- numpy IVF: the k-means inverted-file index used above VECTOR_ANN_THRESHOLD
+- chroma: a persistent Chroma collection (HNSW), when chromadb is installed
+
+Recall@k of IVF and Chroma is measured against the exact results.
+
+Usage:
+    python scripts/benchmark_vector_store.py
+    python scripts/benchmark_vector_store.py --sizes 100 10000 1000000 --dims 384 --no-chroma
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.evaluation.harness import percentiles
+from backend.utils.vector_store import NumpyVectorStore, ANN_NPROBE
+
+CHROMA_BATCH_SIZE = 5000
+
+
+def clustered_vectors(n, dims, rng, topics=None):
+    """`n` unit vectors scattered around `topics` random directions"""
+    topics = topics or max(4, int(np.sqrt(n) / 2))
+    centers = rng.standard_normal((topics, dims)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vectors = centers[rng.integers(0, topics, n)] + rng.standard_normal((n, dims)).astype(np.float32) / np.sqrt(dims)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def time_queries(search, queries):
+    """(latency percentiles, result ids per query)"""
+    samples, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples), results
+
+
+def recall(results, exact):
+    return float(np.mean([len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results, exact)]))
+
+
+def build_numpy(ids, vectors, ann_threshold, nprobe, tmp):
+    """Build, save and reload (memory-mapped) a store; returns (store, build ms, load ms)"""
+    start = time.perf_counter()
+    store = NumpyVectorStore.build(ids, [''] * len(ids), [{}] * len(ids), vectors,
+                                   ann_threshold=ann_threshold, nprobe=nprobe)
+    path = os.path.join(tmp, f"store-{ann_threshold}")
+    store.save(path)
+    build_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    store = NumpyVectorStore.load(path, nprobe=nprobe)
+    return store, build_ms, (time.perf_counter() - start) * 1000
+
+
+def build_chroma(ids, vectors, tmp):
+    import chromadb
+
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=os.path.join(tmp, 'chroma'))
+    collection = client.create_collection(name=f"bench_{len(ids)}")
+    for offset in range(0, len(ids), CHROMA_BATCH_SIZE):
+        collection.add(ids=ids[offset:offset + CHROMA_BATCH_SIZE],
+                       embeddings=vectors[offset:offset + CHROMA_BATCH_SIZE].tolist())
+    return collection, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the NumPy vector store with Chroma')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='Corpus sizes (vectors); one run per value')
+    parser.add_argument('--dims', type=int, default=384, help='Vector dimensions (Titan uses 1536)')
+    parser.add_argument('--queries', type=int, default=200, help='Queries timed per store')
+    parser.add_argument('--k', type=int, default=10, help='Results per query')
+    parser.add_argument('--nprobe', type=int, default=ANN_NPROBE, help='Clusters scanned per IVF query')
+    parser.add_argument('--no-chroma', action='store_true', help='Skip Chroma (slow to build at large sizes)')
+    args = parser.parse_args()
+
+    use_chroma = not args.no_chroma
+    if use_chroma:
+        try:
+            import chromadb  # noqa: F401
+        except ImportError:
+            print("chromadb is not installed; benchmarking the NumPy store only")
+            use_chroma = False
+
+    print("="*80)
+    print("VECTOR STORE BENCHMARK")
+    print("="*80)
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        vectors = clustered_vectors(size, args.dims, rng)
+        ids = [str(i) for i in range(size)]
+        targets = rng.integers(0, size, args.queries)
+        queries = vectors[targets] + rng.standard_normal((args.queries, args.dims)).astype(np.float32) * 0.5 / np.sqrt(args.dims)
+
+        print(f"\n{size:,} vectors x {args.dims} dims ({vectors.nbytes / 2**20:.1f} MB)")
+        print(f"  {'store':<12} {'build ms':>10} {'load ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>10}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            exact, build_ms, load_ms = build_numpy(ids, vectors, size + 1, args.nprobe, tmp)
+            stats, exact_ids = time_queries(lambda q: exact.query([q], args.k)['ids'][0], queries)
+            print(f"  {'numpy exact':<12} {build_ms:>10.1f} {load_ms:>9.1f} {stats['p50']:>8.3f} {stats['p95']:>8.3f} {1:>10.3f}")
+
+            if size >= 1000:
+                ivf, build_ms, load_ms = build_numpy(ids, vectors, 0, args.nprobe, tmp)
+                stats, ivf_ids = time_queries(lambda q: ivf.query([q], args.k)['ids'][0], queries)
+                print(f"  {'numpy IVF':<12} {build_ms:>10.1f} {load_ms:>9.1f} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+                      f"{recall(ivf_ids, exact_ids):>10.3f}")
+
+            if use_chroma:
+                collection, build_ms = build_chroma(ids, vectors, tmp)
+                stats, chroma_ids = time_queries(
+                    lambda q: collection.query(query_embeddings=[q.tolist()], n_results=args.k)['ids'][0], queries
+                )
+                print(f"  {'chroma':<12} {build_ms:>10.1f} {'':>9} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+                      f"{recall(chroma_ids, exact_ids):>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
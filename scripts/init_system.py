@@ -18,8 +18,12 @@ from scripts.load_data_to_chromadb import load_documents
 from backend.database.database import init_database
 
 
-def init_system(skip_scraping=False):
-    """Initialize the complete system"""
+def init_system(skip_scraping=False, full_reindex=False):
+    """Initialize the complete system
+
+    Re-running is cheap: only documents that changed since the last run are
+    re-embedded unless `full_reindex` is set.
+    """
 
     print("="*80)
     print("INITIALIZING SUPABASE SUPPORT AGENT SYSTEM")
@@ -44,8 +48,8 @@ def init_system(skip_scraping=False):
     # Step 3: Load data into ChromaDB
     print("\n[Step 3/4] Loading data into ChromaDB...")
     print("-"*40)
-    loaded_count = load_documents()
-    print(f"Loaded {loaded_count} documents into ChromaDB")
+    loaded_count = load_documents(full=full_reindex)
+    print(f"Embedded {loaded_count} new or changed chunks into ChromaDB")
 
     # Step 4: Initialize PostgreSQL database
     print("\n[Step 4/4] Initializing PostgreSQL database...")
@@ -72,6 +76,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Initialize the Supabase Support Agent system')
     parser.add_argument('--skip-scraping', action='store_true',
                         help='Skip scraping and only load existing data')
+    parser.add_argument('--full-reindex', action='store_true',
+                        help='Re-embed every document instead of only new or changed ones')
 
     args = parser.parse_args()
-    init_system(skip_scraping=args.skip_scraping)
+    init_system(skip_scraping=args.skip_scraping, full_reindex=args.full_reindex)
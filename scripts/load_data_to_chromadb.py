@@ -1,140 +1,437 @@
 import os
 import json
-import boto3
 from dotenv import load_dotenv
-import chromadb
 import time
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Get project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backend.utils.kb_version import bump_kb_version
+from backend.utils.embedding_providers import get_embedding_provider
+from backend.utils.clients import get_bedrock, get_chroma_client
+from backend.utils.lexical import build_lexical_index, LEXICAL_INDEX_PATH
+from backend.utils.vector_store import build_vector_store, vector_store_path
+from backend.utils.rate_limit import TokenBucket, backoff_delay, is_throttling_error
+from backend.utils.ingest_manifest import (
+    load_manifest,
+    save_manifest,
+    manifest_path,
+    content_hash,
+    metadata_hash
+)
+from backend.utils.chunking import (
+    chunk_document,
+    document_title,
+    embedding_text,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNK_OVERLAP
+)
 
 # Load environment variables
 load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 
-# AWS Bedrock client
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=os.getenv('AWS_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
+# Chunking configuration (characters)
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', str(DEFAULT_CHUNK_SIZE)))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', str(DEFAULT_CHUNK_OVERLAP)))
 
-# ChromaDB client
-chroma_client = chromadb.PersistentClient(path=os.path.join(PROJECT_ROOT, "chroma_db"))
+# Embedding pipeline configuration
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+EMBED_RATE_LIMIT = float(os.getenv('EMBED_RATE_LIMIT', '10'))  # requests per second
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', '6'))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '64'))
 
-# Create or get collection
-collection = chroma_client.get_or_create_collection(
-    name="supabase_knowledge_base",
-    metadata={"description": "Supabase docs and GitHub issues with embeddings"}
-)
 
+def get_or_create_collection(provider):
+    """The embedding provider's collection, created on the first ingest"""
+    return get_chroma_client().get_or_create_collection(
+        name=provider.collection_name,
+        metadata={
+            "description": "Supabase docs and GitHub issues with embeddings",
+            "embedding_model": provider.model_id
+        }
+    )
 
-def generate_embedding(text):
-    """Generate embedding using AWS Bedrock Titan"""
-    try:
-        # Use Titan Embeddings model
-        body = json.dumps({
-            "inputText": text[:8000]  # Titan limit is ~8K chars
-        })
 
-        response = bedrock.invoke_model(
-            modelId='amazon.titan-embed-text-v1',
-            body=body
-        )
+def generate_embedding(text, rate_limiter=None, max_retries=EMBED_MAX_RETRIES):
+    """Generate embedding using AWS Bedrock Titan
+
+    Waits on `rate_limiter` before each request and retries throttled
+    requests with exponential backoff. Returns None if the text could not
+    be embedded.
+    """
+    # Use Titan Embeddings model
+    body = json.dumps({
+        "inputText": text[:8000]  # Titan limit is ~8K chars
+    })
+
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = get_bedrock().invoke_model(
+                modelId='amazon.titan-embed-text-v1',
+                body=body
+            )
+
+            response_body = json.loads(response['body'].read())
+            embedding = response_body['embedding']
+
+            return embedding
+
+        except Exception as e:
+            if is_throttling_error(e) and attempt < max_retries:
+                time.sleep(backoff_delay(attempt))
+                continue
+            print(f"Error generating embedding: {e}")
+            return None
+
+
+def chunk_file(content, filename, source, id_prefix):
+    """Split one raw file into chunks ready for embedding
+
+    Chunk ids are derived from the chunk's content, so an unchanged chunk
+    keeps its id (and its vector) when text elsewhere in the file moves it.
+
+    Returns a list of (id, document, metadata, text_to_embed) tuples.
+    """
+    title = document_title(content)
+    chunks = chunk_document(content, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+
+    records = []
+    seen = {}
+    for chunk in chunks:
+        text = embedding_text(title, chunk)
+        chunk_id = f"{id_prefix}_{filename}#{content_hash(text)[:16]}"
+        # Identical chunks within one file get distinct ids
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+
+        records.append((
+            chunk_id,
+            chunk['text'],
+            {
+                'source': source,
+                'filename': filename,
+                'title': title,
+                'heading': chunk['heading'],
+                'chunk_index': chunk['index'],
+                'chunk_count': len(chunks),
+                'start': chunk['start'],
+                'end': chunk['end']
+            },
+            text
+        ))
+    return records
+
+
+def iter_source_files():
+    """Yield (filepath, filename, source, id_prefix) for every raw document"""
+    sources = [
+        (os.path.join(PROJECT_ROOT, "data", "raw"), 'documentation', 'doc'),
+        (os.path.join(PROJECT_ROOT, "data", "raw", "github"), 'github_issue', 'github'),
+    ]
+    for folder, source, id_prefix in sources:
+        if not os.path.exists(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith('.txt'):
+                yield os.path.join(folder, filename), filename, source, id_prefix
+
+
+class IngestProgress:
+    """Progress and throughput reporting for the embedding pipeline"""
+
+    def __init__(self, total_files, report_every=25):
+        self.total_files = total_files
+        self.report_every = report_every
+        self.files = 0
+        self.embedded = 0
+        self.failed = 0
+        self.start = time.time()
+
+    def chunk_done(self, ok):
+        if ok:
+            self.embedded += 1
+        else:
+            self.failed += 1
+        if (self.embedded + self.failed) % self.report_every == 0:
+            self.report()
+
+    def report(self):
+        elapsed = time.time() - self.start
+        rate = self.embedded / elapsed if elapsed > 0 else 0
+        print(f"  [{self.files}/{self.total_files} files] {self.embedded} chunks embedded, "
+              f"{self.failed} failed, {rate:.1f} chunks/s, {elapsed:.1f}s elapsed")
+
+
+def plan_ingest(files, manifest, full=False):
+    """Compare raw files with the manifest and work out what has to change
+
+    Returns a dict with:
+        embed: chunk records that are new or whose text changed
+        update: (id, document, metadata) for chunks whose text is unchanged
+            but whose metadata (offsets, heading, index) moved
+        delete: ids of chunks that no longer exist
+        files: per-file status ('new', 'changed', 'unchanged', 'deleted')
+        entries: manifest entries describing the files after the ingest
+    """
+    plan = {'embed': [], 'update': [], 'delete': [], 'files': {}, 'entries': {}}
+    old_files = manifest['files']
+    seen_keys = set()
+
+    for filepath, filename, source, id_prefix in files:
+        key = f"{id_prefix}/{filename}"
+        seen_keys.add(key)
+
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+        file_hash = content_hash(content)
+
+        old_entry = old_files.get(key)
+        if old_entry and old_entry.get('hash') == file_hash and not full:
+            plan['files'][key] = 'unchanged'
+            plan['entries'][key] = old_entry
+            continue
+
+        plan['files'][key] = 'changed' if old_entry else 'new'
+        old_chunks = old_entry.get('chunks', {}) if old_entry else {}
 
-        response_body = json.loads(response['body'].read())
-        embedding = response_body['embedding']
+        new_chunks = {}
+        for record in chunk_file(content, filename, source, id_prefix):
+            chunk_id, document, metadata, _ = record
+            new_chunks[chunk_id] = metadata_hash(metadata)
+            if full or chunk_id not in old_chunks:
+                plan['embed'].append(record)
+            elif old_chunks[chunk_id] != new_chunks[chunk_id]:
+                plan['update'].append((chunk_id, document, metadata))
 
-        return embedding
+        plan['delete'].extend(chunk_id for chunk_id in old_chunks if chunk_id not in new_chunks)
+        plan['entries'][key] = {'hash': file_hash, 'chunks': new_chunks}
 
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        return None
+    for key, old_entry in old_files.items():
+        if key not in seen_keys:
+            plan['files'][key] = 'deleted'
+            plan['delete'].extend(old_entry.get('chunks', {}))
 
+    return plan
 
-def load_documents():
-    """Load all documents from data/raw and add to ChromaDB"""
+
+def print_plan(plan):
+    counts = {}
+    for key, status in sorted(plan['files'].items()):
+        counts[status] = counts.get(status, 0) + 1
+        if status != 'unchanged':
+            print(f"  {status:>9}: {key}")
+    summary = ', '.join(f"{n} {status}" for status, n in sorted(counts.items()))
+    print(f"Files: {summary or 'none'}")
+    print(f"Chunks: {len(plan['embed'])} to embed, {len(plan['update'])} metadata updates, "
+          f"{len(plan['delete'])} to delete")
+
+
+def load_documents(concurrency=EMBED_CONCURRENCY, rate_limit=EMBED_RATE_LIMIT,
+                   batch_size=INGEST_BATCH_SIZE, dry_run=False, full=False):
+    """Incrementally sync ChromaDB with the documents in data/raw
+
+    A manifest of file and chunk hashes (chroma_db/ingest_manifest.json,
+    or a per-provider file for local embedding providers) records what is
+    already embedded. Only new or changed chunks are embedded and upserted; chunks of edited or removed files that no longer
+    exist are deleted. `dry_run` only reports the plan; `full` re-embeds
+    everything. The BM25 index (chroma_db/bm25_index.json) and the NumPy
+    vector store (chroma_db/vectors/) are then rebuilt from the collection.
+
+    With Titan, chunks are embedded by a pool of `concurrency` threads
+    sharing a token bucket of `rate_limit` requests per second. A local
+    provider encodes `batch_size` chunks per call on the CPU instead.
+    Finished chunks are written to Chroma every `batch_size` chunks, so only
+    one batch of embeddings (and a bounded number of in-flight requests) is
+    held in memory at a time.
+
+    Returns the number of chunks embedded (or that would be, for a dry run).
+    """
 
     print("Starting to load documents into ChromaDB...")
     print("="*80)
 
-    documents = []
-    metadatas = []
-    ids = []
-    embeddings = []
+    # Each embedding provider (EMBEDDING_PROVIDER) has its own collection and manifest
+    provider = get_embedding_provider()
+    manifest_file = manifest_path(provider.name)
+    collection = get_or_create_collection(provider)
 
-    # Load documentation files
-    docs_path = os.path.join(PROJECT_ROOT, "data", "raw")
-    if os.path.exists(docs_path):
-        for filename in os.listdir(docs_path):
-            if filename.endswith('.txt'):
-                filepath = os.path.join(docs_path, filename)
-
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                # Generate embedding
-                print(f"Processing: {filename}")
-                embedding = generate_embedding(content)
-
-                if embedding:
-                    documents.append(content)
-                    metadatas.append({
-                        'source': 'documentation',
-                        'filename': filename
-                    })
-                    ids.append(f"doc_{filename}")
-                    embeddings.append(embedding)
-                    print(f"  Added to collection")
-
-                # Be nice to API - wait between requests
-                time.sleep(1)
-
-    # Load GitHub issues
-    github_path = os.path.join(PROJECT_ROOT, "data", "raw", "github")
-    if os.path.exists(github_path):
-        for filename in os.listdir(github_path):
-            if filename.endswith('.txt'):
-                filepath = os.path.join(github_path, filename)
-
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                # Generate embedding
-                print(f"Processing: {filename}")
-                embedding = generate_embedding(content)
-
-                if embedding:
-                    documents.append(content)
-                    metadatas.append({
-                        'source': 'github_issue',
-                        'filename': filename
-                    })
-                    ids.append(f"github_{filename}")
-                    embeddings.append(embedding)
-                    print(f"  Added to collection")
-
-                # Be nice to API
-                time.sleep(1)
-
-    # Add all documents to ChromaDB
-    if documents:
-        print(f"\n{'='*80}")
-        print(f"Adding {len(documents)} documents to ChromaDB...")
-
-        collection.add(
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
+    settings = {
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+        'embedding_model': provider.model_id
+    }
+    manifest, manifest_existed = load_manifest(settings, manifest_file)
+
+    files = list(iter_source_files())
+    plan = plan_ingest(files, manifest, full=full)
+
+    if not manifest_existed:
+        # No record of what is in the collection: drop anything the new layout won't recreate
+        wanted = {chunk_id for entry in plan['entries'].values() for chunk_id in entry['chunks']}
+        existing = collection.get(include=[])['ids']
+        plan['delete'].extend(chunk_id for chunk_id in existing if chunk_id not in wanted)
+
+    print_plan(plan)
+    if dry_run:
+        print("Dry run: no changes made")
+        return len(plan['embed'])
+
+    if not (plan['embed'] or plan['update'] or plan['delete']):
+        save_manifest({'version': manifest['version'], 'settings': settings, 'files': plan['entries']}, manifest_file)
+        if not (os.path.exists(LEXICAL_INDEX_PATH) and os.path.exists(vector_store_path(provider.collection_name))):
+            build_lexical_index(collection)
+            build_vector_store(collection, provider.collection_name, provider.dimensions)
+            bump_kb_version()
+        print("Knowledge base is up to date")
+        return 0
+
+    if provider.local:
+        print(f"Embedding provider: {provider.name} (local), batch size: {batch_size}")
+    else:
+        print(f"Concurrency: {concurrency}, rate limit: {rate_limit}/s, batch size: {batch_size}")
+
+    for start in range(0, len(plan['delete']), batch_size):
+        collection.delete(ids=plan['delete'][start:start + batch_size])
+
+    for start in range(0, len(plan['update']), batch_size):
+        updates = plan['update'][start:start + batch_size]
+        collection.update(
+            ids=[u[0] for u in updates],
+            documents=[u[1] for u in updates],
+            metadatas=[u[2] for u in updates]
         )
 
-        print(f"Successfully loaded {len(documents)} documents!")
-        print(f"Collection now has {collection.count()} total documents")
+    changed_files = [key for key, status in plan['files'].items() if status in ('new', 'changed')]
+    progress = IngestProgress(total_files=len(changed_files))
+    rate_limiter = TokenBucket(rate_limit, capacity=concurrency)
+
+    batch = {'ids': [], 'documents': [], 'embeddings': [], 'metadatas': []}
+    added = 0
+    failed_ids = set()
 
-    return len(documents)
+    def flush_batch():
+        nonlocal added
+        if not batch['ids']:
+            return
+        collection.upsert(**batch)
+        added += len(batch['ids'])
+        for values in batch.values():
+            values.clear()
+
+    def collect(result):
+        chunk_id, document, metadata, embedding = result
+        progress.chunk_done(embedding is not None)
+        if embedding is None:
+            failed_ids.add(chunk_id)
+            return
+        batch['ids'].append(chunk_id)
+        batch['documents'].append(document)
+        batch['embeddings'].append(embedding)
+        batch['metadatas'].append(metadata)
+        if len(batch['ids']) >= batch_size:
+            flush_batch()
+
+    def embed_record(record):
+        chunk_id, document, metadata, text = record
+        return chunk_id, document, metadata, generate_embedding(text, rate_limiter)
+
+    current_file = None
+
+    def start_file(filename):
+        nonlocal current_file
+        if filename != current_file:
+            if current_file is not None:
+                progress.files += 1
+            current_file = filename
+            print(f"Processing: {filename}")
+
+    if provider.local:
+        for start in range(0, len(plan['embed']), batch_size):
+            records = plan['embed'][start:start + batch_size]
+            try:
+                embeddings = provider.embed([record[3] for record in records])
+            except Exception as e:
+                print(f"Error generating embeddings: {e}")
+                embeddings = [None] * len(records)
+            for (chunk_id, document, metadata, _), embedding in zip(records, embeddings):
+                start_file(metadata['filename'])
+                collect((chunk_id, document, metadata, embedding))
+    else:
+        in_flight = set()
+        max_in_flight = concurrency * 2
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for record in plan['embed']:
+                start_file(record[2]['filename'])
+
+                # Keep a bounded window of requests in flight so memory stays flat
+                while len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+                in_flight.add(executor.submit(embed_record, record))
+
+            for future in in_flight:
+                collect(future.result())
+
+    if current_file is not None:
+        progress.files += 1
+
+    # Add the final partial batch
+    flush_batch()
+
+    # Chunks that failed to embed are left out of the manifest so the next run retries them
+    for key, entry in plan['entries'].items():
+        missing = [chunk_id for chunk_id in entry['chunks'] if chunk_id in failed_ids]
+        if missing:
+            entry['hash'] = None
+            for chunk_id in missing:
+                del entry['chunks'][chunk_id]
+    save_manifest({'version': manifest['version'], 'settings': settings, 'files': plan['entries']}, manifest_file)
+
+    progress.report()
+    elapsed = time.time() - progress.start
+    print(f"\n{'='*80}")
+    print(f"Embedded {added} chunks from {len(changed_files)} new or changed documents in {elapsed:.1f}s")
+    if progress.failed:
+        print(f"Warning: {progress.failed} chunks could not be embedded (they will be retried next run)")
+    print(f"Collection now has {collection.count()} total chunks")
+
+    # Keyword index over the same chunks, for hybrid retrieval
+    build_lexical_index(collection)
+    # Memory-mapped copy of the vectors for VECTOR_STORE=numpy
+    build_vector_store(collection, provider.collection_name, provider.dimensions)
+
+    # Let running workers drop answers cached against the old corpus (and reload the lexical index)
+    bump_kb_version()
+
+    return added
 
 
 if __name__ == "__main__":
-    count = load_documents()
-    print(f"\nDone! Loaded {count} documents with embeddings into ChromaDB")
+    parser = argparse.ArgumentParser(description='Embed data/raw documents into ChromaDB')
+    parser.add_argument('--concurrency', type=int, default=EMBED_CONCURRENCY,
+                        help='Parallel embedding requests')
+    parser.add_argument('--rate-limit', type=float, default=EMBED_RATE_LIMIT,
+                        help='Maximum embedding requests per second')
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE,
+                        help='Chunks per collection.upsert call')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Report what would be embedded or deleted without changing anything')
+    parser.add_argument('--full', action='store_true',
+                        help='Re-embed every document, ignoring the manifest')
+
+    args = parser.parse_args()
+    count = load_documents(concurrency=args.concurrency, rate_limit=args.rate_limit,
+                           batch_size=args.batch_size, dry_run=args.dry_run, full=args.full)
+    if args.dry_run:
+        print(f"\nDry run complete: {count} chunks would be embedded")
+    else:
+        print(f"\nDone! Embedded {count} chunks into ChromaDB")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Get project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+# Manual scripts that need a built chroma_db; run them directly
+collect_ignore = ['test_chromadb.py', 'check_collections.py']
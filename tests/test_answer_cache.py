@@ -0,0 +1,37 @@
+"""
+Answer cache: thumbs-down evictions shared between workers
+"""
+import sqlite3
+import numpy as np
+from backend.agents import answer_cache
+from backend.agents.answer_cache import AnswerCache
+
+EMBEDDING = np.ones(8) / np.sqrt(8)
+
+
+def test_eviction_reaches_other_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, 'EVICTION_CHECK_INTERVAL', 0)
+    path = str(tmp_path / 'evictions.sqlite3')
+    feedback_worker = AnswerCache(evictions_path=path)
+    chat_worker = AnswerCache(evictions_path=path)
+
+    chat_worker.store('How do I enable RLS?', EMBEDDING, 'Run ALTER TABLE ...', 42)
+    assert chat_worker.lookup(EMBEDDING) is not None
+
+    # Held by the other worker: nothing to remove here, but the eviction is shared
+    assert feedback_worker.evict_conversation('42') is False
+    assert chat_worker.lookup(EMBEDDING) is None
+    assert chat_worker.stats()['invalidations'] == 1
+
+
+def test_only_linked_conversations_recorded(tmp_path):
+    path = str(tmp_path / 'evictions.sqlite3')
+    cache = AnswerCache(evictions_path=path)
+    cache.evict_conversation('not-cached')
+
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT count(*) FROM evictions;").fetchone()[0] == 0
+    # A restarted worker starts after the evictions already published
+    cache.store('q', EMBEDDING, 'a', 7)
+    cache.evict_conversation(7)
+    assert AnswerCache(evictions_path=path).shared.poll() == []
@@ -1,6 +1,3 @@
-import chromadb
-import boto3
-import json
 import os
 import sys
 from dotenv import load_dotenv
@@ -11,38 +8,8 @@ sys.path.insert(0, PROJECT_ROOT)
 
 load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
 
-# Connect to ChromaDB
-client = chromadb.PersistentClient(path=os.path.join(PROJECT_ROOT, "chroma_db"))
-
-collection = client.get_collection(name="supabase_knowledge_base")
-
-# Bedrock for generating query embeddings
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=os.getenv('AWS_REGION'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
-
-
-def search_knowledge_base(query, n_results=3):
-    """Search the knowledge base"""
-
-    # Generate embedding for the query
-    body = json.dumps({"inputText": query})
-    response = bedrock.invoke_model(
-        modelId='amazon.titan-embed-text-v1',
-        body=body
-    )
-    query_embedding = json.loads(response['body'].read())['embedding']
-
-    # Search ChromaDB
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results
-    )
-
-    return results
+from backend.utils.embeddings import get_embedding_cache_stats
+from backend.utils.retrieval import search_many
 
 
 # Test queries
@@ -56,18 +23,22 @@ if __name__ == "__main__":
     print("Testing Knowledge Base Search")
     print("="*80)
 
-    for query in test_queries:
+    # One batched search for all queries
+    results_list = search_many(test_queries, n_results=2)
+
+    for query, results in zip(test_queries, results_list):
         print(f"\nQuery: {query}")
         print("-"*80)
 
-        results = search_knowledge_base(query, n_results=2)
-
         for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0]), 1):
             print(f"\nResult {i}:")
             print(f"   Source: {metadata['source']}")
             print(f"   File: {metadata['filename']}")
+            if 'chunk_index' in metadata:
+                print(f"   Chunk: {metadata['chunk_index'] + 1}/{metadata['chunk_count']} ({metadata.get('heading') or 'intro'})")
             print(f"   Preview: {doc[:200]}...")
             print()
 
     print("="*80)
+    print(f"Embedding cache: {get_embedding_cache_stats()}")
     print("Search is working! Your knowledge base is ready!")
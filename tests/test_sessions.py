@@ -0,0 +1,60 @@
+"""
+SQLite session backend: versioned saves shared by worker processes
+"""
+import time
+import pytest
+from backend.agents.sessions import SQLiteSessionBackend, SharedSessionStore, SessionConflict
+
+
+def turn(question, answer):
+    return [{'role': 'user', 'content': question}, {'role': 'assistant', 'content': answer}]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'sessions.sqlite3')
+
+
+def test_store_requires_the_version_read(path):
+    backend = SQLiteSessionBackend(path)
+    assert backend.store('s', turn('a', 'A'), 0) == 1
+    assert backend.store('s', turn('a', 'A') + turn('b', 'B'), 1) == 2
+
+    with pytest.raises(SessionConflict):
+        backend.store('s', turn('c', 'C'), 1)
+    with pytest.raises(SessionConflict):
+        backend.store('s', turn('c', 'C'), 0)
+    assert backend.load('s') == (turn('a', 'A') + turn('b', 'B'), 2)
+
+
+def test_expired_session_replaced(path):
+    backend = SQLiteSessionBackend(path, idle_ttl=0.01)
+    backend.store('s', turn('a', 'A'), 0)
+    time.sleep(0.05)
+    assert backend.store('s', turn('new', 'NEW'), 0) == 2
+    assert backend.load('s') == (turn('new', 'NEW'), 2)
+
+
+def test_concurrent_save_conflicts(path):
+    first = SharedSessionStore(SQLiteSessionBackend(path))
+    second = SharedSessionStore(SQLiteSessionBackend(path))
+
+    history = first.get('s')
+    history.extend(turn('a', 'A'))
+    first.save('s', history)
+
+    # Both workers start a turn from version 1
+    mine = first.get('s')
+    theirs = second.get('s')
+    assert theirs == turn('a', 'A')
+    mine.extend(turn('b', 'B'))
+    theirs.extend(turn('c', 'C'))
+
+    first.save('s', mine)
+    second.save('s', theirs)
+
+    assert second.stats()['conflicts'] == 1
+    assert first.stats()['conflicts'] == 0
+    # The losing worker drops its copy and reloads the saved history
+    assert 's' not in second
+    assert second.get('s') == turn('a', 'A') + turn('b', 'B')
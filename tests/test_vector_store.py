@@ -0,0 +1,29 @@
+"""
+NumPy vector store: exact and IVF search, and the empty store
+"""
+import numpy as np
+import pytest
+from backend.utils.vector_store import NumpyVectorStore
+
+
+@pytest.mark.parametrize('dimensions', [None, 32])
+def test_empty_store_returns_empty_results(tmp_path, dimensions):
+    store = NumpyVectorStore.build([], [], [], [], dimensions=dimensions)
+    store.save(str(tmp_path / 'store'))
+    loaded = NumpyVectorStore.load(str(tmp_path / 'store'))
+
+    for queries in ([[0.1] * 32], [[0.1] * 32] * 3):
+        results = loaded.query(queries, n_results=3)
+        assert results == {field: [[] for _ in queries] for field in ('ids', 'documents', 'metadatas', 'distances')}
+
+
+@pytest.mark.parametrize('ann_threshold', [10 ** 6, 1])
+def test_nearest_first(ann_threshold):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 16))
+    ids = [f"chunk-{i}" for i in range(50)]
+    store = NumpyVectorStore.build(ids, ids, [{}] * 50, vectors, ann_threshold=ann_threshold, nprobe=50)
+
+    results = store.query([vectors[7], vectors[21]], n_results=2)
+    assert [hits[0] for hits in results['ids']] == ['chunk-7', 'chunk-21']
+    assert results['distances'][0][0] == pytest.approx(0, abs=1e-3)